@@ -0,0 +1,279 @@
+"""Async load-testing tool for the chat service.
+
+Replays a prompt file (one prompt per line) against /chatstream (websocket) or
+/chat (HTTP POST) and reports latency percentiles, time to first token,
+tokens per second, error/capacity rejection rates and throughput.
+
+Closed loop (a fixed number of concurrent users):
+    python benchmark.py --concurrency 8
+Open loop (Poisson arrivals, e.g., 2 requests per second):
+    python benchmark.py --rate 2 --concurrency 64
+
+The results are written to a JSON file, which can be compared with a
+previous run:
+    python benchmark.py --compare bench_before.json bench_after.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+
+import httpx
+import websockets
+
+END_TOKEN = "[END]"
+# See nt_chat/app.py
+CAPACITY_MESSAGE = "Ο ψηφιακός βοηθός είναι στη μέγιστη χωρητικότητα"
+ERROR_MESSAGE = "Κάτι πήγε στραβά"
+
+
+def read_prompts(path):
+    with open(path, "r", encoding="utf-8") as prompt_file:
+        return [line.strip() for line in prompt_file if line.strip()]
+
+
+async def ws_request(base_url, prompt, timeout):
+    """Sends one prompt to /chatstream and times the streamed response"""
+    record = {"prompt": prompt, "status": "ok", "ttft": None, "tokens": 0}
+    start_time = time.perf_counter()
+    try:
+        async with websockets.connect(f"{base_url}/chatstream") as ws:
+            await ws.send(prompt)
+            while True:
+                part = await asyncio.wait_for(ws.recv(), timeout=timeout)
+                if part == END_TOKEN:
+                    break
+                if record["ttft"] is None:
+                    record["ttft"] = time.perf_counter() - start_time
+                if part.startswith(CAPACITY_MESSAGE):
+                    record["status"] = "capacity"
+                    break
+                if part.startswith(ERROR_MESSAGE):
+                    record["status"] = "error"
+                    break
+                record["tokens"] += 1
+    except asyncio.TimeoutError:
+        record["status"] = "timeout"
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["latency"] = time.perf_counter() - start_time
+    return record
+
+
+async def http_request(client, base_url, prompt, timeout):
+    """Sends one prompt to /chat; the answer is not streamed, so ttft=latency"""
+    record = {"prompt": prompt, "status": "ok", "tokens": None}
+    start_time = time.perf_counter()
+    try:
+        response = await client.post(
+            f"{base_url}/chat", json={"query": prompt}, timeout=timeout
+        )
+        if response.status_code == 503:
+            # see SQLExecutorBusy in nt_chat/app.py
+            record["status"] = "capacity"
+        elif response.status_code != 200:
+            record["status"] = "error"
+            record["error"] = response.text
+    except httpx.TimeoutException:
+        record["status"] = "timeout"
+    except httpx.HTTPError as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["latency"] = time.perf_counter() - start_time
+    record["ttft"] = record["latency"]
+    return record
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def summarize(records, duration):
+    """Aggregates the per-request records of the measured (non-warmup) requests"""
+    ok = [record for record in records if record["status"] == "ok"]
+    latencies = [record["latency"] for record in ok]
+    ttfts = [record["ttft"] for record in ok if record["ttft"] is not None]
+    tokens = [record["tokens"] for record in ok if record["tokens"] is not None]
+    summary = {
+        "requests": len(records),
+        "ok": len(ok),
+        "error_rate": sum(r["status"] in ("error", "timeout") for r in records)
+        / max(len(records), 1),
+        "capacity_rejection_rate": sum(r["status"] == "capacity" for r in records)
+        / max(len(records), 1),
+        "duration": duration,
+        "throughput": len(ok) / duration if duration else 0.0,
+    }
+    for name, values in (("latency", latencies), ("ttft", ttfts)):
+        summary[name] = {
+            "mean": statistics.fmean(values) if values else None,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+    if tokens:
+        # streaming rate of each answer, after the first token
+        rates = [
+            r["tokens"] / (r["latency"] - r["ttft"])
+            for r in ok
+            if r["tokens"] and r["latency"] > r["ttft"]
+        ]
+        summary["tokens_per_second"] = {
+            "per_request_p50": percentile(rates, 50),
+            "aggregate": sum(tokens) / duration if duration else 0.0,
+        }
+    return summary
+
+
+async def run_benchmark(args):
+    prompts = read_prompts(args.prompts)
+    num_requests = args.requests or len(prompts)
+    schedule = [prompts[i % len(prompts)] for i in range(args.warmup + num_requests)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    base_url = args.url.rstrip("/")
+    http_base_url = base_url.replace("ws://", "http://").replace("wss://", "https://")
+
+    async with httpx.AsyncClient() as client:
+
+        async def send(prompt):
+            async with semaphore:
+                if args.endpoint == "chat":
+                    return await http_request(
+                        client, http_base_url, prompt, args.timeout
+                    )
+                return await ws_request(base_url, prompt, args.timeout)
+
+        # The warmup requests are sent (and awaited) before the measured ones
+        for prompt in schedule[: args.warmup]:
+            await send(prompt)
+
+        start_time = time.perf_counter()
+        tasks = []
+        for prompt in schedule[args.warmup :]:
+            if args.rate:
+                # open loop: the arrivals don't wait for the previous responses
+                await asyncio.sleep(random.expovariate(args.rate))
+            tasks.append(asyncio.create_task(send(prompt)))
+        records = await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start_time
+
+    return {
+        "config": {
+            "url": args.url,
+            "endpoint": args.endpoint,
+            "prompts": args.prompts,
+            "requests": num_requests,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "warmup": args.warmup,
+        },
+        "summary": summarize(records, duration),
+        "requests": records,
+    }
+
+
+def print_summary(summary):
+    print(
+        f"{summary['ok']}/{summary['requests']} ok in {summary['duration']:.1f}s, "
+        f"throughput: {summary['throughput']:.2f} req/s, "
+        f"errors: {summary['error_rate']:.1%}, "
+        f"capacity rejections: {summary['capacity_rejection_rate']:.1%}"
+    )
+    for name in ("latency", "ttft"):
+        stats = summary[name]
+        if stats["p50"] is None:
+            continue
+        print(
+            f"{name:>8}: p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, "
+            f"p99 {stats['p99']:.2f}s"
+        )
+    if "tokens_per_second" in summary:
+        tps = summary["tokens_per_second"]
+        print(
+            f"  tokens: {tps['aggregate']:.1f}/s aggregate, "
+            f"{tps['per_request_p50'] or 0:.1f}/s per request (p50)"
+        )
+
+
+def compare(before_path, after_path):
+    """Prints the relative change of the main metrics between two runs"""
+    with open(before_path, "r", encoding="utf-8") as before_file:
+        before = json.load(before_file)["summary"]
+    with open(after_path, "r", encoding="utf-8") as after_file:
+        after = json.load(after_file)["summary"]
+    rows = [("throughput", before["throughput"], after["throughput"])]
+    for name in ("latency", "ttft"):
+        for pct in ("p50", "p95", "p99"):
+            rows.append((f"{name} {pct}", before[name][pct], after[name][pct]))
+    for name, old, new in rows:
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        print(f"{name:>12}: {old:8.3f} -> {new:8.3f} ({change:+.1%})")
+
+
+def parse_args():
+    """Parse CLI arguments"""
+    parser = argparse.ArgumentParser(
+        description="Async benchmark of the chat endpoints",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--url", default="ws://localhost:9500", help="Server URL")
+    parser.add_argument(
+        "--endpoint", choices=["chatstream", "chat"], default="chatstream"
+    )
+    parser.add_argument("--prompts", default="test_prompt_list", help="Prompt file")
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=0,
+        help="Number of measured requests (0: one per prompt); prompts are repeated",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Maximum concurrent requests"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.0,
+        help="Open-loop arrival rate (requests/s); 0 for a closed loop",
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=0, help="Requests to send before measuring"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=150, help="Per-request timeout (seconds)"
+    )
+    parser.add_argument(
+        "--output", default="bench_results.json", help="JSON file for the results"
+    )
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="Compare two result files instead of running a benchmark",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+
+    results = asyncio.run(run_benchmark(args))
+    print_summary(results["summary"])
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-# Check if the argument for JOBS is provided (first arg)
+# Check if the argument for JOBS (concurrent requests) is provided (first arg)
 if [ -z "$1" ]; then
     JOBS=8
 else
@@ -14,10 +14,11 @@ else
     INPUT_FILE=$2
 fi
 
-CHAT_WS_ENDPOINT=ws://localhost:9500/chatstream
+CHAT_WS_URL=ws://localhost:9500
 
-parallel \
-  --joblog "stats_benchmark${JOBS}.log" \
-  --progress \
-  --jobs ${JOBS} \
-  "python testws.py --url ${CHAT_WS_ENDPOINT} --prompt {}" < "${INPUT_FILE}"
+python benchmark.py \
+  --url ${CHAT_WS_URL} \
+  --endpoint chatstream \
+  --concurrency ${JOBS} \
+  --prompts "${INPUT_FILE}" \
+  --output "stats_benchmark${JOBS}.json"
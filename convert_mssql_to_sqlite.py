@@ -4,8 +4,45 @@ import re
 import shutil
 import sqlite3
 import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from db_delta import apply_delta, write_manifest
 
 DEBUG = False
+# Rows per executemany call
+BATCH_SIZE = 5000
+# Lines of the dump per chunk that a worker process parses
+CHUNK_SIZE = 20000
+# INSERT [dbo].[table] ([column1], [column2]) VALUES (
+INSERT_RE = re.compile(
+    r"INSERT\s+.*?\[dbo\]\.\[([^\]]+)\]\s*\(([^)]*)\).*?VALUES\s*\("
+)
+# One SQL Server literal, followed by the comma or the closing parenthesis:
+# N'...' or '...' ('' is an escaped quote), NULL, numbers (0x... too) and
+# CAST(<literal> AS <type>), e.g., CAST(N'2023-03-15T12:48:59.843' AS DateTime).
+# The name of the matched group (lastgroup) is the type of the literal
+_STRING = r"N?'(?:[^']|'')*'"
+_HEX = r"[-+]?0x[0-9A-Fa-f]+"
+_FLOAT = r"[-+]?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][-+]?\d+)?"
+_INTEGER = r"[-+]?\d+"
+LITERAL_RE = re.compile(
+    rf"""\s*(?:
+        (?P<string>{_STRING})
+        | (?P<null>NULL)
+        | CAST\(\s*(?:
+            (?P<cast_string>{_STRING}) | (?P<cast_hex>{_HEX})
+            | (?P<cast_float>{_FLOAT}) | (?P<cast_integer>{_INTEGER})
+          )\s+AS\s+\w+(?:\s*\([^)]*\))?\s*\)
+        | (?P<hex>{_HEX})
+        | (?P<float>{_FLOAT})
+        | (?P<integer>{_INTEGER})
+    )\s*[,)]""",
+    re.VERBOSE | re.IGNORECASE,
+)
+
 # This dict contains table names that we won't be using in the minimal DB schema
 tables_to_ignore = {
     "actorsCostumes",
@@ -94,72 +131,129 @@ tables_to_ignore = {
 }
 
 
-def replace_unicode_strings(input_string):
-    """There are some unicode strings in the db; replace them to insert them correctly in SQLite"""
-    # Remove the 'N' prefix from all Unicode strings
-    result_string = re.sub(r"N'([^']*)'", r"'\1'", input_string)
+def _string_value(literal):
+    return literal[literal.index("'") + 1 : -1].replace("''", "'")
 
-    return result_string
 
-
-def replace_cast_string(input_string):
-    """Matches CAST dates from MS SQL and converts them to a string"""
-    pattern = r"CAST\(N'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+)' AS DateTime\)"
-    result_string = re.sub(pattern, r"'\1'", input_string)
-    return result_string
+_LITERAL_VALUES = {
+    "string": _string_value,
+    "null": lambda _: None,
+    "hex": lambda literal: int(literal, 16),
+    "float": float,
+    "integer": int,
+}
 
 
-def extract_insert_statements(sql_script):
-    """Function to extract INSERT statements from SQL Server script"""
-    sql_script = replace_cast_string(sql_script)
-    sql_script = replace_unicode_strings(sql_script)
+def parse_values(statement, start=0):
+    """Tokenizes the SQL Server literals of VALUES (...) into a tuple of Python
+    values (str, int, float or None); start is the position after "VALUES (".
+    Raises ValueError if a value is not a literal"""
+    values = []
+    position = start
+    while True:
+        match = LITERAL_RE.match(statement, position)
+        if match is None:
+            raise ValueError(f"Unexpected value: {statement[position:position + 80]}")
+        kind = match.lastgroup
+        literal_type = kind[5:] if kind.startswith("cast_") else kind
+        values.append(_LITERAL_VALUES[literal_type](match[kind]))
+        position = match.end()
+        if statement[position - 1] == ")":
+            return tuple(values)
+
+
+def join_statement_lines(lines):
+    """Yields the statements of the script one at a time, each in one line:
+    the lines that don't start with INSERT or GO continue the previous
+    statement (the strings of the dump may contain line breaks), so they are
+    appended to it with a space instead of the line break, e.g.,
+    VALUES (157, N'Μέρη από το έργο.
+    Τρακ 1: ...', 0, NULL)
+    becomes VALUES (157, N'Μέρη από το έργο. Τρακ 1: ...', 0, NULL)"""
+    statement = []
+    for line in lines:
+        line = line.rstrip("\n")
+        if not statement:
+            statement.append(line)
+        elif line.startswith("INSERT") or line.startswith("GO"):
+            yield " ".join(statement)
+            statement = [line]
+        else:
+            statement.append(line.strip())
+    if statement:
+        yield " ".join(statement)
+
+
+def parse_insert_statement(statement, ignore_tables=()):
+    """The (table name, columns, values) of an INSERT statement, or None if it
+    isn't one or its table is ignored; values is a tuple of Python values, or
+    None if they could not be parsed"""
     # also remove random Greek question marks
-    sql_script = sql_script.replace(" (;)", "")
-    pattern = re.compile(
-        "INSERT\s+.*?\[dbo\]\.\[([^\]]+)\]\s*\(([^)]*)\).*?VALUES\s\((.*)\)"
-    )
-    return re.findall(pattern, sql_script)
-
-
-def correct_newlines(sql_script):
-    """This function corrects the extra newlines to have each INSERT statement in one line.
-    For instance:
-    INSERT [dbo].[sounds] ([soundID], [playID], [workIDstr], [repeatStr], [soundRank], [soundFile],
-    [soundDate], [soundPerson], [soundType], [soundTime], [soundCaption], [soundNotes],
-    [soundDescription], [soundReviewedFlag], [modified], [created], [published],
-    [soundTypeID], [cmsCreatorID])
-    VALUES (157, 406, N'6097', N'1032', 1, N'0146-01', N'', N'', N'Πρόβα', N'', N'',
-    N'#***# Δεν είναι σίγουρο με ποια παράσταση πρέπει να συνδεθεί. Μου φαίνεται λογικό να το
-    συνδέσωμε την πρώτη από αυτή τη σειρά παραστάσεων.', N'Μέρη από το έργο.
-
-    Τρακ 1: Φαίνεται ότι είναι από πρόβα γιατί ακούγονται οδηγίες στην αρχή.
-    1) Ορέστης -Κλυταιμνήστρα (652 - 709), 2), 3) 722 - 1065 (τέλος;).
-    Τρακ 2: Από την αρχή μέχρι στ.590 (αρχή πρώτου στάσιμου). Αποσπάσματα', 0, NULL,
-    CAST(N'2023-03-15T12:48:59.843' AS DateTime), 1, 8, NULL)
-
-    becomes:
-
-    INSERT [dbo].[sounds] ([soundID], [playID], [workIDstr], [repeatStr], [soundRank], [soundFile],
-    [soundDate], [soundPerson], [soundType], [soundTime], [soundCaption], [soundNotes],
-    [soundDescription], [soundReviewedFlag], [modified], [created], [published],
-    [soundTypeID], [cmsCreatorID])
-    VALUES (157, 406, N'6097', N'1032', 1, N'0146-01', N'', N'', N'Πρόβα', N'', N'',
-    N'#***# Δεν είναι σίγουρο με ποια παράσταση πρέπει να συνδεθεί. Μου φαίνεται λογικό να το
-    συνδέσω με την πρώτη από αυτή τη σειρά παραστάσεων.', N'Μέρη από το έργο.  Τρακ 1: Φαίνεται ότι
-    είναι από πρόβα γιατί ακούγονται οδηγίες στην αρχή. 1) Ορέστης -Κλυταιμνήστρα (652 - 709), 2),
-    3) 722 - 1065 (τέλος;). Τρακ 2: Από την αρχή μέχρι στ.590 (αρχή πρώτου στάσιμου). Αποσπάσματα',
-    0, NULL, CAST(N'2023-03-15T12:48:59.843' AS DateTime), 1, 8, NULL)
-    """
-    lines = sql_script.split("\n")
-    processed_lines = []
-
-    for i, line in enumerate(lines):
-        # If line starts with 'INSERT' or 'GO', or it's the first line, keep it as is
-        if line.startswith("INSERT") or line.startswith("GO") or i == 0:
-            processed_lines.append(line)
-        else:  # Otherwise, remove the line break
-            processed_lines[-1] += " " + line.strip()
-    return "\n".join(processed_lines)
+    statement = statement.replace(" (;)", "")
+    match = INSERT_RE.search(statement)
+    if match is None:
+        return None
+    table_name, columns = match.groups()
+    if table_name in ignore_tables:
+        return None
+    try:
+        values = parse_values(statement, match.end())
+    except ValueError as e:
+        print(f"{table_name}: {e}")
+        values = None
+    return table_name, columns, values
+
+
+def parse_lines(lines, ignore_tables=()):
+    """Parses a chunk of lines of the dump (see read_line_chunks); it runs in
+    the worker processes, so it returns a list"""
+    parsed_statements = []
+    for statement in join_statement_lines(lines):
+        parsed = parse_insert_statement(statement, ignore_tables)
+        if parsed is not None:
+            parsed_statements.append(parsed)
+    return parsed_statements
+
+
+def read_line_chunks(sql_file, chunk_size=CHUNK_SIZE):
+    """Yields lists of about chunk_size lines of the script; a chunk only ends
+    before a line that starts with INSERT or GO, so that no statement is split
+    between two chunks"""
+    chunk = []
+    for line in sql_file:
+        if len(chunk) >= chunk_size and (
+            line.startswith("INSERT") or line.startswith("GO")
+        ):
+            yield chunk
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield chunk
+
+
+def read_insert_statements(sql_file, ignore_tables=(), workers=1):
+    """Yields the (table name, columns, values) of the INSERT statements of an
+    open SQL Server script, in the order of the script (see
+    parse_insert_statement). The file is decoded and read line by line and
+    each statement is parsed as soon as it is complete, so the memory does not
+    grow with the size of the dump. The values of ignore_tables aren't parsed.
+
+    With more than one worker, the chunks of the script are parsed in a pool
+    of processes; at most two chunks per worker are read ahead"""
+    if workers <= 1:
+        for statement in join_statement_lines(sql_file):
+            parsed = parse_insert_statement(statement, ignore_tables)
+            if parsed is not None:
+                yield parsed
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in read_line_chunks(sql_file):
+            pending.append(executor.submit(parse_lines, chunk, ignore_tables))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
 
 
 def create_sqlite_tables(sqlite_db_name):
@@ -653,72 +747,191 @@ def parse_arguments():
     parser.add_argument(
         "--encoding", default="utf-16-le", help="Encoding of the SQL Server dump file"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes that parse the dump; 1 parses it in this process",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Convert the dump serially and with --workers processes (in temporary "
+        "databases) and report the speedup",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Only apply the inserted, updated and deleted rows to an existing SQLite "
+        "database and write them to <sqlite-db>.delta.json",
+    )
 
     return parser.parse_args()
 
 
-def insert_db_entries(sqlite_db_name, sql_server_db, encoding):
-    """Reads the SQL Server script from a file and
-    updates the sqlite db"""
-    with open(sql_server_db, "r", encoding=encoding) as sql_file:
-        sql_script = sql_file.read()
+def insert_rows(cursor, table_name, columns, rows):
+    """Inserts a batch of rows with one executemany call; if a row fails, the
+    batch is rolled back and inserted row by row. Returns the number of errors
+    (OverflowError: an integer literal that doesn't fit in 64 bits)"""
+    placeholders = ", ".join("?" * len(rows[0]))
+    insert_sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+    cursor.execute("SAVEPOINT batch")
+    try:
+        cursor.executemany(insert_sql, rows)
+        cursor.execute("RELEASE batch")
+        return 0
+    except (sqlite3.Error, OverflowError):
+        cursor.execute("ROLLBACK TO batch")
+        cursor.execute("RELEASE batch")
+    num_errors = 0
+    for row in rows:
+        try:
+            cursor.execute(insert_sql, row)
+        except (sqlite3.Error, OverflowError) as e:
+            print(e, insert_sql, row)
+            num_errors += 1
+    return num_errors
 
-    # Fix erroneous new lines; all statements should be one-liners
-    sql_script = correct_newlines(sql_script)
-    # Extract only the INSERT statements from the SQL Server script
-    insert_statements = extract_insert_statements(sql_script)
-    if not insert_statements:
-        sys.exit("No SQL insertions found")
 
+def insert_db_entries(sqlite_db_name, sql_server_db, encoding, workers=1):
+    """Reads the SQL Server script from a file and
+    updates the sqlite db. The statements may be parsed by several worker
+    processes, but this process is the only writer and inserts the rows of
+    each table in the order of the script"""
+    # Connect to the SQLite database; the database is created from scratch,
+    # so no fsync, and the rollback journal is only needed for the savepoints
+    conn = sqlite3.connect(sqlite_db_name, isolation_level=None)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode = MEMORY")
+    cursor.execute("PRAGMA synchronous = OFF")
+    cursor.execute("BEGIN")
+    start_time = time.perf_counter()
+    # (table, columns) -> rows waiting for the next executemany
+    batches = defaultdict(list)
+    num_rows = defaultdict(int)
+    num_errors = defaultdict(int)
+    seconds = defaultdict(float)
+    debug_file = None
     if DEBUG:
-        print("Saving a list of all regex matches to 'insert.txt'")
-        with open("insert.txt", "w", encoding="utf-8") as reader:
-            for item in insert_statements:
-                reader.write(", ".join(map(str, item)) + "\n")
+        print("Saving a list of all parsed statements to 'insert.txt'")
+        debug_file = open("insert.txt", "w", encoding="utf-8")
 
-    # Connect to the SQLite database
-    conn = sqlite3.connect(sqlite_db_name)
-    cursor = conn.cursor()
-    num_errors = 0
-    # Iterate through INSERT statements and insert data into SQLite
-    for table_name, columns, values in insert_statements:
-        # Check if the table should be ignored
-        if table_name in tables_to_ignore:
-            continue
-        # Construct the INSERT SQL statement for SQLite
-        insert_sql = f"INSERT INTO {table_name} ({columns}) VALUES ({values});"
-        try:
-            # Execute the INSERT statement
-            cursor.execute(insert_sql)
-        except sqlite3.OperationalError as e:
-            print(e, insert_sql)
-            num_errors += 1
-            continue
+    def flush(table_name, columns):
+        rows = batches.pop((table_name, columns))
+        batch_start_time = time.perf_counter()
+        num_errors[table_name] += insert_rows(cursor, table_name, columns, rows)
+        seconds[table_name] += time.perf_counter() - batch_start_time
 
+    # Fix erroneous new lines (all statements should be one-liners) and extract
+    # only the INSERT statements from the SQL Server script, while reading it
+    with open(sql_server_db, "r", encoding=encoding) as sql_file:
+        for table_name, columns, values in read_insert_statements(
+            sql_file, ignore_tables=tables_to_ignore, workers=workers
+        ):
+            num_rows[table_name] += 1
+            if debug_file:
+                debug_file.write(f"{table_name}, {columns}, {values}\n")
+            if values is None:
+                num_errors[table_name] += 1
+                continue
+            batch = batches[table_name, columns]
+            batch.append(values)
+            if len(batch) >= BATCH_SIZE:
+                flush(table_name, columns)
+    for table_name, columns in list(batches):
+        flush(table_name, columns)
+
+    if debug_file:
+        debug_file.close()
     # Commit changes and close the SQLite database
     conn.commit()
     conn.close()
+    if not num_rows:
+        sys.exit("No SQL insertions found")
 
+    for table_name in sorted(num_rows):
+        rows_per_second = num_rows[table_name] / max(seconds[table_name], 1e-6)
+        print(
+            f"{table_name:<20} {num_rows[table_name]:>9} rows "
+            f"{num_errors[table_name]:>6} errors {rows_per_second:>12,.0f} rows/s"
+        )
     print(
         f"Data from SQL Server script ({sql_server_db}) inserted into SQLite database "
-        f"({sqlite_db_name})."
+        f"({sqlite_db_name}) in {time.perf_counter() - start_time:.2f} s."
+    )
+    total_errors = sum(num_errors.values())
+    if total_errors:
+        print(f"Num errors: {total_errors}/{sum(num_rows.values())}.")
+
+
+def benchmark(sql_server_db, encoding, workers):
+    """Converts the dump with the serial and the parallel parser into temporary
+    databases and reports the speedup; the databases must have the same rows"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_workers in (1, workers):
+            sqlite_db_name = os.path.join(tmp_dir, f"converted_{num_workers}.sqlite")
+            print(f"Converting with {num_workers} worker(s)")
+            create_sqlite_tables(sqlite_db_name=sqlite_db_name)
+            start_time = time.perf_counter()
+            insert_db_entries(sqlite_db_name, sql_server_db, encoding, num_workers)
+            seconds = time.perf_counter() - start_time
+            conn = sqlite3.connect(sqlite_db_name)
+            tables = [
+                name
+                for (name,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' "
+                    "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+                )
+            ]
+            rows = {
+                table: conn.execute(f"SELECT * FROM {table}").fetchall()
+                for table in tables
+            }
+            conn.close()
+            results[num_workers] = seconds, rows
+    serial_seconds, serial_rows = results[1]
+    parallel_seconds, parallel_rows = results[workers]
+    print(
+        f"serial: {serial_seconds:.2f} s, {workers} workers: {parallel_seconds:.2f} s, "
+        f"speedup: {serial_seconds / parallel_seconds:.2f}x"
     )
-    if num_errors:
-        print(f"Num errors: {num_errors}/{len(insert_statements)}.")
+    if serial_rows != parallel_rows:
+        sys.exit("The serial and the parallel conversions have different rows")
 
 
 if __name__ == "__main__":
     args = parse_arguments()
 
-    if os.path.exists(args.sqlite_db):
-        # if the minimal db already exists, create a backup file and delete it
-        shutil.copyfile(args.sqlite_db, f"{args.sqlite_db}.BK")
-        os.remove(args.sqlite_db)
+    if args.benchmark:
+        benchmark(args.sql_server_dump, args.encoding, args.workers)
+        sys.exit()
+
+    delta = args.delta and os.path.exists(args.sqlite_db)
+    # in delta mode, the dump is converted next to the existing database, whose
+    # rows are then updated in place (in one transaction, so no backup)
+    sqlite_db_name = f"{args.sqlite_db}.new" if delta else args.sqlite_db
+    if os.path.exists(sqlite_db_name):
+        # if the db already exists, create a backup file and delete it
+        if not delta:
+            shutil.copyfile(sqlite_db_name, f"{sqlite_db_name}.BK")
+        os.remove(sqlite_db_name)
 
     print("Starting the conversion process")
-    create_sqlite_tables(sqlite_db_name=args.sqlite_db)
+    create_sqlite_tables(sqlite_db_name=sqlite_db_name)
     insert_db_entries(
-        sqlite_db_name=args.sqlite_db,
+        sqlite_db_name=sqlite_db_name,
         sql_server_db=args.sql_server_dump,
         encoding=args.encoding,
-    )
+        workers=args.workers,
+    )
+    if delta:
+        print(f"Applying the changes to {args.sqlite_db}")
+        changes = apply_delta(args.sqlite_db, sqlite_db_name)
+        write_manifest(
+            f"{args.sqlite_db}.delta.json",
+            args.sqlite_db,
+            args.sql_server_dump,
+            changes,
+        )
+        os.remove(sqlite_db_name)
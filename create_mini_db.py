@@ -1,10 +1,81 @@
 import argparse
+import json
 import os
 import re
 import shutil
 import sqlite3
+import time
 from collections import defaultdict
 
+from db_delta import apply_delta, write_manifest
+from nt_chat.cache import normalize_query
+from nt_chat.prompts import DEFAULT_TEMPLATE
+from nt_chat.sql_executor import register_functions
+
+# Table -> text column; create_normalized_columns adds <column>Normalized with
+# nt_normalize(column) (casefolded, without accents, ς -> σ) and an index on it
+NORMALIZED_COLUMNS = {
+    "plays": "playTitle",
+    "works": "workTitle",
+    "people": "personName",
+}
+
+# play_summary: one row per play with its director, works and authors, so that
+# most questions need no joins; the lists are separated by " # " (like venue)
+PLAY_SUMMARY_SEPARATOR = " # "
+PLAY_SUMMARY_MEDIA_COLUMNS = (
+    "photosURL",
+    "videosURL",
+    "soundsURL",
+    "postersURL",
+    "programsURL",
+    "costumesURL",
+    "musicSheetsURL",
+    "publicationsURL",
+)
+PLAY_SUMMARY_INDEXES = {
+    "idx_play_summary_yearEnded": "yearEnded DESC",
+    "idx_play_summary_directorID": "directorID, yearEnded DESC",
+    "idx_play_summary_playTitleNormalized": "playTitleNormalized",
+    "idx_play_summary_directorNameNormalized": "directorNameNormalized",
+}
+
+# plays media column -> (table of the original DB, playID column, URL fragment)
+MEDIA_TABLES = {
+    "photosURL": ("photos", "playID", "photos"),
+    "videosURL": ("videos", "playID", "videos"),
+    "programsURL": ("playPrograms", "playID", "programs"),
+    "publicationsURL": ("publications", "playID", "publications"),
+    "costumesURL": ("costumesPlays", "playID", "costumes"),
+    "postersURL": ("postersPlays", "playID", "posters"),
+    # hasMusicSheet: δεν έχει playID?
+    "musicSheetsURL": ("musicScores", "musicID", "music"),
+    "soundsURL": ("sounds", "playID", "sounds"),
+}
+
+# Secondary indexes for the joins and the ordering that the prompt asks for
+# (people -> actors/authors -> plays/works, directorID, yearEnded DESC). The
+# other columns make the join lookups covering (no access to the table row);
+# protagonist before personID, so "actors.protagonist = 1" is an index search
+SECONDARY_INDEXES = {
+    "idx_actors_personID": ("actors", "personID, playID, protagonist"),
+    "idx_actors_playID": ("actors", "playID, protagonist, personID"),
+    "idx_authors_personID": ("authors", "personID, workID"),
+    "idx_authors_workID": ("authors", "workID, personID"),
+    "idx_playworks_workID": ("playworks", "workID, playID"),
+    "idx_plays_directorID": ("plays", "directorID, yearEnded DESC"),
+    "idx_plays_yearEnded": ("plays", "yearEnded DESC"),
+}
+
+# Full-text index -> (table, ID column, text column). The indexes contain the
+# normalized text (nt_normalize: casefolded, without accents, ς -> σ), which
+# the unicode61 tokenizer can't do for Greek, with prefix indexes for "σαιξ*"
+FULL_TEXT_INDEXES = {
+    "plays_fts": ("plays", "playID", "playTitle"),
+    "works_fts": ("works", "workID", "workTitle"),
+    "people_fts": ("people", "personID", "personName"),
+}
+
 
 def rearrange_based_on_comma(name_str):
     """Convert Χατζηγεωργίου, Γιώργος to Γιώργος Χατζηγεωργίου"""
@@ -31,27 +102,28 @@ def format_name(name, person):
     return rearranged_name
 
 
-def has_entries_in_table(cursor, table_name, foreign_key_column, foreign_key_value):
-    """Checks if the specified table has entries with the given foreign key value"""
-    get_only_published = (
-        "AND published == 1"
-        if table_name
-        not in [
-            "contributors",
-            "authors",
-            "actors",
-            "costumesPlays",
-            "playWorks",
-            "playPrograms",
-            "postersPlays",
-        ]
-        else ""
-    )
+def only_published(table_name):
+    """Whether the table has a published column to filter on"""
+    return table_name not in [
+        "contributors",
+        "authors",
+        "actors",
+        "costumesPlays",
+        "playWorks",
+        "playPrograms",
+        "postersPlays",
+    ]
+
+
+def foreign_keys_in_table(cursor, table_name, foreign_key_column):
+    """The foreign key values that have entries in the specified table: one query
+    per table instead of one query per value (the original database has no
+    indexes, so each of those scans the table)"""
+    get_only_published = "WHERE published == 1" if only_published(table_name) else ""
     cursor.execute(
-        f"SELECT 1 FROM {table_name} WHERE {foreign_key_column} = ? {get_only_published}",
-        (foreign_key_value,),
+        f"SELECT DISTINCT {foreign_key_column} FROM {table_name} {get_only_published}"
     )
-    return cursor.fetchone() is not None
+    return {row[0] for row in cursor}
 
 
 def convert_article_format(input_str):
@@ -209,8 +281,313 @@ def create_minidb_schema(cursor_mini):
     )
 
 
-def create_mini_database(original_db_name, minimal_db_name, base_url):
-    """Main script that creates a minimal db from the full SQL schema"""
+def create_normalized_columns(conn_mini):
+    """Shadow columns with the normalized titles and names, so that the queries
+    match them without a unicode extension, e.g.,
+    WHERE people.personNameNormalized LIKE '%' || nt_normalize('Σαίξπηρ') || '%'
+    The columns are COLLATE NOCASE so that prefix LIKE patterns with a literal
+    text (LIKE 'σαιξ%') search the index; the other patterns scan it"""
+    register_functions(conn_mini)
+    for table_name, text_column in NORMALIZED_COLUMNS.items():
+        normalized_column = f"{text_column}Normalized"
+        columns = [
+            row[1] for row in conn_mini.execute(f"PRAGMA table_info({table_name})")
+        ]
+        if normalized_column not in columns:
+            conn_mini.execute(
+                f"ALTER TABLE {table_name} "
+                f"ADD COLUMN {normalized_column} TEXT COLLATE NOCASE NULL"
+            )
+        conn_mini.execute(
+            f"UPDATE {table_name} SET {normalized_column} = nt_normalize({text_column})"
+        )
+        conn_mini.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table_name}_{normalized_column} "
+            f"ON {table_name} ({normalized_column})"
+        )
+    conn_mini.commit()
+
+
+def create_play_summary(conn_mini):
+    """The play_summary table (from the tables of the minimal DB), e.g.,
+    SELECT playTitle, yearStarted, playURL FROM play_summary
+    WHERE authorNamesNormalized LIKE '%' || nt_normalize('Σαίξπηρ') || '%'"""
+    register_functions(conn_mini)
+    media_columns = ", ".join(PLAY_SUMMARY_MEDIA_COLUMNS)
+    conn_mini.execute("DROP TABLE IF EXISTS play_summary")
+    conn_mini.execute(
+        f"""
+        CREATE TABLE play_summary (
+            playID INTEGER PRIMARY KEY,
+            playTitle TEXT NOT NULL,
+            playTitleNormalized TEXT COLLATE NOCASE,
+            playURL TEXT,
+            venue TEXT NULL,
+            venueCountry TEXT NULL,
+            yearStarted INTEGER,
+            yearEnded INTEGER,
+            directorID INTEGER NULL,
+            directorName TEXT NULL,
+            directorNameNormalized TEXT COLLATE NOCASE NULL,
+            directorURL TEXT NULL,
+            workTitles TEXT NULL,
+            workTitlesNormalized TEXT NULL,
+            authorNames TEXT NULL,
+            authorNamesNormalized TEXT NULL,
+            hasMedia INTEGER NOT NULL,
+            {" TEXT NULL, ".join(PLAY_SUMMARY_MEDIA_COLUMNS)} TEXT NULL
+        )
+        """
+    )
+    separator = PLAY_SUMMARY_SEPARATOR
+    conn_mini.execute(
+        f"""
+        INSERT INTO play_summary
+        SELECT
+            plays.playID, plays.playTitle, nt_normalize(plays.playTitle),
+            plays.playURL, plays.venue, plays.venueCountry,
+            plays.yearStarted, plays.yearEnded, plays.directorID,
+            director.personName, nt_normalize(director.personName),
+            director.personURL,
+            summary.workTitles, nt_normalize(summary.workTitles),
+            summary.authorNames, nt_normalize(summary.authorNames),
+            coalesce({" OR ".join(f"{c} != ''" for c in PLAY_SUMMARY_MEDIA_COLUMNS)}, 0),
+            {media_columns}
+        FROM plays
+        LEFT JOIN people AS director ON director.personID = plays.directorID
+        LEFT JOIN (
+            SELECT
+                playworks.playID,
+                (
+                    SELECT group_concat(workTitle, '{separator}') FROM (
+                        SELECT works.workTitle FROM playworks AS pw
+                        JOIN works ON works.workID = pw.workID
+                        WHERE pw.playID = playworks.playID
+                        GROUP BY works.workTitle ORDER BY min(works.workID)
+                    )
+                ) AS workTitles,
+                (
+                    SELECT group_concat(personName, '{separator}') FROM (
+                        SELECT people.personName FROM playworks AS pw
+                        JOIN authors ON authors.workID = pw.workID
+                        JOIN people ON people.personID = authors.personID
+                        WHERE pw.playID = playworks.playID
+                        GROUP BY people.personName ORDER BY min(authors.authorID)
+                    )
+                ) AS authorNames
+            FROM playworks
+            GROUP BY playworks.playID
+        ) AS summary ON summary.playID = plays.playID
+        """
+    )
+    for index_name, columns in PLAY_SUMMARY_INDEXES.items():
+        conn_mini.execute(f"CREATE INDEX {index_name} ON play_summary ({columns})")
+    conn_mini.commit()
+
+
+def create_full_text_indexes(conn_mini):
+    """FTS5 indexes of the titles and names, e.g.,
+    SELECT rowid FROM people_fts WHERE people_fts = nt_normalize('Σαίξπηρ') || '*'
+    (the rowid is the ID of the indexed table)"""
+    register_functions(conn_mini)
+    for index_name, (table_name, id_column, text_column) in FULL_TEXT_INDEXES.items():
+        conn_mini.execute(f"DROP TABLE IF EXISTS {index_name}")
+        # contentless: only the rowids are returned, the text is in table_name
+        conn_mini.execute(
+            f"""
+            CREATE VIRTUAL TABLE {index_name} USING fts5(
+                {text_column},
+                content='',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3 4'
+            )
+            """
+        )
+        conn_mini.execute(
+            f"""
+            INSERT INTO {index_name} (rowid, {text_column})
+            SELECT {id_column}, nt_normalize({text_column}) FROM {table_name}
+            WHERE {text_column} IS NOT NULL
+            """
+        )
+        conn_mini.execute(f"INSERT INTO {index_name} ({index_name}) VALUES ('optimize')")
+    conn_mini.commit()
+
+
+def create_secondary_indexes(conn_mini):
+    """Indexes of the foreign keys and of the ordering (play_summary uses them)"""
+    for index_name, (table_name, columns) in SECONDARY_INDEXES.items():
+        conn_mini.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})"
+        )
+    conn_mini.commit()
+
+
+def analyze(conn_mini):
+    """The statistics that the query planner uses to choose between the indexes"""
+    conn_mini.execute("ANALYZE")
+    conn_mini.execute("PRAGMA optimize")
+    conn_mini.commit()
+
+
+def canonical_queries(canned_sql_path="nt_chat/fake_llm_sql.json", top_k=10):
+    """The example queries of the prompt and the recorded SQL of the test
+    prompts (the canned SQL of the fake LLM)"""
+    queries = [
+        query.format(top_k=top_k)
+        for query in re.findall(r"^SELECT .*?;$", DEFAULT_TEMPLATE, re.M | re.S)
+    ]
+    if os.path.exists(canned_sql_path):
+        with open(canned_sql_path, "r", encoding="utf-8") as f:
+            queries.extend(entry["sql"] for entry in json.load(f).values())
+    return list(dict.fromkeys(queries))
+
+
+def explain_query_plans(conn_mini, queries):
+    """Prints the EXPLAIN QUERY PLAN of each query; SCAN without an index
+    (other than the driving table of the query) is worth a look"""
+    register_functions(conn_mini)
+    for query in queries:
+        print(" ".join(query.split()))
+        plan = conn_mini.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+        depths = {0: 0}
+        for node_id, parent_id, _, detail in plan:
+            depths[node_id] = depths.get(parent_id, 0) + 1
+            print(f"{'  ' * depths[node_id]}{detail}")
+        print()
+
+
+def search_terms(prompt_files, min_length=4):
+    """Normalized words of the prompts that may be (part of) a title or a name"""
+    terms = []
+    for prompt_file in prompt_files:
+        with open(prompt_file, "r", encoding="utf-8") as f:
+            for line in f:
+                terms.extend(
+                    word
+                    for word in normalize_query(line).split()
+                    if len(word) >= min_length and not word.isdigit()
+                )
+    return list(dict.fromkeys(terms))
+
+
+def benchmark_full_text_search(minimal_db_name, prompt_files, repeat=3):
+    """LIKE '%term%' (with and without normalization) vs the full-text
+    indexes for the words of the prompts"""
+    conn_mini = sqlite3.connect(minimal_db_name)
+    register_functions(conn_mini)
+    terms = search_terms(prompt_files)
+    print(f"{len(terms)} search terms from {', '.join(prompt_files)}")
+    existing_tables = {
+        row[0]
+        for row in conn_mini.execute("SELECT name FROM sqlite_master")
+    }
+    for index_name, (table_name, _, text_column) in FULL_TEXT_INDEXES.items():
+        queries = {
+            "LIKE": (
+                f"SELECT count(*) FROM {table_name} WHERE {text_column} LIKE ?",
+                "%{}%",
+            ),
+            "nt_normalize LIKE": (
+                f"SELECT count(*) FROM {table_name} "
+                f"WHERE nt_normalize({text_column}) LIKE ?",
+                "%{}%",
+            ),
+            "normalized column LIKE": (
+                f"SELECT count(*) FROM {table_name} "
+                f"WHERE {text_column}Normalized LIKE ?",
+                "%{}%",
+            ),
+            "normalized column prefix": (
+                f"SELECT count(*) FROM {table_name} "
+                f"WHERE {text_column}Normalized LIKE ?",
+                "{}%",
+            ),
+            "FTS5": (
+                f"SELECT count(*) FROM {index_name} WHERE {index_name} = ?",
+                "{}*",
+            ),
+        }
+        if index_name not in existing_tables:
+            # built with --full-text-indexes only
+            del queries["FTS5"]
+        for name, (query, pattern) in queries.items():
+            hits = 0
+            start_time = time.perf_counter()
+            for _ in range(repeat):
+                hits = sum(
+                    conn_mini.execute(query, (pattern.format(term),)).fetchone()[0]
+                    for term in terms
+                )
+            milliseconds = (time.perf_counter() - start_time) * 1000 / repeat
+            column = f"{table_name}.{text_column}"
+            print(
+                f"{column:<18} {name:>24}: {milliseconds:8.1f} ms "
+                f"({milliseconds / max(len(terms), 1):.3f} ms/query, {hits} hits)"
+            )
+    conn_mini.close()
+
+
+def canonical_person_ids(pairs):
+    """Union-find of the (personID, relPersonID) pairs of personToPerson: maps
+    every duplicated personID to the lowest personID of its cluster (chains
+    such as A -> B -> C included, in any order of the pairs) in near-linear
+    time. The people that are not in the result are their own canonical ID"""
+    parents = {}
+
+    def find(person_id):
+        root = person_id
+        while parents[root] != root:
+            root = parents[root]
+        # path compression: the next finds of the cluster take one step
+        while parents[person_id] != root:
+            parents[person_id], person_id = root, parents[person_id]
+        return root
+
+    for person_id, rel_person_id in pairs:
+        if person_id is None or rel_person_id is None:
+            continue
+        parents.setdefault(person_id, person_id)
+        parents.setdefault(rel_person_id, rel_person_id)
+        root, rel_root = find(person_id), find(rel_person_id)
+        # the root of a cluster is its lowest personID
+        parents[max(root, rel_root)] = min(root, rel_root)
+
+    canonical_ids = {}
+    cluster_sizes = defaultdict(int)
+    for person_id in parents:
+        root = find(person_id)
+        cluster_sizes[root] += 1
+        if root != person_id:
+            canonical_ids[person_id] = root
+    # e.g., (7, 7) pairs are not duplicates
+    cluster_sizes = [size for size in cluster_sizes.values() if size > 1]
+    print(
+        f"Duplicated people: {sum(cluster_sizes)} people in {len(cluster_sizes)} "
+        f"clusters, {len(canonical_ids)} merged (largest cluster: "
+        f"{max(cluster_sizes, default=0)} people, "
+        f"{sum(size > 2 for size in cluster_sizes)} clusters of 3+)"
+    )
+    return canonical_ids
+
+
+def log_phase(phase, start_time, rows=None):
+    """Prints the duration (and rows/s) of a phase of the build and returns the
+    start time of the next one"""
+    seconds = time.perf_counter() - start_time
+    line = f"{phase:<20} {seconds:7.2f} s"
+    if rows is not None:
+        line += f" {rows:>8} rows ({rows / max(seconds, 1e-6):,.0f} rows/s)"
+    print(line)
+    return time.perf_counter()
+
+
+def create_mini_database(
+    original_db_name, minimal_db_name, base_url, full_text_indexes=False
+):
+    """Main script that creates a minimal db from the full SQL schema; the
+    full-text indexes are optional (the shipped minimal_nt.db has none, so the
+    prompt asks for the normalized columns)"""
     base_play_material_link = os.path.join(base_url, "playmaterial/")
     base_play_url = os.path.join(base_url, "play/")
     base_person_url = os.path.join(base_url, "person/")
@@ -230,31 +607,21 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
     # Connect to the mini database (creates a new one if not exists)
     conn_mini = sqlite3.connect(minimal_db_name)
     cursor_mini = conn_mini.cursor()
+    # The database is rebuilt from scratch if anything fails, so no rollback
+    # journal and no fsync; all the rows are inserted in one transaction and
+    # the indexes are created at the end
+    conn_mini.execute("PRAGMA journal_mode = OFF")
+    conn_mini.execute("PRAGMA synchronous = OFF")
+    build_start_time = phase_start_time = time.perf_counter()
 
     create_minidb_schema(cursor_mini)
+    conn_mini.execute("BEGIN")
 
     cursor_original.execute("SELECT personID, relPersonID FROM personToPerson")
-    duplicated_people_list = cursor_original.fetchall()
-    # The solution below would work if the duplicated ids corresponded to a unique personID:
-    # pair_dict = {max(pair): min(pair) for pair in duplicated_people_list}
-    # In practice, in at least 2 examples, e.g.:
-    # 5774 -> 5439, but 5439 -> 2192, so 5774 should correspond to 2192
-    # So we need to ensure that the larger number is they key, and that the value
-    # is the lowest possible personID
-    pair_dict = defaultdict(list)
-    for a, b in duplicated_people_list:
-        larger, smaller = (a, b) if a > b else (b, a)
-        pair_dict[larger].append(smaller)
-
-    # Now, filter out any smaller number that appears as a key (larger number in any pair)
-    # This is done by creating a new dictionary and excluding the duplicates as described
-    duplicated_people_dict = {}
-    for key, values in pair_dict.items():
-        # Include only values that are not keys themselves in the dictionary
-        filtered_values = [value for value in values if value not in pair_dict]
-        if filtered_values:  # Check if there's any valid value left after filtering
-            # We'll only take the first valid value if there's more than one
-            duplicated_people_dict[key] = filtered_values[0]
+    # The duplicated ids don't always correspond to a unique personID, e.g.,
+    # 5774 -> 5439, but 5439 -> 2192, so 5774 should correspond to 2192:
+    # every duplicated personID is mapped to the lowest personID of its cluster
+    canonical_ids = canonical_person_ids(cursor_original.fetchall())
 
     # Fill in persons table
     cursor_original.execute(
@@ -262,11 +629,11 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
         FROM people WHERE published == 1"""
     )
     people_data = cursor_original.fetchall()
-    # Exclude duplicated entries by taking into consideration the duplicated_people_dict
+    # Exclude the duplicated people (they are merged into their canonical ID)
     cursor_mini.executemany(
         """INSERT INTO people (personID, personName, personCountry, personDateBirth, 
         personDateDeath, personURL) VALUES (?,?,?,?,?,?)""",
-        [
+        (
             (
                 person[0],
                 format_name(person[1], person),
@@ -276,9 +643,10 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
                 f"{base_person_url}{person[0]}",
             )
             for person in people_data
-            if person[0] not in duplicated_people_dict.keys()
-        ],
+            if person[0] not in canonical_ids
+        ),
     )
+    phase_start_time = log_phase("people", phase_start_time, cursor_mini.rowcount)
     # We can also store that info in a dict
     # person_dict = {person[0]: format_name(person[1], person) for person in people_data}
 
@@ -306,7 +674,7 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
         if contributorType == "Χορογράφος":
             # fix duplicated info
             contributorType = "Χορογραφία"
-        contributor_info[playID][contributorType] = duplicated_people_dict.get(
+        contributor_info[playID][contributorType] = canonical_ids.get(
             personID, personID
         )
     cursor_original.execute(
@@ -314,13 +682,13 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
         FROM works WHERE published == 1"""
     )
     work_data = cursor_original.fetchall()
-    for row in work_data:
-        cursor_mini.execute(
-            """
-            INSERT INTO works (
-                workID, workTitle, workTitleOriginal, workGenre, workLanguage, workYear, workURL
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
+    cursor_mini.executemany(
+        """
+        INSERT INTO works (
+            workID, workTitle, workTitleOriginal, workGenre, workLanguage, workYear, workURL
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
             (
                 row[0],
                 convert_article_format(row[1]),
@@ -329,8 +697,11 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
                 row[4],
                 row[5],
                 f"{base_work_url}{row[0]}",
-            ),
-        )
+            )
+            for row in work_data
+        ),
+    )
+    phase_start_time = log_phase("works", phase_start_time, cursor_mini.rowcount)
     # Copy relevant data from the original database to the mini database
     cursor_original.execute(
         """
@@ -355,27 +726,29 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
     # No "published" column
     cursor_original.execute("SELECT workID, playID FROM playWorks")
     playworks_data = cursor_original.fetchall()
-    for row in playworks_data:
-        cursor_mini.execute("INSERT INTO playWorks (workID, playID) VALUES (?, ?)", row)
+    cursor_mini.executemany(
+        "INSERT INTO playWorks (workID, playID) VALUES (?, ?)", playworks_data
+    )
+    phase_start_time = log_phase("playworks", phase_start_time, cursor_mini.rowcount)
 
     # playworks_map = dict(playworks_data)
 
     # No "published" column
     cursor_original.execute("SELECT workID, personID from authors")
     authors_data = cursor_original.fetchall()
-    for i, row in enumerate(authors_data):
-        try:
-            # playID or workID? If playID: playworks_map[row[0]]
-            cursor_mini.execute(
-                """
-                INSERT INTO authors (
-                    authorID, workID, personID
-                ) VALUES (?, ?, ?)
-                """,
-                (i, row[0], duplicated_people_dict.get(row[1], row[1])),
-            )
-        except KeyError:
-            continue
+    # playID or workID? If playID: playworks_map[row[0]]
+    cursor_mini.executemany(
+        """
+        INSERT INTO authors (
+            authorID, workID, personID
+        ) VALUES (?, ?, ?)
+        """,
+        (
+            (i, row[0], canonical_ids.get(row[1], row[1]))
+            for i, row in enumerate(authors_data)
+        ),
+    )
+    phase_start_time = log_phase("authors", phase_start_time, cursor_mini.rowcount)
 
     cursor_original.execute(
         """
@@ -409,77 +782,39 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
         "SELECT playID, playTitle, relatedPlayID FROM plays WHERE published == 1"
     )
     plays_data = cursor_original.fetchall()
-    # Loop through each row of the original 'plays' table
-    for row in plays_data:
-        play_id = row[0]
-        play_title = row[1]
-        related_play_id = row[2]
-        if related_play_id:
-            # Το πεδίο relatedPlayID είναι για παραστάσεις που αποτελούν επανάληψη προγενέστερης
-            # παράστασης. Νεα λειτουργικότητα που δεν έχει ακόμα χρησιμοποιηθεί.
-            # Οι παραστάσεις που δεν έχουν τιμή στο πεδίο αυτό είναι αυτόνομες.
-            # What should we do with this info? Perhaps update the
-            # original play_id and modify the end date? Or leave as is?
-            print(f"playID: {play_id}, Related playID: {related_play_id}")
-        # Check if the original database has entries in the corresponding tables
-        # has_material = (1
-        #                 if has_entries_in_table(cursor_original, "materials", "playID", play_id)
-        #                 else 0)
-        # hasMaterial INTEGER NULL: από ποιο table γίνεται informed?
-        # hasMusicSheet: δεν έχει playID?
-        photos = (
-            f"{base_play_material_link}{play_id}#photos"
-            if has_entries_in_table(cursor_original, "photos", "playID", play_id)
-            else None
-        )
-        videos = (
-            f"{base_play_material_link}{play_id}#videos"
-            if has_entries_in_table(cursor_original, "videos", "playID", play_id)
-            else None
-        )
-        programs = (
-            f"{base_play_material_link}{play_id}#programs"
-            if has_entries_in_table(cursor_original, "playPrograms", "playID", play_id)
-            else None
-        )
-        publications = (
-            f"{base_play_material_link}{play_id}#publications"
-            if has_entries_in_table(cursor_original, "publications", "playID", play_id)
-            else None
-        )
-        costumes = (
-            f"{base_play_material_link}{play_id}#costumes"
-            if has_entries_in_table(cursor_original, "costumesPlays", "playID", play_id)
-            else None
-        )
-        posters = (
-            f"{base_play_material_link}{play_id}#posters"
-            if has_entries_in_table(cursor_original, "postersPlays", "playID", play_id)
-            else None
-        )
-
-        music_sheets = (
-            f"{base_play_material_link}{play_id}#music"
-            if has_entries_in_table(cursor_original, "musicScores", "musicID", play_id)
-            else None
-        )
-        sounds = (
-            f"{base_play_material_link}{play_id}#sounds"
-            if has_entries_in_table(cursor_original, "sounds", "playID", play_id)
-            else None
-        )
-
-        # Insert the data into the new 'plays' table in the mini database
-        cursor_mini.execute(
-            """
-            INSERT INTO plays (
-                playID, playTitle, playURL, venue, venueCountry,
-                yearStarted, yearEnded, directorID,
-                photosURL, publicationsURL, programsURL, soundsURL,
-                videosURL, musicSheetsURL, costumesURL, postersURL
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
+    media_play_ids = {
+        column: foreign_keys_in_table(cursor_original, table_name, play_id_column)
+        for column, (table_name, play_id_column, _) in MEDIA_TABLES.items()
+    }
+    phase_start_time = log_phase("media", phase_start_time)
+
+    def play_rows():
+        """The rows of the new 'plays' table, from the original 'plays' table"""
+        for row in plays_data:
+            play_id = row[0]
+            play_title = row[1]
+            related_play_id = row[2]
+            if related_play_id:
+                # Το πεδίο relatedPlayID είναι για παραστάσεις που αποτελούν επανάληψη προγενέστερης
+                # παράστασης. Νεα λειτουργικότητα που δεν έχει ακόμα χρησιμοποιηθεί.
+                # Οι παραστάσεις που δεν έχουν τιμή στο πεδίο αυτό είναι αυτόνομες.
+                # What should we do with this info? Perhaps update the
+                # original play_id and modify the end date? Or leave as is?
+                print(f"playID: {play_id}, Related playID: {related_play_id}")
+            # Check if the original database has entries in the corresponding tables
+            # has_material = (1
+            #                 if has_entries_in_table(cursor_original, "materials", "playID", play_id)
+            #                 else 0)
+            # hasMaterial INTEGER NULL: από ποιο table γίνεται informed?
+            media = {
+                column: (
+                    f"{base_play_material_link}{play_id}#{fragment}"
+                    if play_id in media_play_ids[column]
+                    else None
+                )
+                for column, (_, _, fragment) in MEDIA_TABLES.items()
+            }
+            yield (
                 play_id,
                 convert_article_format(play_title),
                 f"{base_play_url}{play_id}",
@@ -488,45 +823,103 @@ def create_mini_database(original_db_name, minimal_db_name, base_url):
                 playrepeats_dict.get(play_id, {}).get("min"),
                 playrepeats_dict.get(play_id, {}).get("max"),
                 contributor_info.get(play_id, {}).get("Σκηνοθεσία"),
-                photos,
-                publications,
-                programs,
-                sounds,
-                videos,
-                music_sheets,
-                costumes,
-                posters,
-            ),
-        )
+                media["photosURL"],
+                media["publicationsURL"],
+                media["programsURL"],
+                media["soundsURL"],
+                media["videosURL"],
+                media["musicSheetsURL"],
+                media["costumesURL"],
+                media["postersURL"],
+            )
+
+    # Insert the data into the new 'plays' table in the mini database
+    cursor_mini.executemany(
+        """
+        INSERT INTO plays (
+            playID, playTitle, playURL, venue, venueCountry,
+            yearStarted, yearEnded, directorID,
+            photosURL, publicationsURL, programsURL, soundsURL,
+            videosURL, musicSheetsURL, costumesURL, postersURL
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        play_rows(),
+    )
+    phase_start_time = log_phase("plays", phase_start_time, cursor_mini.rowcount)
 
     cursor_original.execute("SELECT * FROM actors")
     actors_data = cursor_original.fetchall()
-    actors_data1 = []
-    for i, actor in enumerate(actors_data):
-        actors_data1.append(list(actor))
-        actors_data1[i][3] = int(str(actors_data1[i][3]) == "1")
     cursor_mini.executemany(
         "INSERT INTO actors (actorID, playID, personID, protagonist, actorRole) VALUES (?,?,?,?,?)",
-        [
+        (
             (
                 actor[0],
                 actor[1],
-                duplicated_people_dict.get(actor[2], actor[2]),
-                actor[3],
+                canonical_ids.get(actor[2], actor[2]),
+                int(str(actor[3]) == "1"),
                 actor[5],
             )
-            for actor in actors_data1
-        ],
+            for actor in actors_data
+        ),
     )
+    phase_start_time = log_phase("actors", phase_start_time, cursor_mini.rowcount)
 
     # Commit the changes and close connections
     conn_mini.commit()
+    phase_start_time = log_phase("commit", phase_start_time)
+    create_normalized_columns(conn_mini)
+    phase_start_time = log_phase("normalized columns", phase_start_time)
+    create_secondary_indexes(conn_mini)
+    phase_start_time = log_phase("indexes", phase_start_time)
+    create_play_summary(conn_mini)
+    phase_start_time = log_phase("play_summary", phase_start_time)
+    if full_text_indexes:
+        create_full_text_indexes(conn_mini)
+        phase_start_time = log_phase("full-text indexes", phase_start_time)
+    analyze(conn_mini)
+    phase_start_time = log_phase("ANALYZE", phase_start_time)
+    conn_mini.execute("VACUUM")
+    log_phase("VACUUM", phase_start_time)
+    log_phase("total", build_start_time)
+    explain_query_plans(conn_mini, canonical_queries())
     conn_mini.close()
     conn_original.close()
 
     print(f"Mini SQLite database ({minimal_db_name}) created successfully.")
 
 
+def update_mini_database(original_db_name, minimal_db_name, base_url):
+    """Builds the minimal db next to the existing one and only applies the
+    inserted, updated and deleted rows to it (see db_delta.py), so that the
+    database that the VA serves changes in one short transaction; the changes
+    are written to <minimal_db_name>.delta.json. The full-text indexes aren't
+    compared: they are rebuilt if the db has them and their table has changed"""
+    new_minimal_db_name = f"{minimal_db_name}.new"
+    if os.path.exists(new_minimal_db_name):
+        os.remove(new_minimal_db_name)
+    create_mini_database(original_db_name, new_minimal_db_name, base_url)
+    print(f"Applying the changes to {minimal_db_name}")
+    changes = apply_delta(minimal_db_name, new_minimal_db_name)
+    os.remove(new_minimal_db_name)
+    conn_mini = sqlite3.connect(minimal_db_name)
+    existing_tables = {
+        row[0] for row in conn_mini.execute("SELECT name FROM sqlite_master")
+    }
+    # the full-text indexes are contentless, so they are rebuilt if their
+    # table has changed (only if the db has them)
+    if any(
+        index_name in existing_tables and table_name in changes
+        for index_name, (table_name, _, _) in FULL_TEXT_INDEXES.items()
+    ):
+        create_full_text_indexes(conn_mini)
+    if changes:
+        analyze(conn_mini)
+    conn_mini.close()
+    write_manifest(
+        f"{minimal_db_name}.delta.json", minimal_db_name, original_db_name, changes
+    )
+
+
 def parse_arguments():
     """Parse CLI arguments"""
     parser = argparse.ArgumentParser(
@@ -548,10 +941,56 @@ def parse_arguments():
     parser.add_argument(
         "--base-url", default="http://194.177.217.106/", help="Base URL"
     )
+    parser.add_argument(
+        "--indexes-only",
+        action="store_true",
+        help="Only (re)build the normalized columns, play_summary and the "
+        "indexes of an existing minimal DB",
+    )
+    parser.add_argument(
+        "--full-text-indexes",
+        action="store_true",
+        help="Also build the FTS5 indexes of the titles and names (the prompt then "
+        "asks for them instead of the normalized columns)",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Only apply the inserted, updated and deleted rows to an existing "
+        "minimal DB and write them to <minimal-db-name>.delta.json",
+    )
+    parser.add_argument(
+        "--benchmark-fts",
+        nargs="+",
+        metavar="PROMPT_FILE",
+        help="Compare LIKE with the full-text indexes on the words of the prompts",
+    )
 
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_arguments()
-    create_mini_database(args.original_db_name, args.minimal_db_name, args.base_url)
+    if args.indexes_only:
+        conn = sqlite3.connect(args.minimal_db_name)
+        create_normalized_columns(conn)
+        create_secondary_indexes(conn)
+        create_play_summary(conn)
+        if args.full_text_indexes:
+            create_full_text_indexes(conn)
+        analyze(conn)
+        explain_query_plans(conn, canonical_queries())
+        conn.close()
+    elif args.delta and os.path.exists(args.minimal_db_name):
+        update_mini_database(
+            args.original_db_name, args.minimal_db_name, args.base_url
+        )
+    elif not args.benchmark_fts:
+        create_mini_database(
+            args.original_db_name,
+            args.minimal_db_name,
+            args.base_url,
+            full_text_indexes=args.full_text_indexes,
+        )
+    if args.benchmark_fts:
+        benchmark_full_text_search(args.minimal_db_name, args.benchmark_fts)
@@ -0,0 +1,172 @@
+"""Row-level delta between two builds of the same SQLite schema.
+
+The rows of each table are hashed by primary key; the keys whose hash differs
+are the updated rows. Tables without a primary key are compared as multisets
+of rows (a changed row is a deleted and an inserted row). The changes are
+applied to the old database in place and summarized in a JSON manifest, so
+that the consumers of the database only invalidate what has changed.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections import Counter
+
+
+def row_hash(row):
+    """Digest of the values of a row; repr keeps 1, 1.0 and '1' apart"""
+    return hashlib.blake2b(repr(row).encode("utf-8"), digest_size=16).digest()
+
+
+def data_tables(conn):
+    """The tables that hold rows: not the internal sqlite_ tables, the virtual
+    (e.g., FTS5) tables and their shadow tables"""
+    tables = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ).fetchall()
+    virtual_tables = [
+        name for name, sql in tables if sql.upper().startswith("CREATE VIRTUAL")
+    ]
+    return [
+        name
+        for name, _ in tables
+        if name not in virtual_tables
+        and not any(name.startswith(f"{table}_") for table in virtual_tables)
+    ]
+
+
+def table_columns(conn, table_name):
+    """The columns and the primary key columns of a table"""
+    table_info = conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+    columns = [row[1] for row in table_info]
+    # pk is the position of the column in the primary key (0 if it isn't in it)
+    key_columns = [
+        row[1] for row in sorted(table_info, key=lambda row: row[5]) if row[5]
+    ]
+    return columns, key_columns
+
+
+def table_hashes(conn, table_name, columns, key_columns):
+    """{primary key: row hash}, or a Counter of the rows without a primary key"""
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    rows = conn.execute(f'SELECT {column_list} FROM "{table_name}"')
+    if not key_columns:
+        return Counter(rows)
+    key_indexes = [columns.index(column) for column in key_columns]
+    return {tuple(row[i] for i in key_indexes): row_hash(row) for row in rows}
+
+
+def diff_table(old_conn, new_conn, table_name):
+    """The inserted, updated and deleted keys (rows, if there is no primary key)
+    of the table in new_conn compared to old_conn"""
+    columns, key_columns = table_columns(new_conn, table_name)
+    old_columns, old_key_columns = table_columns(old_conn, table_name)
+    if (old_columns, old_key_columns) != (columns, key_columns):
+        raise ValueError(
+            f"The schema of {table_name} has changed: rebuild the database instead"
+        )
+    old_hashes = table_hashes(old_conn, table_name, columns, key_columns)
+    new_hashes = table_hashes(new_conn, table_name, columns, key_columns)
+    if not key_columns:
+        return {
+            "inserted": list((new_hashes - old_hashes).elements()),
+            "updated": [],
+            "deleted": list((old_hashes - new_hashes).elements()),
+        }
+    return {
+        "inserted": [key for key in new_hashes if key not in old_hashes],
+        "updated": [
+            key
+            for key, digest in new_hashes.items()
+            if key in old_hashes and old_hashes[key] != digest
+        ],
+        "deleted": [key for key in old_hashes if key not in new_hashes],
+    }
+
+
+def apply_table_changes(conn, table_name, changes, new_schema="delta"):
+    """Applies the changes of diff_table to the table of conn; the new database
+    is attached to conn as new_schema"""
+    columns, key_columns = table_columns(conn, table_name)
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    if not key_columns:
+        # one row per deleted copy (the table may have duplicate rows)
+        matches_row = " AND ".join(f'"{column}" IS ?' for column in columns)
+        conn.executemany(
+            f'DELETE FROM main."{table_name}" WHERE rowid = '
+            f'(SELECT rowid FROM main."{table_name}" WHERE {matches_row} LIMIT 1)',
+            changes["deleted"],
+        )
+        placeholders = ", ".join("?" * len(columns))
+        conn.executemany(
+            f'INSERT INTO main."{table_name}" ({column_list}) VALUES ({placeholders})',
+            changes["inserted"],
+        )
+        return
+    matches_key = " AND ".join(f'"{column}" = ?' for column in key_columns)
+    conn.executemany(
+        f'DELETE FROM main."{table_name}" WHERE {matches_key}', changes["deleted"]
+    )
+    conn.executemany(
+        f'INSERT OR REPLACE INTO main."{table_name}" ({column_list}) '
+        f'SELECT {column_list} FROM {new_schema}."{table_name}" WHERE {matches_key}',
+        changes["inserted"] + changes["updated"],
+    )
+
+
+def apply_delta(db_name, new_db_name):
+    """Updates db_name to the rows of new_db_name, table by table, in one
+    transaction. Returns {table: changes} of the tables that have changed"""
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    new_conn = sqlite3.connect(new_db_name)
+    tables = data_tables(new_conn)
+    missing_tables = set(tables) ^ set(data_tables(conn))
+    if missing_tables:
+        raise ValueError(
+            f"Tables {sorted(missing_tables)} are not in both databases: "
+            "rebuild the database instead"
+        )
+    conn.execute("ATTACH DATABASE ? AS delta", (new_db_name,))
+    delta = {}
+    conn.execute("BEGIN")
+    for table_name in tables:
+        start_time = time.perf_counter()
+        changes = diff_table(conn, new_conn, table_name)
+        num_changes = sum(len(keys) for keys in changes.values())
+        if not num_changes:
+            continue
+        apply_table_changes(conn, table_name, changes)
+        delta[table_name] = changes
+        print(
+            f"{table_name:<20} +{len(changes['inserted']):<6} "
+            f"~{len(changes['updated']):<6} -{len(changes['deleted']):<6} "
+            f"{time.perf_counter() - start_time:6.2f} s"
+        )
+    conn.commit()
+    conn.execute("DETACH DATABASE delta")
+    conn.close()
+    new_conn.close()
+    return delta
+
+
+def write_manifest(manifest_path, db_name, source, delta):
+    """Writes the changed keys of each table (inserted, updated, deleted) as
+    JSON; single-column keys are written as values, the others as lists"""
+
+    def keys(changed_keys):
+        return [key[0] if len(key) == 1 else list(key) for key in changed_keys]
+
+    manifest = {
+        "database": db_name,
+        "source": source,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "tables": {
+            table_name: {change: keys(changed) for change, changed in changes.items()}
+            for table_name, changes in delta.items()
+        },
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    print(f"Change manifest: {manifest_path} ({len(delta)} changed tables)")
@@ -1,25 +1,50 @@
 import asyncio
+import hmac
 import logging
+import sqlite3
 import time
 
-import cachetools
 import uvicorn
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.requests import Request
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from langchain_core.callbacks import AsyncCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 from websockets.exceptions import ConnectionClosedOK
 
-from nt_chat.chain import make_chain
+from nt_chat.cache import PersistentCache, normalize_query
+from nt_chat.chain import (
+    checked_sql_cache,
+    db_version,
+    make_chain,
+    result_cache,
+    sql_cache,
+)
 from nt_chat.config import (
+    ADMIN_TOKEN,
+    CACHE_DB_PATH,
+    CACHE_MAX_SIZE,
+    CACHE_TTL,
+    DB_WATCH_INTERVAL,
     LOGGING_FILE,
     MAX_PARALLEL_CALLS,
     RESPONSE_TIME_OUT,
     USE_CACHE,
 )
+from nt_chat.metrics import (
+    LOCAL_ANSWER_EVENT,
+    REQUEST_SECONDS,
+    REQUESTS,
+    REQUESTS_IN_FLIGHT,
+    SEMAPHORE_WAIT_SECONDS,
+    MetricsCallbackHandler,
+    register_caches,
+)
+from nt_chat.sql_executor import SQLExecutorBusy
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,7 +56,27 @@ logger = logging.getLogger(__name__)
 # Set the logging level of the openai library to WARNING or higher to ignore INFO and DEBUG messages
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-cache = cachetools.LRUCache(maxsize=800)
+# the answers are invalidated with the other DB-derived caches when the
+# database is swapped
+cache = (
+    PersistentCache(
+        CACHE_DB_PATH,
+        "answers",
+        maxsize=CACHE_MAX_SIZE,
+        ttl=CACHE_TTL,
+        version=db_version,
+    )
+    if USE_CACHE
+    else None
+)
+register_caches(
+    {
+        "answers": cache,
+        "sql": sql_cache,
+        "sql_results": result_cache,
+        "checked_sql": checked_sql_cache,
+    }
+)
 # Initialize semaphore
 print("MAX_PARALLEL_CALLS:", MAX_PARALLEL_CALLS)
 concurrent_calls_semaphore = asyncio.Semaphore(MAX_PARALLEL_CALLS)
@@ -39,13 +84,13 @@ semaphore_timeout = 0.1
 
 
 def get_cached_response(user_input):
-    """Retrieves response from cache"""
-    return cache.get(user_input, None)
+    """Retrieves response from cache; the key is the normalized user input"""
+    return cache.get(normalize_query(user_input))
 
 
 def cache_response(user_input, response):
     """Adds response to cache"""
-    cache[user_input] = response
+    cache.set(normalize_query(user_input), response)
 
 
 app = FastAPI()
@@ -68,24 +113,83 @@ class QueryInput(BaseModel):
     query: str
 
 
+@app.on_event("startup")
+async def watch_database():
+    """Swaps to a new database file without a restart (see nt_chat/db_version.py)"""
+    if DB_WATCH_INTERVAL > 0:
+        app.state.db_watcher = asyncio.create_task(db_version.watch(DB_WATCH_INTERVAL))
+
+
+def check_admin_token(token):
+    if not ADMIN_TOKEN or not hmac.compare_digest(token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
 @app.get("/")
 async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Cache hits/misses, i.e., the LLM round-trips and SQL executions we saved;
+    each cache is reported on its own, as they are configured separately"""
+    caches = {
+        "answers": cache,
+        "sql": sql_cache,
+        "sql_results": result_cache,
+        "checked_sql": checked_sql_cache,
+    }
+    return {
+        name: (
+            {"enabled": True, **named_cache.stats()}
+            if named_cache is not None
+            else {"enabled": False}
+        )
+        for name, named_cache in caches.items()
+    }
+
+
+@app.get("/admin/db")
+async def database_version(x_admin_token: str = Header(None)):
+    """The version (content hash) of the served database"""
+    check_admin_token(x_admin_token)
+    return db_version.info()
+
+
+@app.post("/admin/db/reload")
+async def reload_database(x_admin_token: str = Header(None)):
+    """Swaps to the database file at SQLITE_DB_PATH now, if it has changed,
+    instead of waiting for the watcher"""
+    check_admin_token(x_admin_token)
+    try:
+        swapped = await asyncio.to_thread(db_version.check)
+    except sqlite3.DatabaseError as e:
+        raise HTTPException(status_code=409, detail=f"Invalid database: {e}") from e
+    return {"swapped": swapped, **db_version.info()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: latency per stage, tokens, caches, in-flight requests"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/chat")
 async def chat_endpoint(input_data: QueryInput):
     """Main chat function"""
     query = input_data.query
+    REQUESTS_IN_FLIGHT.labels("chat").inc()
     try:
         logger.info("Processing query %s", query)
         start_time = time.time()
 
         chain = make_chain(stream=True)
-        result = await chain.acall(query)
+        result = await chain.acall(query, callbacks=[MetricsCallbackHandler()])
 
         end_time = time.time()
         logger.info("Completed LLM calls in %s seconds.", end_time - start_time)
+        REQUEST_SECONDS.labels("chat").observe(end_time - start_time)
 
         if not result or "result" not in result:
             logger.error("chain.acall returned an unexpected result: %s", result)
@@ -96,12 +200,20 @@ async def chat_endpoint(input_data: QueryInput):
         answer = result["result"]
         logger.info("Query: %s", query)
         logger.info("Answer: %s", answer)
+        REQUESTS.labels("chat", "ok").inc()
         return {"answer": answer}
+    except SQLExecutorBusy as e:
+        logger.warning("SQLExecutorBusy: Service at capacity.")
+        REQUESTS.labels("chat", "capacity").inc()
+        raise HTTPException(status_code=503, detail=str(e)) from e
     except Exception as e:
         logger.error("An error occurred: %s", e)
+        REQUESTS.labels("chat", "error").inc()
         raise HTTPException(
             status_code=500, detail=f"An unexpected error occurred: {e}"
         ) from e
+    finally:
+        REQUESTS_IN_FLIGHT.labels("chat").dec()
 
 
 class ChainStreamHandler(AsyncCallbackHandler):
@@ -113,6 +225,11 @@ class ChainStreamHandler(AsyncCallbackHandler):
         if "FINAL_RESULT" in kwargs.get("tags", []):
             await self.ws.send_text(token)
 
+    async def on_custom_event(self, name, data, **kwargs):
+        # The answers that are rendered locally are sent at once
+        if name == LOCAL_ANSWER_EVENT:
+            await self.ws.send_text(data["text"])
+
 
 @app.websocket("/chatstream")
 async def websocket_endpoint(websocket: WebSocket):
@@ -120,24 +237,38 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     chain = make_chain(stream=True, return_intermediate_steps=True)
     while True:
+        # Reset on every message, so that the finally clause doesn't
+        # release the semaphore of a previous message
+        acquired_semaphore = False
+        in_flight = False
         try:
             # Receive client message
             user_msg = await websocket.receive_text()
             logger.info("User request: %s", user_msg)
+            REQUESTS_IN_FLIGHT.labels("chatstream").inc()
+            in_flight = True
+            start_time = time.perf_counter()
             if USE_CACHE:
-                # Check if the response is already cached
-                # Of course this approach is simplistic, it only does string matching
-                # For a more sophisticated approach, we can generate embeddings for
-                # each user_msg and compare it against the cache
-                cached_response = get_cached_response(user_msg)  # .lower())
+                # Check if the response is already cached. The key is normalized
+                # (casefolded, without accents and punctuation), but this is still
+                # string matching; for a more sophisticated approach, we can generate
+                # embeddings for each user_msg and compare it against the cache
+                cached_response = get_cached_response(user_msg)
                 if cached_response is not None:
                     logger.info("Found cached response: %s", cached_response)
                     await websocket.send_text(cached_response)
+                    await websocket.send_text("[END]")
+                    REQUEST_SECONDS.labels("chatstream").observe(
+                        time.perf_counter() - start_time
+                    )
+                    REQUESTS.labels("chatstream", "cached").inc()
                     continue
 
+            wait_start_time = time.perf_counter()
             acquired_semaphore = await asyncio.wait_for(
                 concurrent_calls_semaphore.acquire(), timeout=semaphore_timeout
             )
+            SEMAPHORE_WAIT_SECONDS.observe(time.perf_counter() - wait_start_time)
 
             if not acquired_semaphore:
                 raise asyncio.TimeoutError()
@@ -145,7 +276,10 @@ async def websocket_endpoint(websocket: WebSocket):
             # to check the API status: https://status.openai.com/
             # This also sends back the response
             out = await asyncio.wait_for(
-                chain.acall(user_msg, callbacks=[ChainStreamHandler(websocket)]),
+                chain.acall(
+                    user_msg,
+                    callbacks=[ChainStreamHandler(websocket), MetricsCallbackHandler()],
+                ),
                 timeout=RESPONSE_TIME_OUT,
             )
             sql_query = (
@@ -157,12 +291,15 @@ async def websocket_endpoint(websocket: WebSocket):
             logger.info("SQL query:\n %s", sql_query)
 
             if USE_CACHE:
-                # Cache the processed response user_msg.lower()
+                # Cache the processed response
                 cache_response(user_msg, out["result"])
             logger.info("Response: %s", out["result"])
             # Send the end-response back to the client and release the semaphore
             await websocket.send_text("[END]")
-        except asyncio.TimeoutError:
+            REQUEST_SECONDS.labels("chatstream").observe(time.perf_counter() - start_time)
+            REQUESTS.labels("chatstream", "ok").inc()
+        except (asyncio.TimeoutError, SQLExecutorBusy):
+            REQUESTS.labels("chatstream", "capacity").inc()
             await websocket.send_text(
                 "Ο ψηφιακός βοηθός είναι στη μέγιστη χωρητικότητα, παρακαλώ δοκιμάστε αργότερα."
             )
@@ -177,11 +314,14 @@ async def websocket_endpoint(websocket: WebSocket):
             break
         except Exception as e:
             logger.error("Unexpected error: %s", e)
+            REQUESTS.labels("chatstream", "error").inc()
             await websocket.send_text("Κάτι πήγε στραβά. Παρακαλώ προσπαθήστε ξανά.")
         finally:
             # Ensure that the semaphore is released in all cases
-            if "acquired_semaphore" in locals() and acquired_semaphore:
+            if acquired_semaphore:
                 concurrent_calls_semaphore.release()
+            if in_flight:
+                REQUESTS_IN_FLIGHT.labels("chatstream").dec()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+"""Persistent caches shared by the chat endpoints.
+
+Entries live in a small SQLite file so that they survive restarts and are
+shared by every uvicorn worker that points to the same CACHE_DB_PATH.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Greek question mark (;), ano teleia (·) and friends are all covered by the
+# unicode "P" categories, but we also drop symbols such as quotes and dashes
+_PUNCTUATION_CATEGORIES = ("P", "S")
+_WHITESPACE_RE = re.compile(r"\s+")
+# (path, st_mtime_ns, st_size) -> content hash
+_fingerprints = {}
+
+
+def normalize_query(text):
+    """Greek-aware normalization of a user question, used as a cache key.
+
+    "Ψάχνω υλικό από την Ηλέκτρα" and "ψαχνω  υλικο απο την ηλεκτρα;" both
+    become "ψαχνω υλικο απο την ηλεκτρα":
+    1. casefold (this also maps the final sigma ς to σ)
+    2. strip accents/tonos and dialytika
+    3. replace punctuation with spaces and collapse whitespace
+    """
+    text = unicodedata.normalize("NFD", text.casefold())
+    chars = []
+    for char in text:
+        category = unicodedata.category(char)
+        if category == "Mn":
+            # combining marks, i.e., tonos, dialytika etc.
+            continue
+        if category[0] in _PUNCTUATION_CATEGORIES:
+            chars.append(" ")
+        else:
+            chars.append(char)
+    return _WHITESPACE_RE.sub(" ", "".join(chars)).strip()
+
+
+def db_fingerprint(path):
+    """Content hash of the database file, used to invalidate the cache entries
+    that were computed from it. The file is only hashed again if its
+    modification time or size changes (e.g., after create_mini_db.py)."""
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _fingerprints:
+        sha = hashlib.sha256()
+        with open(path, "rb") as db_file:
+            for block in iter(lambda: db_file.read(1 << 20), b""):
+                sha.update(block)
+        _fingerprints[key] = sha.hexdigest()
+    return _fingerprints[key]
+
+
+class PersistentCache:
+    """A key-value cache stored in SQLite with TTL and LRU (size-based) eviction.
+
+    Several caches can share the same file; each one uses its own namespace.
+    Values are stored as JSON. If a version is given (e.g., the fingerprint
+    of the database the values were computed from), entries stored with a
+    different version are treated as misses. The version can also be a
+    callable that is evaluated on every lookup.
+    """
+
+    def __init__(self, path, namespace, maxsize=800, ttl=None, version=None):
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        # WAL allows concurrent readers from other workers while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                version TEXT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (namespace, accessed)"
+        )
+        self._conn.commit()
+
+    def _version(self, version):
+        if version is not None:
+            return version
+        return self.version() if callable(self.version) else self.version
+
+    def get(self, key, version=None):
+        """Returns the cached value or None"""
+        version = self._version(version)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT value, version, created FROM cache
+                WHERE namespace = ? AND key = ?""",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, stored_version, created = row
+            if (self.ttl and now - created > self.ttl) or stored_version != version:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                )
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value, version=None):
+        """Adds a value to the cache and evicts the least recently used entries"""
+        version = self._version(version)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO cache
+                (namespace, key, value, version, created, accessed)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (self.namespace, key, json.dumps(value), version, now, now),
+            )
+            if self.ttl:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND created < ?",
+                    (self.namespace, now - self.ttl),
+                )
+            self._conn.execute(
+                """DELETE FROM cache WHERE namespace = ? AND key IN (
+                    SELECT key FROM cache WHERE namespace = ?
+                    ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.namespace, self.namespace, self.maxsize),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """Removes every entry of this namespace"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ?", (self.namespace,)
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    def stats(self):
+        """Hit/miss counters of the current process"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,201 @@
+"""Record/replay of the LLM calls of the SQL chains.
+
+CASSETTE_MODE=record wraps the LLM and saves every response (decider, SQL
+generation, query checker and final answer) to CASSETTE_PATH, keyed on the
+hash of the model name and the prompt messages, together with its latency.
+CASSETTE_MODE=replay serves the recorded responses without calling the LLM,
+so that quality_assessment_prompts.txt and test_prompt_list can be re-run
+offline after a refactoring; with CASSETTE_SIMULATE_LATENCY the original
+time to first token and streaming rate are reproduced, which allows us to
+compare the SQL execution and serving overhead across commits.
+"""
+
+import asyncio
+import hashlib
+import json
+import sys
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import (AsyncCallbackManagerForLLMRun,
+                                      CallbackManagerForLLMRun)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import (ChatGeneration, ChatGenerationChunk,
+                                    ChatResult)
+from langchain_core.pydantic_v1 import Field
+
+from nt_chat.cache import PersistentCache
+
+CASSETTE_MODES = ("record", "replay")
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a prompt was not recorded"""
+
+
+def open_cassette(path):
+    """The recordings are never evicted or expired"""
+    return PersistentCache(path, "llm", maxsize=sys.maxsize)
+
+
+def prompt_key(model_name, messages, stop=None):
+    """Hash of the prompt messages; the responses depend on the model too"""
+    payload = json.dumps(
+        {
+            "model": model_name,
+            "messages": [[message.type, message.content] for message in messages],
+            "stop": stop,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CassetteChatModel(BaseChatModel):
+    """Records the responses of llm, or replays them from the cassette"""
+
+    cassette: Any = Field(exclude=True)
+    """PersistentCache with the recordings (see open_cassette)"""
+    mode: str = "replay"
+    llm: Optional[BaseChatModel] = None
+    """The wrapped model, only needed in record mode"""
+    model_name: str = ""
+    streaming: bool = False
+    simulate_latency: bool = False
+    """Replay with the recorded time to first token and streaming rate"""
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.mode}"
+
+    def _key(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> str:
+        return prompt_key(self.model_name, messages, stop)
+
+    def _recording(self, key: str) -> dict:
+        recording = self.cassette.get(key)
+        if recording is None:
+            raise CassetteMiss(f"No recorded response for prompt {key}")
+        return recording
+
+    def _save(self, key, chunks, start_time, first_token_time):
+        end_time = time.perf_counter()
+        self.cassette.set(
+            key,
+            {
+                "chunks": chunks,
+                "first_token_seconds": (first_token_time or end_time) - start_time,
+                "seconds": end_time - start_time,
+            },
+        )
+
+    def _delays(self, recording: dict):
+        """(delay before the first chunk, delay between chunks)"""
+        if not self.simulate_latency:
+            return 0.0, 0.0
+        first_token_seconds = recording["first_token_seconds"]
+        streaming_seconds = recording["seconds"] - first_token_seconds
+        return first_token_seconds, streaming_seconds / max(
+            len(recording["chunks"]), 1
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        key = self._key(messages, stop)
+        if self.mode == "record":
+            # always stream the wrapped model, to measure the time to first token
+            chunks = []
+            first_token_time = None
+            start_time = time.perf_counter()
+            for message_chunk in self.llm.stream(messages, stop=stop, **kwargs):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                chunk = ChatGenerationChunk(
+                    message=AIMessageChunk(content=message_chunk.content)
+                )
+                chunks.append(chunk.text)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            self._save(key, chunks, start_time, first_token_time)
+            return
+
+        recording = self._recording(key)
+        first_delay, chunk_delay = self._delays(recording)
+        time.sleep(first_delay)
+        for text in recording["chunks"]:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            time.sleep(chunk_delay)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._key(messages, stop)
+        if self.mode == "record":
+            chunks = []
+            first_token_time = None
+            start_time = time.perf_counter()
+            async for message_chunk in self.llm.astream(messages, stop=stop, **kwargs):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                chunk = ChatGenerationChunk(
+                    message=AIMessageChunk(content=message_chunk.content)
+                )
+                chunks.append(chunk.text)
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            self._save(key, chunks, start_time, first_token_time)
+            return
+
+        recording = self._recording(key)
+        first_delay, chunk_delay = self._delays(recording)
+        await asyncio.sleep(first_delay)
+        for text in recording["chunks"]:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(chunk_delay)
+
+    @staticmethod
+    def _result(text: str) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # The tokens are only passed on to the callbacks if streaming is set
+        run_manager = run_manager if self.streaming else None
+        chunks = self._stream(messages, stop, run_manager, **kwargs)
+        return self._result("".join(chunk.text for chunk in chunks))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        run_manager = run_manager if self.streaming else None
+        text = ""
+        async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+            text += chunk.text
+        return self._result(text)
@@ -1,13 +1,39 @@
 import sqlalchemy
-from langchain_community.utilities import SQLDatabase
 from langchain_core.output_parsers import CommaSeparatedListOutputParser
 from langchain_core.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 
-from nt_chat.config import (MODEL_NAME, OPENAI_KEY, SQLITE_DB_PATH,
-                            TOP_K_RESULTS, UNICODE_PLUGIN_PATH)
-from nt_chat.prompts import _DECIDER_TEMPLATE, DEFAULT_TEMPLATE
+from nt_chat.cache import PersistentCache
+from nt_chat.cassette import CASSETTE_MODES, CassetteChatModel, open_cassette
+from nt_chat.config import (CACHE_DB_PATH, CACHE_MAX_SIZE, CACHE_TTL,
+                            CASSETTE_MODE, CASSETTE_PATH,
+                            CASSETTE_SIMULATE_LATENCY, DECIDER_LOG_PATH,
+                            FAKE_LLM_LATENCY_MEDIAN, FAKE_LLM_LATENCY_SIGMA,
+                            FAKE_LLM_SEED, FAKE_LLM_SQL_PATH,
+                            FAKE_LLM_TOKENS_PER_SECOND, INTENT_MIN_CONFIDENCE,
+                            INTENT_TEMPLATES, LLM_BACKEND,
+                            LOCAL_ANSWER_INTENTS, LOCAL_ANSWER_TIMEOUT,
+                            MODEL_NAME, OPENAI_KEY, RESULT_CACHE_MAX_BYTES,
+                            SQL_MMAP_SIZE, SQL_POOL_SIZE, SQL_QUEUE_DEPTH,
+                            SQL_VALIDATION, SQLITE_DB_PATH, TABLE_ROUTER,
+                            TABLE_ROUTER_MIN_CONFIDENCE,
+                            TABLE_ROUTER_MIN_EXAMPLES, TOP_K_RESULTS,
+                            USE_CACHE)
+from nt_chat.db_version import DatabaseVersion
+from nt_chat.fake_llm import FakeChatModel, load_canned_sql
+from nt_chat.intents import IntentMatcher
+from nt_chat.prompts import (_DECIDER_TEMPLATE, DEFAULT_TEMPLATE,
+                             FULL_TEXT_SEARCH_INSTRUCTION, LIKE_INSTRUCTION,
+                             NORMALIZED_COLUMNS_INSTRUCTION,
+                             NORMALIZED_LIKE_RE, PLAIN_LIKE,
+                             PLAY_SUMMARY_INSTRUCTION)
+from nt_chat.renderer import AnswerRenderer
+from nt_chat.result_cache import SQLResultCache
 from nt_chat.sql_chain import SQLDatabaseSequentialChain
+from nt_chat.sql_database import CachedSQLDatabase
+from nt_chat.sql_executor import SQLExecutor, register_functions
+from nt_chat.sql_validator import SQLValidator
+from nt_chat.table_router import TableRouter
 
 debug_mode = True
 
@@ -19,27 +45,63 @@ def db_uri(path: str):
 def make_db(num_sample_rows=2):
     """It is optimal to include a sample of rows from the tables in the prompt
     to allow the LLM to understand the data before providing a final query.
+    The table info (schema and sample rows) is computed once per table subset
+    and recomputed when the database is swapped.
     """
     engine = sqlalchemy.create_engine(db_uri(SQLITE_DB_PATH))
 
     @sqlalchemy.event.listens_for(engine, "connect")
     def recv_connect(connection, _):
-        """This extension is important because it allows us
-        to do a case insensitive search with Greek characters"""
-        connection.enable_load_extension(True)
-        connection.load_extension(UNICODE_PLUGIN_PATH)
-        connection.enable_load_extension(False)
+        register_functions(connection)
 
-    return SQLDatabase(
+    return CachedSQLDatabase(
         engine,
+        version=db_version,
         sample_rows_in_table_info=num_sample_rows,
     )
 
 
+def make_fake_llm(stream=False, manager=None):
+    """Offline LLM with canned responses and simulated latency (LLM_BACKEND=fake)"""
+    return FakeChatModel(
+        callback_manager=manager,
+        canned_sql=fake_canned_sql,
+        streaming=stream,
+        tokens_per_second=FAKE_LLM_TOKENS_PER_SECOND,
+        latency_median=FAKE_LLM_LATENCY_MEDIAN,
+        latency_sigma=FAKE_LLM_LATENCY_SIGMA,
+        top_k=TOP_K_RESULTS,
+        seed=FAKE_LLM_SEED or None,
+    )
+
+
 def make_llm(stream=False, manager=None):
     """Initialize the LLM
     Available models: https://platform.openai.com/docs/models/
     """
+    if CASSETTE_MODE:
+        return make_cassette_llm(stream=stream, manager=manager)
+    return make_backend_llm(stream=stream, manager=manager)
+
+
+def make_cassette_llm(stream=False, manager=None):
+    """Records the responses of the LLM backend, or replays them offline"""
+    if CASSETTE_MODE not in CASSETTE_MODES:
+        raise ValueError(f"Unknown CASSETTE_MODE: {CASSETTE_MODE}")
+    return CassetteChatModel(
+        callback_manager=manager,
+        cassette=cassette,
+        mode=CASSETTE_MODE,
+        llm=make_backend_llm() if CASSETTE_MODE == "record" else None,
+        model_name="fake" if LLM_BACKEND == "fake" else MODEL_NAME,
+        streaming=stream,
+        simulate_latency=CASSETTE_SIMULATE_LATENCY,
+    )
+
+
+def make_backend_llm(stream=False, manager=None):
+    if LLM_BACKEND == "fake":
+        return make_fake_llm(stream=stream, manager=manager)
     return ChatOpenAI(
         temperature=0.01,
         verbose=debug_mode,
@@ -52,9 +114,24 @@ def make_llm(stream=False, manager=None):
 
 
 def make_prompt():
+    # first, as it reflects the database again if it has been swapped
+    usable_table_names = db.get_usable_table_names()
+    template = DEFAULT_TEMPLATE
+    instruction = LIKE_INSTRUCTION
+    if db.full_text_tables:
+        # the database was built with the full-text indexes (create_mini_db.py)
+        instruction = FULL_TEXT_SEARCH_INSTRUCTION
+    elif db.normalized_columns:
+        # the plain LIKE is case- and accent-sensitive for Greek
+        instruction = NORMALIZED_COLUMNS_INSTRUCTION
+    else:
+        template = NORMALIZED_LIKE_RE.sub(PLAIN_LIKE, template)
+    if "play_summary" in usable_table_names:
+        instruction += "\n\n" + PLAY_SUMMARY_INSTRUCTION
+    template = template.replace(LIKE_INSTRUCTION, instruction)
     return PromptTemplate(
         input_variables=["input", "table_info", "dialect", "top_k"],
-        template=DEFAULT_TEMPLATE,
+        template=template,
     )
 
 
@@ -66,8 +143,93 @@ def make_decider_prompt():
     )
 
 
+def make_sql_cache():
+    """Question -> SQL query cache; the entries are invalidated automatically
+    when the database is swapped"""
+    return PersistentCache(
+        CACHE_DB_PATH,
+        "sql",
+        maxsize=CACHE_MAX_SIZE,
+        ttl=CACHE_TTL,
+        version=db_version,
+    )
+
+
+def make_checked_sql_cache():
+    """Generated SQL query -> output of the query checker"""
+    return PersistentCache(
+        CACHE_DB_PATH,
+        "checked_sql",
+        maxsize=CACHE_MAX_SIZE,
+        ttl=CACHE_TTL,
+        version=db_version,
+    )
+
+
+def make_result_cache():
+    """SQL results cache; it is cleared when the database is swapped"""
+    return SQLResultCache(
+        maxbytes=RESULT_CACHE_MAX_BYTES,
+        version=db_version,
+    )
+
+
+def make_sql_executor():
+    """The SQL queries of the chain run in this thread pool, off the event loop;
+    its connections are reopened when the database is swapped"""
+    executor = SQLExecutor(
+        SQLITE_DB_PATH,
+        pool_size=SQL_POOL_SIZE,
+        queue_depth=SQL_QUEUE_DEPTH,
+        mmap_size=SQL_MMAP_SIZE,
+    )
+    db_version.on_swap(executor.swap)
+    return executor
+
+
+def make_sql_validator():
+    """Local validation of the generated SQL, before the query checker"""
+    return SQLValidator(
+        SQLITE_DB_PATH,
+        version=db_version,
+    )
+
+
+def make_table_router():
+    """Local table selection; the LLM decider is the fallback"""
+    return TableRouter(
+        DECIDER_LOG_PATH,
+        min_confidence=TABLE_ROUTER_MIN_CONFIDENCE,
+        min_examples=TABLE_ROUTER_MIN_EXAMPLES,
+    )
+
+
+def make_intent_matcher():
+    """SQL templates for the common questions; the LLM chain is the fallback"""
+    return IntentMatcher(
+        SQLITE_DB_PATH,
+        version=db_version,
+        min_confidence=INTENT_MIN_CONFIDENCE,
+    )
+
+
+def make_answer_renderer():
+    """Local answers for the selected intents, and when the LLM answer is slow"""
+    return AnswerRenderer(LOCAL_ANSWER_INTENTS, timeout=LOCAL_ANSWER_TIMEOUT)
+
+
+db_version = DatabaseVersion(SQLITE_DB_PATH)
 db = make_db()
-prompt = make_prompt()
+fake_canned_sql = load_canned_sql(FAKE_LLM_SQL_PATH) if LLM_BACKEND == "fake" else {}
+cassette = open_cassette(CASSETTE_PATH) if CASSETTE_MODE else None
+sql_cache = make_sql_cache() if USE_CACHE else None
+checked_sql_cache = make_checked_sql_cache() if USE_CACHE else None
+result_cache = make_result_cache() if USE_CACHE else None
+sql_executor = make_sql_executor()
+sql_validator = make_sql_validator() if SQL_VALIDATION else None
+table_router = make_table_router() if TABLE_ROUTER else None
+intent_matcher = make_intent_matcher() if INTENT_TEMPLATES else None
+answer_renderer = make_answer_renderer()
 
 
 def make_chain(stream=False, return_intermediate_steps=False, top_k=TOP_K_RESULTS):
@@ -77,7 +239,15 @@ def make_chain(stream=False, return_intermediate_steps=False, top_k=TOP_K_RESULT
         verbose=True,
         use_query_checker=True,
         return_intermediate_steps=return_intermediate_steps,
-        query_prompt=prompt,
+        query_prompt=make_prompt(),
         top_k=top_k,
         return_direct=False,
+        sql_cache=sql_cache,
+        result_cache=result_cache,
+        sql_executor=sql_executor,
+        sql_validator=sql_validator,
+        checked_sql_cache=checked_sql_cache,
+        table_router=table_router,
+        intent_matcher=intent_matcher,
+        answer_renderer=answer_renderer,
     )
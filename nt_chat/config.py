@@ -1,3 +1,5 @@
+import os
+
 import decouple
 
 TOP_K_RESULTS = 10
@@ -7,7 +9,87 @@ OPENAI_KEY = decouple.config("OPENAI_API_KEY", "")
 # https://platform.openai.com/account/rate-limits
 MODEL_NAME = decouple.config("MODEL_NAME", default="gpt-3.5-turbo")
 SQLITE_DB_PATH = decouple.config("SQLITE_DB_PATH", "")
-UNICODE_PLUGIN_PATH = decouple.config("UNICODE_PLUGIN_PATH", "")
 USE_CACHE = decouple.config("USE_CACHE", default=False, cast=bool)
 MAX_PARALLEL_CALLS = decouple.config("MAX_PARALLEL_CALLS", default=32, cast=int)
 LOGGING_FILE = decouple.config("LOGGING_FILE", default="/app/logs/nt_app.log")
+# Answer cache (SQLite file shared by all workers)
+CACHE_DB_PATH = decouple.config("CACHE_DB_PATH", default="/app/logs/nt_cache.db")
+CACHE_MAX_SIZE = decouple.config("CACHE_MAX_SIZE", default=800, cast=int)
+# in seconds; 0 disables expiration
+CACHE_TTL = decouple.config("CACHE_TTL", default=7 * 24 * 3600, cast=int)
+# In-memory cache of SQL results (per worker)
+RESULT_CACHE_MAX_BYTES = decouple.config(
+    "RESULT_CACHE_MAX_BYTES", default=64 * 1024 * 1024, cast=int
+)
+# SQL execution: read-only connections (one per thread) and the number of
+# queries that can wait for a connection before we reject new ones
+SQL_POOL_SIZE = decouple.config("SQL_POOL_SIZE", default=4, cast=int)
+SQL_QUEUE_DEPTH = decouple.config("SQL_QUEUE_DEPTH", default=32, cast=int)
+SQL_MMAP_SIZE = decouple.config("SQL_MMAP_SIZE", default=256 * 1024 * 1024, cast=int)
+# LLM backend: "openai" or "fake" (offline stand-in for load/latency tests)
+LLM_BACKEND = decouple.config("LLM_BACKEND", default="openai")
+FAKE_LLM_SQL_PATH = decouple.config(
+    "FAKE_LLM_SQL_PATH",
+    default=os.path.join(os.path.dirname(__file__), "fake_llm_sql.json"),
+)
+FAKE_LLM_TOKENS_PER_SECOND = decouple.config(
+    "FAKE_LLM_TOKENS_PER_SECOND", default=50.0, cast=float
+)
+# log-normal latency (seconds) before the first token of every fake LLM call
+FAKE_LLM_LATENCY_MEDIAN = decouple.config(
+    "FAKE_LLM_LATENCY_MEDIAN", default=0.8, cast=float
+)
+FAKE_LLM_LATENCY_SIGMA = decouple.config(
+    "FAKE_LLM_LATENCY_SIGMA", default=0.5, cast=float
+)
+# 0 for a random seed
+FAKE_LLM_SEED = decouple.config("FAKE_LLM_SEED", default=0, cast=int)
+# Record/replay of the LLM responses: "" (off), "record" or "replay"
+CASSETTE_MODE = decouple.config("CASSETTE_MODE", default="")
+CASSETTE_PATH = decouple.config("CASSETTE_PATH", default="/app/logs/nt_cassette.db")
+# replay with the recorded latency instead of instantly
+CASSETTE_SIMULATE_LATENCY = decouple.config(
+    "CASSETTE_SIMULATE_LATENCY", default=False, cast=bool
+)
+# Local table selection instead of the LLM decider; the decider outputs are
+# logged to DECIDER_LOG_PATH and used to train the router's classifier
+TABLE_ROUTER = decouple.config("TABLE_ROUTER", default=True, cast=bool)
+DECIDER_LOG_PATH = decouple.config(
+    "DECIDER_LOG_PATH", default="/app/logs/nt_decider.jsonl"
+)
+TABLE_ROUTER_MIN_CONFIDENCE = decouple.config(
+    "TABLE_ROUTER_MIN_CONFIDENCE", default=0.9, cast=float
+)
+TABLE_ROUTER_MIN_EXAMPLES = decouple.config(
+    "TABLE_ROUTER_MIN_EXAMPLES", default=20, cast=int
+)
+# Validate the generated SQL locally and only call the query checker LLM
+# for the queries that fail
+SQL_VALIDATION = decouple.config("SQL_VALIDATION", default=True, cast=bool)
+# SQL templates for the common questions (plays of an actor, works of an
+# author etc.), which skip the decider, SQL generation and checker calls
+INTENT_TEMPLATES = decouple.config("INTENT_TEMPLATES", default=True, cast=bool)
+INTENT_MIN_CONFIDENCE = decouple.config(
+    "INTENT_MIN_CONFIDENCE", default=0.6, cast=float
+)
+# Intents (see nt_chat/intents.py) whose answer is rendered locally instead of
+# by the final LLM call; comma separated, empty for none
+LOCAL_ANSWER_INTENTS = decouple.config(
+    "LOCAL_ANSWER_INTENTS",
+    default=(
+        "author_of_work,works_by_author,plays_by_author,plays_with_actor,"
+        "plays_by_director,plays_of_person,play_media,plays_by_title,plays_in_years,"
+        "latest_plays"
+    ),
+    cast=decouple.Csv(),
+)
+# Seconds to wait for the first token of the LLM answer before the answer is
+# rendered locally instead (degraded mode); 0 to always wait for the LLM
+LOCAL_ANSWER_TIMEOUT = decouple.config(
+    "LOCAL_ANSWER_TIMEOUT", default=10.0, cast=float
+)
+# Hot swap of the database: seconds between the checks for a new file at
+# SQLITE_DB_PATH (0 disables the watcher; POST /admin/db/reload still works)
+DB_WATCH_INTERVAL = decouple.config("DB_WATCH_INTERVAL", default=10.0, cast=float)
+# Token of the admin endpoints (X-Admin-Token header); empty disables them
+ADMIN_TOKEN = decouple.config("ADMIN_TOKEN", default="")
@@ -0,0 +1,116 @@
+"""The version of the database that the chat service serves, and its hot swap.
+
+A rebuilt database is deployed by replacing the file at SQLITE_DB_PATH
+atomically (e.g., mv minimal_nt.db.new minimal_nt.db on the same filesystem),
+or by updating it in place (create_mini_db.py --delta). The watcher (or the
+admin endpoint) notices the new file, opens new SQL connections to it and
+then switches the version. Every DB-derived cache (table info, SQL queries,
+SQL results, answers...) is keyed on this version, so they are all
+invalidated in one step. The queries that are still running finish on the
+connections to the old file, which are closed afterwards.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from nt_chat.cache import db_fingerprint
+from nt_chat.metrics import DB_SWAPS
+
+logger = logging.getLogger(__name__)
+
+
+def check_database(db_path):
+    """Raises sqlite3.DatabaseError if the file is not a usable SQLite database"""
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        result = connection.execute("PRAGMA quick_check").fetchone()[0]
+        if result != "ok":
+            raise sqlite3.DatabaseError(f"quick_check: {result}")
+        if not connection.execute("SELECT 1 FROM sqlite_master").fetchone():
+            raise sqlite3.DatabaseError("The database has no tables")
+    finally:
+        connection.close()
+
+
+class DatabaseVersion:
+    """The content hash of the served database; call it to get the version
+    (it is the version callable of the caches).
+
+    check() swaps to the file at db_path if it has changed: the on_swap
+    callbacks run first (e.g., SQLExecutor.swap), then the version changes.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        try:
+            self._file = self._file_stat()
+            self.version = db_fingerprint(db_path)
+        except FileNotFoundError:
+            # check() swaps to the file once it is created
+            logger.warning("The database %r does not exist yet", db_path)
+            self._file = None
+            self.version = None
+        self.swapped_at = time.time()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self.version
+
+    def _file_stat(self):
+        # a replaced file has a new inode, an updated one a new mtime
+        stat = os.stat(self.db_path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def on_swap(self, callback):
+        """Registers a function that is called before the version changes"""
+        self._callbacks.append(callback)
+
+    def check(self):
+        """Swaps to the database file if it has changed; returns whether it did.
+        Raises sqlite3.DatabaseError (and keeps the current version) if the new
+        file is not a valid database"""
+        with self._lock:
+            try:
+                file_stat = self._file_stat()
+            except FileNotFoundError:
+                # e.g., between the two steps of a non-atomic replacement
+                return False
+            if file_stat == self._file:
+                return False
+            self._file = file_stat
+            version = db_fingerprint(self.db_path)
+            if version == self.version:
+                return False
+            try:
+                check_database(self.db_path)
+            except sqlite3.DatabaseError:
+                DB_SWAPS.labels("rejected").inc()
+                raise
+            for callback in self._callbacks:
+                callback()
+            self.version = version
+            self.swapped_at = time.time()
+            DB_SWAPS.labels("swapped").inc()
+            logger.info("Swapped to %s (version %s)", self.db_path, version)
+            return True
+
+    async def watch(self, interval):
+        """Checks the database file every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.check)
+            except sqlite3.DatabaseError as e:
+                logger.error("Not swapping to %s: %s", self.db_path, e)
+
+    def info(self):
+        return {
+            "path": self.db_path,
+            "version": self.version,
+            "swapped_at": self.swapped_at,
+        }
@@ -0,0 +1,173 @@
+"""Offline stand-in for ChatOpenAI, for deterministic load and latency tests.
+
+Set LLM_BACKEND=fake to use it. It recognizes the prompts of the SQL chain
+(decider, SQL generation, query checker and final answer) and returns:
+- the tables and SQL query of the question from FAKE_LLM_SQL_PATH (a JSON
+  file {question: {"sql": ..., "tables": [...]}}, keyed on the normalized
+  question), or a default query if the question is unknown,
+- the query itself for the query checker,
+- a short answer built from the SQL result.
+Every call waits for a latency drawn from a log-normal distribution and then
+streams the tokens at a fixed rate, so that we can measure the capacity of
+our own code without network access or OpenAI quota.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import (AsyncCallbackManagerForLLMRun,
+                                      CallbackManagerForLLMRun)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import (ChatGeneration, ChatGenerationChunk,
+                                    ChatResult)
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from nt_chat.cache import normalize_query
+
+DEFAULT_SQL = (
+    "SELECT plays.playTitle, plays.yearStarted, plays.yearEnded, plays.playURL "
+    "FROM plays ORDER BY plays.yearEnded DESC LIMIT {top_k};"
+)
+DEFAULT_TABLES = ["plays"]
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+def load_canned_sql(path):
+    """Reads {question: {"sql": ..., "tables": [...]}} and normalizes the keys"""
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as canned_file:
+        canned = json.load(canned_file)
+    return {normalize_query(question): entry for question, entry in canned.items()}
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that answers the prompts of the SQL chain without an API"""
+
+    canned_sql: Dict[str, Dict[str, Any]] = {}
+    """Normalized question -> {"sql": ..., "tables": [...]}"""
+    streaming: bool = False
+    tokens_per_second: float = 50.0
+    latency_median: float = 0.8
+    """Median latency before the first token (seconds)"""
+    latency_sigma: float = 0.5
+    """Sigma of the log-normal latency distribution (0: fixed latency)"""
+    top_k: int = 10
+    seed: Optional[int] = None
+    _random: random.Random = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _latency(self) -> float:
+        if self.latency_median <= 0:
+            return 0.0
+        return self.latency_median * self._random.lognormvariate(
+            0, self.latency_sigma
+        )
+
+    def _canned(self, question: str) -> Dict[str, Any]:
+        return self.canned_sql.get(normalize_query(question), {})
+
+    def _respond(self, prompt: str) -> str:
+        """Recognizes the prompt of the chain and returns a canned response"""
+        if prompt.rstrip().endswith("Relevant Table Names:"):
+            # decider
+            question = prompt.split("Question: ", 1)[-1].split("\n\nTable Names:")[0]
+            return ", ".join(self._canned(question).get("tables", DEFAULT_TABLES))
+        if "Double check the" in prompt:
+            # query checker: reproduce the original query
+            return prompt.split("\nDouble check the", 1)[0].strip()
+        question_and_steps = prompt.rsplit("Question: ", 1)[-1]
+        question, _, steps = question_and_steps.partition("\nSQLQuery:")
+        if "\nSQLResult:" not in steps:
+            # SQL generation
+            return self._canned(question).get(
+                "sql", DEFAULT_SQL.format(top_k=self.top_k)
+            )
+        result = steps.split("\nSQLResult:", 1)[1].rsplit("\nAnswer:", 1)[0].strip()
+        if not result:
+            return "Δεν βρέθηκαν αποτελέσματα στο αρχείο."
+        return f"Βρήκα τα εξής αποτελέσματα στο αρχείο: {result}"
+
+    @staticmethod
+    def _prompt(messages: List[BaseMessage]) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def _chunks(self, text: str) -> List[ChatGenerationChunk]:
+        return [
+            ChatGenerationChunk(message=AIMessageChunk(content=token))
+            for token in _TOKEN_RE.findall(text)
+        ]
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._latency())
+        for chunk in self._chunks(self._respond(self._prompt(messages))):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            time.sleep(1 / self.tokens_per_second)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._latency())
+        for chunk in self._chunks(self._respond(self._prompt(messages))):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            await asyncio.sleep(1 / self.tokens_per_second)
+
+    def _result(self, text: str) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=text))],
+            llm_output={"token_usage": {"completion_tokens": len(self._chunks(text))}},
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            chunks = self._stream(messages, stop, run_manager, **kwargs)
+            return self._result("".join(chunk.text for chunk in chunks))
+        time.sleep(self._latency())
+        return self._result(self._respond(self._prompt(messages)))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            text = ""
+            async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+                text += chunk.text
+            return self._result(text)
+        await asyncio.sleep(self._latency())
+        return self._result(self._respond(self._prompt(messages)))
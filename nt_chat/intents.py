@@ -0,0 +1,403 @@
+"""Template fast path for the most common questions.
+
+Most questions (see the "Σενάρια" of the README and test_prompt_list) have a
+few shapes: plays or works of an author, plays of a director, plays with an
+actor, the media of a play, plays of a year range, the latest plays. For
+these, the intent and its slots are extracted locally, the entity names are
+resolved against the database (people, play and work titles) and a SQL
+template is filled with the resolved IDs, so that the decider, the SQL
+generation and the query checker calls are skipped. Anything else (unknown
+names, venues, countries, counts...) goes to the LLM chain.
+"""
+
+import datetime
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from nt_chat.cache import normalize_query
+from nt_chat.sql_executor import connect_read_only
+
+IntentMatch = namedtuple(
+    "IntentMatch", ["intent", "sql_cmd", "table_names", "confidence", "slots"]
+)
+
+# Words that are never (part of) an entity name (normalized, e.g., ς -> σ)
+STOPWORDS = set(
+    normalize_query(
+        """
+    α αν απο αυτα αυτη βρες για δειξε δω ε εθ εθνικο εθνικου ειναι εμφανισε
+    ενα εξης εχει εχετε εχουν η θα θελω και κανει καποιο κατα μαζι με μια
+    μου μπορεις να ο οι ολες ολα οποια οποιες ποια ποιες ποιο ποιοι ποιος
+    ποσες που πως σε σου στα στη στην στις στο στον στους τα την της τη τι
+    τις το τον του τους των υπαρχει υπαρχουν ψαχνω ως μεχρι εως ειδα ακουσα
+    θεατρο θεατρου καλημερα γεια ιδιος ιδια εχω
+    """
+    ).split()
+)
+
+
+def _stems_re(stems):
+    # the stems are matched at the start of a word; "ξανά-" is ignored
+    stems = [normalize_query(s) for s in stems]
+    return re.compile(r"\b(?:ξανα)?(?:%s)" % "|".join(stems))
+
+
+# Cues on the normalized question
+_CUES = {
+    "actor": _stems_re("ηθοποι επαιξ παιζ παιξ πρωταγωνιστ ερμηνευ".split()),
+    "author": _stems_re("εγραψ γραψ συγγραφ ποιητ δραματουργ".split()),
+    "director": _stems_re(["σκηνοθε"]),
+    # an actor cue too, but only the leading roles (actors.protagonist)
+    "protagonist": _stems_re(["πρωταγωνιστ"]),
+    "play": _stems_re("παραστασ ανεβ παρουσια παιχτ".split()),
+    "work": _stems_re(["εργ"]),
+    "latest": _stems_re(["τελευται", "πιο προσφατ", "προσφατ"]),
+}
+# Questions that the templates don't cover
+_UNSUPPORTED_RE = _stems_re(
+    (
+        "περιοδει εξωτερικ χωρ επιδαυρ ρεβω τσιλλερ σκηνη σκηνες σκηνικ ποσες "
+        "ποσοι ποσα περισσοτερ λιγοτερ ρολ μαζι ομωνυμ πληροφορ ελληνικ ισπανικ "
+        "αγγλικ γαλλικ γερμανικ ιταλικ ρωσικ αρχαι βασιζ βιβλι φετος αλλ "
+        "σκηνογραφ μακετ τι εισαι"
+    ).split()
+)
+# media word stems -> plays columns
+_MEDIA = {
+    "φωτογραφ": ["photosURL"],
+    "φωτο": ["photosURL"],
+    "βιντεο": ["videosURL"],
+    "μαγνητοσκοπ": ["videosURL"],
+    "ηχ": ["soundsURL"],
+    "αφισ": ["postersURL"],
+    "ποστερ": ["postersURL"],
+    "προγραμμ": ["programsURL"],
+    "κοστουμ": ["costumesURL"],
+    "παρτιτουρ": ["musicSheetsURL"],
+    "μουσικ": ["musicSheetsURL"],
+    "δημοσιευ": ["publicationsURL"],
+    "εκδοσ": ["publicationsURL"],
+    # ο/α (οπτικοακουστικό) υλικό
+    "υλικ": ["photosURL", "videosURL", "soundsURL"],
+}
+_MEDIA_RE = re.compile(r"\b(%s)" % "|".join(_MEDIA))
+_YEAR_RE = re.compile(r"\b(1[89]\d\d|20\d\d)\b")
+_DECADE_RE = re.compile(r"\bδεκαετια(?:σ)? του (?:19)?([1-9]0)\b")
+_PERIODS = {
+    "τριετι": 3,
+    "τετραετι": 4,
+    "πενταετι": 5,
+    "δεκαετι": 10,
+    "εικοσαετι": 20,
+}
+_LAST_PERIOD_RE = re.compile(
+    r"\bτελευται\w* (?:(\d+) (?:χρονια|ετη)|(\d+)ετι\w*|(%s)\w*)"
+    % "|".join(_PERIODS)
+)
+_PLAY_COLUMNS = ["playTitle", "yearStarted", "yearEnded", "playURL"]
+# If a surname matches more people than this, the confidence drops
+_MAX_PEOPLE = 3
+
+
+def stem(token):
+    """Drops the Greek inflection, e.g., Παξινού/Καραθάνου/Καραθάνος"""
+    token = token.rstrip("σ")
+    stripped = token.rstrip("αεηιουω")
+    if len(token) - len(stripped) > 2:
+        stripped = token[:-2]
+    return stripped if len(stripped) >= 3 else token
+
+
+def _stems(text):
+    return tuple(stem(token) for token in normalize_query(text).split())
+
+
+class EntityIndex:
+    """People (by surname) and play/work titles of the database"""
+
+    def __init__(self, connection):
+        # surname stem -> [(personID, stems of the other names)]
+        self.people = defaultdict(list)
+        for person_id, name in connection.execute(
+            "SELECT personID, personName FROM people WHERE personName IS NOT NULL"
+        ):
+            stems = _stems(name)
+            if stems and len(stems[-1]) >= 3:
+                self.people[stems[-1]].append((person_id, set(stems[:-1])))
+        self.plays = self._titles(connection, "SELECT playID, playTitle FROM plays")
+        self.works = self._titles(connection, "SELECT workID, workTitle FROM works")
+        self.max_title_length = max(
+            [len(title) for title in list(self.plays) + list(self.works)] or [0]
+        )
+
+    @staticmethod
+    def _titles(connection, query):
+        titles = defaultdict(list)
+        for title_id, title in connection.execute(query):
+            stems = _stems(title or "")
+            # single stopwords (e.g., "Η") are not titles
+            if stems and not (len(stems) == 1 and stems[0] in STOPWORDS):
+                titles[stems].append(title_id)
+        return titles
+
+
+class IntentMatcher:
+    """Extracts the intent and the slots of a question and fills a SQL template.
+
+    The entities are read from the database and read again when the version
+    (e.g., the content hash of the database) changes.
+    """
+
+    def __init__(self, db_path, version=None, min_confidence=0.6):
+        self.db_path = db_path
+        self.version = version
+        self.min_confidence = min_confidence
+        self._index = None
+        self._cached_version = None
+        self._lock = threading.Lock()
+
+    def _entity_index(self):
+        version = self.version() if callable(self.version) else self.version
+        with self._lock:
+            if self._index is None or version != self._cached_version:
+                connection = connect_read_only(self.db_path)
+                try:
+                    self._index = EntityIndex(connection)
+                finally:
+                    connection.close()
+                self._cached_version = version
+            return self._index
+
+    def _find_titles(self, tokens, stems, titles, consumed):
+        """Longest (stemmed) title n-grams of the question"""
+        found = []
+        index = self._entity_index()
+        i = 0
+        while i < len(stems):
+            for n in range(min(index.max_title_length, len(stems) - i), 0, -1):
+                ngram = tuple(stems[i : i + n])
+                if ngram in titles and not all(
+                    tokens[j] in STOPWORDS for j in range(i, i + n)
+                ):
+                    found.extend(titles[ngram])
+                    consumed.update(range(i, i + n))
+                    i += n - 1
+                    break
+            i += 1
+        return found
+
+    def _find_people(self, tokens, stems, consumed):
+        """personIDs of the surnames of the question (filtered by first name)"""
+        people = self._entity_index().people
+        # token index -> candidates, filtered by the other names if possible
+        surnames = {}
+        first_names = set()
+        for i, (token, token_stem) in enumerate(zip(tokens, stems)):
+            if i in consumed or token in STOPWORDS or token_stem not in people:
+                continue
+            candidates = people[token_stem]
+            # "Νίκος Καραθάνος" vs "Σωτ. Καραθάνος"
+            other_stems = set(stems[:i]) | set(stems[i + 1 :])
+            named = [c for c in candidates if c[1] & other_stems]
+            if named:
+                candidates = named
+                first_names.update(
+                    j for j in range(len(stems)) if j != i and stems[j] in named[0][1]
+                )
+            surnames[i] = candidates
+        found = []
+        for i, candidates in surnames.items():
+            # "Μαρίζα Ρίζου": Μαρίζα is a first name, not the surname Μάριζας
+            if i in first_names:
+                continue
+            found.extend(person_id for person_id, _ in candidates)
+        consumed.update(surnames)
+        consumed.update(first_names)
+        return found
+
+    @staticmethod
+    def _years(question):
+        """(first year, last year) of the question, or None"""
+        match = _LAST_PERIOD_RE.search(question)
+        if match:
+            count, count_prefix, period = match.groups()
+            years = int(count or count_prefix or 0) or _PERIODS[period]
+            current_year = datetime.date.today().year
+            return current_year - years + 1, current_year
+        match = _DECADE_RE.search(question)
+        if match:
+            decade = 1900 + int(match.group(1))
+            return decade, decade + 9
+        years = [int(year) for year in _YEAR_RE.findall(question)]
+        if years:
+            return min(years), max(years)
+        return None
+
+    def match(self, question, top_k=10):
+        """Returns an IntentMatch, or None if the LLM chain should be used"""
+        normalized = normalize_query(question)
+        if not normalized or _UNSUPPORTED_RE.search(normalized):
+            return None
+        tokens = normalized.split()
+        stems = [stem(token) for token in tokens]
+        cues = {name for name, cue_re in _CUES.items() if cue_re.search(normalized)}
+        media = []
+        for media_stem in _MEDIA_RE.findall(normalized):
+            media.extend(c for c in _MEDIA[media_stem] if c not in media)
+        years = self._years(normalized)
+
+        # Words that are cues are not part of entity names
+        consumed = {
+            i
+            for i, token in enumerate(tokens)
+            if any(cue_re.match(token) for cue_re in _CUES.values())
+            or _MEDIA_RE.match(token)
+            or _YEAR_RE.match(token)
+            or token.isdigit()
+        }
+        index = self._entity_index()
+        if "author" in cues and "work" in cues and not ("play" in cues or media):
+            # "ποιος είναι ο συγγραφέας του έργου Αμφιτρύων"
+            works = self._find_titles(tokens, stems, index.works, consumed)
+            plays, people = [], self._find_people(tokens, stems, consumed)
+        else:
+            works = []
+            people = self._find_people(tokens, stems, consumed)
+            plays = self._find_titles(tokens, stems, index.plays, consumed)
+
+        # Every other word must be known, otherwise an entity was not resolved
+        unknown = [
+            token
+            for i, token in enumerate(tokens)
+            if i not in consumed
+            and token not in STOPWORDS
+            and not (years and re.fullmatch(r"\d+\w*|δεκαετι\w*|χρονια|ετη", token))
+            and len(token) > 2
+            and not _LAST_PERIOD_RE.match(" ".join(tokens[i - 1 : i + 2]))
+        ]
+        if unknown:
+            return None
+        num_people = len(set(people))
+        confidence = min(1.0, _MAX_PEOPLE / num_people) if num_people else 1.0
+        slots = {"people": people, "plays": plays, "works": works, "years": years}
+        match = self._template(cues, slots, media, top_k)
+        if match is None or confidence < self.min_confidence:
+            return None
+        intent, sql_cmd, table_names = match
+        return IntentMatch(intent, sql_cmd, table_names, confidence, slots)
+
+    @staticmethod
+    def _template(cues, slots, media, top_k):
+        """(intent, SQL, tables) for the cues and slots, or None"""
+        people, plays, works, years = (
+            slots["people"],
+            slots["plays"],
+            slots["works"],
+            slots["years"],
+        )
+        columns = _PLAY_COLUMNS + media
+        joins = []
+        conditions = []
+        tables = {"plays"}
+        extra_columns = []
+
+        if works and not people and not plays:
+            if not ("author" in cues and "work" in cues):
+                return None
+            return (
+                "author_of_work",
+                "SELECT DISTINCT people.personName, people.personURL, "
+                "works.workTitle, works.workYear, works.workURL\n"
+                "FROM works\n"
+                "JOIN authors ON works.workID = authors.workID\n"
+                "JOIN people ON authors.personID = people.personID\n"
+                f"WHERE works.workID IN ({_ids(works)})\n"
+                f"LIMIT {top_k};",
+                ["authors", "people", "works"],
+            )
+        if people and plays:
+            return None
+        if people:
+            if "author" in cues or ("work" in cues and not cues & {"actor", "director"}):
+                if not ("play" in cues or media or years):
+                    return (
+                        "works_by_author",
+                        "SELECT DISTINCT works.workTitle, works.workYear, "
+                        "works.workURL\n"
+                        "FROM works\n"
+                        "JOIN authors ON works.workID = authors.workID\n"
+                        f"WHERE authors.personID IN ({_ids(people)})\n"
+                        f"LIMIT {top_k};",
+                        ["authors", "works"],
+                    )
+                intent = "plays_by_author"
+                joins = [
+                    "JOIN playworks ON plays.playID = playworks.playID",
+                    "JOIN authors ON playworks.workID = authors.workID",
+                ]
+                conditions.append(f"authors.personID IN ({_ids(people)})")
+                tables |= {"playworks", "authors"}
+            elif "actor" in cues:
+                intent = "plays_with_actor"
+                joins = [
+                    "JOIN actors ON plays.playID = actors.playID",
+                    "JOIN people ON actors.personID = people.personID",
+                ]
+                conditions.append(f"actors.personID IN ({_ids(people)})")
+                if "protagonist" in cues:
+                    conditions.append("actors.protagonist = 1")
+                extra_columns = ["people.personName"]
+                tables |= {"actors", "people"}
+            elif "director" in cues:
+                intent = "plays_by_director"
+                joins = ["JOIN people ON plays.directorID = people.personID"]
+                conditions.append(f"plays.directorID IN ({_ids(people)})")
+                extra_columns = ["people.personName"]
+                tables.add("people")
+            elif "play" in cues or media:
+                # "παραστάσεις του Μπινιάρη" (director), "παραστάσεις με την
+                # Παξινού" (actor): without a role cue, the person may be either
+                intent = "plays_of_person"
+                joins = [f"JOIN people ON people.personID IN ({_ids(people)})"]
+                conditions.append(
+                    "(plays.directorID = people.personID OR plays.playID IN "
+                    "(SELECT actors.playID FROM actors "
+                    "WHERE actors.personID = people.personID))"
+                )
+                extra_columns = ["people.personName"]
+                tables |= {"actors", "people"}
+            else:
+                return None
+        elif plays:
+            if cues & {"actor", "author", "director"}:
+                return None
+            intent = "play_media" if media else "plays_by_title"
+            conditions.append(f"plays.playID IN ({_ids(plays)})")
+        elif years:
+            intent = "plays_in_years"
+        elif "latest" in cues and ("play" in cues or media):
+            intent = "latest_plays"
+        else:
+            return None
+
+        if years:
+            conditions.append(
+                f"plays.yearStarted <= {years[1]} AND plays.yearEnded >= {years[0]}"
+            )
+        if media and not plays:
+            # "υπάρχουν βίντεο από παραστάσεις ...": only the plays with media
+            conditions.append(
+                "(%s)" % " OR ".join(f"plays.{c} IS NOT NULL" for c in media)
+            )
+        select = ", ".join(extra_columns + [f"plays.{c}" for c in columns])
+        sql_lines = [f"SELECT DISTINCT {select}", "FROM plays"] + joins
+        if conditions:
+            sql_lines.append("WHERE " + " AND ".join(conditions))
+        sql_lines.append("ORDER BY plays.yearEnded DESC, plays.yearStarted DESC")
+        sql_lines.append(f"LIMIT {top_k};")
+        return intent, "\n".join(sql_lines), sorted(tables)
+
+
+def _ids(ids):
+    return ", ".join(str(int(i)) for i in sorted(set(ids)))
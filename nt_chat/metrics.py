@@ -0,0 +1,206 @@
+"""Prometheus metrics of the chat service, exposed on /metrics.
+
+The LLM calls of the SQL chains are tagged with their stage (decider,
+sql_generation, query_checker and FINAL_RESULT for the answer) and the SQL
+execution is reported as a custom "sql_execution" event, so that
+MetricsCallbackHandler can time every stage of a request. An answer that is
+rendered locally (see nt_chat/renderer.py) is sent as a "local_answer" event.
+"""
+
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# LLM stage tags used in sql_chain.py
+DECIDER_TAG = "decider"
+SQL_GENERATION_TAG = "sql_generation"
+QUERY_CHECKER_TAG = "query_checker"
+FINAL_RESULT_TAG = "FINAL_RESULT"
+SQL_EXECUTION_EVENT = "sql_execution"
+LOCAL_ANSWER_EVENT = "local_answer"
+
+_LLM_STAGES = {
+    DECIDER_TAG: "decider",
+    SQL_GENERATION_TAG: "sql_generation",
+    QUERY_CHECKER_TAG: "query_checker",
+    FINAL_RESULT_TAG: "answer",
+}
+# LLM calls take seconds, the SQL queries milliseconds
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 140)
+
+STAGE_SECONDS = Histogram(
+    "nt_stage_seconds",
+    "Latency of each stage of a request",
+    ["stage"],
+    buckets=_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "nt_time_to_first_token_seconds",
+    "Time from the start of a request to the first token of the answer",
+    buckets=_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "nt_request_seconds",
+    "Total time to answer a request",
+    ["endpoint"],
+    buckets=_BUCKETS,
+)
+SEMAPHORE_WAIT_SECONDS = Histogram(
+    "nt_semaphore_wait_seconds",
+    "Time spent waiting for the concurrent calls semaphore",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+LLM_TOKENS = Counter(
+    "nt_llm_tokens",
+    "LLM tokens per stage; streamed tokens count as completion tokens",
+    ["stage", "kind"],
+)
+REQUESTS = Counter(
+    "nt_requests", "Handled requests per endpoint and outcome", ["endpoint", "outcome"]
+)
+QUERY_CHECKS = Counter(
+    "nt_query_checks",
+    "Query checker calls: avoided (valid SQL), cached (known fix) or called",
+    ["result"],
+)
+TABLE_ROUTES = Counter(
+    "nt_table_routes",
+    "Table selections per source: rules, classifier or the LLM decider (llm)",
+    ["source"],
+)
+INTENTS = Counter(
+    "nt_intents",
+    "Questions answered with a SQL template per intent, or by the LLM (llm)",
+    ["intent"],
+)
+ANSWERS = Counter(
+    "nt_answers",
+    "Answers per source: llm, local (rendered for the intent) or degraded "
+    "(rendered locally because the LLM was slow)",
+    ["source"],
+)
+DB_SWAPS = Counter(
+    "nt_db_swaps",
+    "Database hot swaps: swapped, or rejected (the new file is not a valid database)",
+    ["result"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "nt_requests_in_flight", "Requests currently being answered", ["endpoint"]
+)
+
+
+def llm_stage(tags):
+    """Maps the tags of an LLM call to its stage"""
+    for tag in reversed(tags or []):
+        if tag in _LLM_STAGES:
+            return _LLM_STAGES[tag]
+    return "other"
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Times the stages of one request; create one handler per request"""
+
+    run_inline = True
+
+    def __init__(self):
+        super().__init__()
+        self.start_time = time.perf_counter()
+        self.first_token_time = None
+        # run_id -> [stage, start time, streamed tokens]
+        self._llm_runs = {}
+        # run_id -> stage of the LLMChains; get_child(tag) doesn't pass the
+        # tag on to the LLM, so the LLM runs take the stage of their parent
+        self._chain_stages = {}
+
+    def _start_llm(self, run_id, parent_run_id, tags):
+        stage = llm_stage(tags)
+        if stage == "other":
+            stage = self._chain_stages.get(parent_run_id, stage)
+        self._llm_runs[run_id] = [stage, time.perf_counter(), 0]
+
+    def on_chain_start(self, serialized, inputs, *, run_id, tags=None, **kwargs):
+        stage = llm_stage(tags)
+        if stage != "other":
+            self._chain_stages[run_id] = stage
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._chain_stages.pop(run_id, None)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._chain_stages.pop(run_id, None)
+
+    def on_llm_start(
+        self, serialized, prompts, *, run_id, parent_run_id=None, tags=None, **kwargs
+    ):
+        self._start_llm(run_id, parent_run_id, tags)
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id, parent_run_id=None, tags=None, **kwargs
+    ):
+        self._start_llm(run_id, parent_run_id, tags)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._llm_runs.get(run_id)
+        if run is None:
+            return
+        run[2] += 1
+        if run[0] == "answer" and self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+            TIME_TO_FIRST_TOKEN_SECONDS.observe(self.first_token_time - self.start_time)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._llm_runs.pop(run_id, None)
+        if run is None:
+            return
+        stage, start_time, streamed_tokens = run
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start_time)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        LLM_TOKENS.labels(stage, "prompt").inc(usage.get("prompt_tokens", 0))
+        LLM_TOKENS.labels(stage, "completion").inc(
+            usage.get("completion_tokens", streamed_tokens)
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._llm_runs.pop(run_id, None)
+
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        if name == SQL_EXECUTION_EVENT:
+            STAGE_SECONDS.labels("sql_execution").observe(data["seconds"])
+        elif name == LOCAL_ANSWER_EVENT and self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+            TIME_TO_FIRST_TOKEN_SECONDS.observe(self.first_token_time - self.start_time)
+
+
+class CacheCollector:
+    """Exposes the counters of the caches (see PersistentCache.stats and
+    SQLResultCache.stats)"""
+
+    def __init__(self, caches):
+        self.caches = caches
+
+    def collect(self):
+        lookups = CounterMetricFamily(
+            "nt_cache_lookups",
+            "Cache lookups per cache and result",
+            labels=["cache", "result"],
+        )
+        saved = GaugeMetricFamily(
+            "nt_cache_saved_seconds",
+            "SQL execution time saved by the cache",
+            labels=["cache"],
+        )
+        for name, cache in self.caches.items():
+            lookups.add_metric([name, "hit"], cache.hits)
+            lookups.add_metric([name, "miss"], cache.misses)
+            if hasattr(cache, "saved_seconds"):
+                saved.add_metric([name], cache.saved_seconds)
+        yield lookups
+        yield saved
+
+
+def register_caches(caches):
+    """Registers the (enabled) caches, e.g., {"answers": cache, "sql": None}"""
+    enabled = {name: cache for name, cache in caches.items() if cache is not None}
+    REGISTRY.register(CacheCollector(enabled))
@@ -1,3 +1,5 @@
+import re
+
 # You can order the results by a relevant column to return the most interesting examples in the database.
 # You must format the final response into complete user-friendly sentences.
 # Always return only the results found in the database, without adding or subtracting information.
@@ -21,7 +23,7 @@ If the query result is empty, respond that you did not find results in the archi
 The user can request information about: plays, works (i.e., the books the plays were based on), venue (plays.venue), and people (e.g., actors, authors, directors).
 If there are questions regarding a person, provide the personURL.
 
-To request the writer of a play, look for works.workTitle instead of plays.playTitle (for instance, WHERE works.workTitle LIKE '%Αμφιτρύων%').
+To request the writer of a play, look for works.workTitle instead of plays.playTitle (for instance, WHERE works.workTitleNormalized LIKE '%' || nt_normalize('Αμφιτρύων') || '%').
 Ιf you need to join works and plays tables, use the playworks table to match playID with workID.
 Order by plays.yearEnded DESC.
 If the results are null, respond that you don't have that information.
@@ -49,7 +51,7 @@ SELECT w.workTitle, w.workYear, w.workURL
 FROM authors a
 JOIN people p ON a.personID = p.personID
 JOIN works w ON a.workID = w.workID
-WHERE p.personName LIKE '%Σαίξπηρ%'
+WHERE p.personNameNormalized LIKE '%' || nt_normalize('Σαίξπηρ') || '%'
 LIMIT {top_k};
 
 Similarly, if the play title contains a genitive form with a proper name, this belongs to the director (plays.directorID).
@@ -58,7 +60,7 @@ For example, "θέλω να δω παραστάσεις του Μπινιάρη"
 SELECT p.personName, pl.playTitle, pl.playURL, pl.yearStarted
 FROM people p
 JOIN plays pl ON pl.directorID = p.personID
-WHERE p.personName LIKE '%Μπινιάρης%'
+WHERE p.personNameNormalized LIKE '%' || nt_normalize('Μπινιάρης') || '%'
 LIMIT {top_k};
 
 If the user asks where a proper name has played ("πού έχει πάιξει"), assume that the proper name is an actor and that the user is asking about plays.
@@ -75,6 +77,29 @@ Question: {input}
 """
 # Do not suggest follow-up questions because you have no chat context.
 
+# The title/name examples of DEFAULT_TEMPLATE query the normalized columns;
+# they are rewritten to a plain LIKE for a database without them
+NORMALIZED_LIKE_RE = re.compile(
+    r"(\w+)Normalized LIKE '%' \|\| nt_normalize\('([^']*)'\) \|\| '%'"
+)
+PLAIN_LIKE = r"\1 LIKE '%\2%'"
+
+# Replace LIKE_INSTRUCTION if the database has the full-text indexes or the
+# normalized columns of create_mini_db.py; both contain normalized text (no
+# accents, lowercase), hence nt_normalize
+LIKE_INSTRUCTION = """Query using LIKE when querying for plays.playTitle, works.workTitle, people.personName."""
+FULL_TEXT_SEARCH_INSTRUCTION = """Query plays.playTitle, works.workTitle and people.personName with the full-text indexes plays_fts, works_fts and people_fts instead of LIKE. Their rowid is the playID, workID and personID respectively, and the searched text must be wrapped in nt_normalize() followed by || '*', for instance:
+WHERE people.personID IN (SELECT rowid FROM people_fts WHERE people_fts = nt_normalize('Σαίξπηρ') || '*')
+WHERE plays.playID IN (SELECT rowid FROM plays_fts WHERE plays_fts = nt_normalize('Αμφιτρύων') || '*')"""
+NORMALIZED_COLUMNS_INSTRUCTION = """Query plays.playTitleNormalized, works.workTitleNormalized and people.personNameNormalized (instead of plays.playTitle, works.workTitle and people.personName) using LIKE, and wrap the searched text in nt_normalize(), for instance:
+WHERE people.personNameNormalized LIKE '%' || nt_normalize('Σαίξπηρ') || '%'
+If the searched text is the beginning of the title or name, prefer a prefix pattern with the text already normalized (lowercase, without accents, σ instead of ς), which is much faster, for instance:
+WHERE plays.playTitleNormalized LIKE 'αμφιτρυων%'"""
+# Added after the title/name instruction if the database has the play_summary
+# table of create_mini_db.py
+PLAY_SUMMARY_INSTRUCTION = """For questions about plays, their director, works or authors, prefer the play_summary table (one row per play) to joining plays, playworks, works, authors and people. It has the playTitle, playURL, yearStarted, yearEnded, venue, directorName, directorURL, the workTitles and authorNames of the play separated by a hashtag, hasMedia and the media URLs. Query its Normalized columns using LIKE, wrapping the searched text in nt_normalize(), for instance:
+SELECT play_summary.playTitle, play_summary.yearStarted, play_summary.yearEnded, play_summary.playURL FROM play_summary WHERE play_summary.authorNamesNormalized LIKE '%' || nt_normalize('Σαίξπηρ') || '%' ORDER BY play_summary.yearEnded DESC LIMIT {top_k};"""
+
 _DECIDER_TEMPLATE = """Given the below input question and list of potential tables, output a comma separated list of the table names that may be necessary to answer this question. NEVER INCLUDE tables that do not exist in the provided table names in your respose.
 
 Question: {query}
@@ -0,0 +1,129 @@
+"""Local rendering of the answer for list-like SQL results.
+
+Most answers of the final LLM call only reformat the rows (plays, works or
+people with their URLs) into Greek markdown, in the format that the prompt
+asks for: [playTitle (yearStarted - yearEnded)](playURL). For the selected
+intents (see nt_chat/intents.py), the answer is rendered locally from the
+rows and sent at once. It is also the degraded-mode answer, when the LLM has
+not sent the first token of the answer after a timeout. Results with other
+columns (counts, venues...) are always answered by the LLM.
+"""
+
+import sqlglot
+from sqlglot.errors import SqlglotError
+
+NO_RESULTS = "Δεν βρέθηκαν αποτελέσματα στο αρχείο του Εθνικού Θεάτρου."
+
+# plays columns -> link text
+MEDIA_LABELS = {
+    "photosURL": "Φωτογραφίες",
+    "videosURL": "Βίντεο",
+    "soundsURL": "Ηχητικά",
+    "postersURL": "Αφίσες",
+    "programsURL": "Προγράμματα",
+    "costumesURL": "Κοστούμια",
+    "musicSheetsURL": "Παρτιτούρες",
+    "publicationsURL": "Δημοσιεύσεις",
+}
+_PLAY_COLUMNS = {"playID", "playTitle", "playURL", "yearStarted", "yearEnded"}
+_WORK_COLUMNS = {"workID", "workTitle", "workURL", "workYear"}
+_PERSON_COLUMNS = {"personID", "personName", "personURL"}
+_KNOWN_COLUMNS = _PLAY_COLUMNS | _WORK_COLUMNS | _PERSON_COLUMNS | set(MEDIA_LABELS)
+
+
+def result_columns(sql_cmd, dialect="sqlite"):
+    """Output column names of a SELECT query, or None if unknown (e.g., *)"""
+    try:
+        columns = sqlglot.parse_one(sql_cmd, read=dialect).named_selects
+    except SqlglotError:
+        return None
+    if not columns or "*" in columns:
+        return None
+    return columns
+
+
+def _years(start, end):
+    if start and end and start != end:
+        return f" ({start} - {end})"
+    if start or end:
+        return f" ({start or end})"
+    return ""
+
+
+def _link(text, url):
+    return f"[{text}]({url})" if url else text
+
+
+def _play_line(record, media_columns):
+    years = _years(record.get("yearStarted"), record.get("yearEnded"))
+    line = "- " + _link(f"{record['playTitle']}{years}", record.get("playURL"))
+    if media_columns:
+        links = [
+            _link(MEDIA_LABELS[column], record[column])
+            for column in media_columns
+            if record[column]
+        ]
+        line += ": " + (", ".join(links) or "δεν υπάρχει διαθέσιμο υλικό")
+    return line
+
+
+def _work_line(record):
+    years = _years(str(record.get("workYear") or "").strip(), None)
+    line = "- " + _link(f"{record['workTitle']}{years}", record.get("workURL"))
+    if record.get("personName"):
+        line += ", " + _link(record["personName"], record.get("personURL"))
+    return line
+
+
+def _person_line(record):
+    return "- " + _link(record["personName"], record.get("personURL"))
+
+
+def render_answer(columns, rows):
+    """Greek markdown answer for the rows, or None if the LLM should answer"""
+    if not set(columns) <= _KNOWN_COLUMNS:
+        return None
+    if not rows:
+        return NO_RESULTS
+    records = [dict(zip(columns, row)) for row in rows]
+    if "playTitle" in columns:
+        media_columns = [column for column in columns if column in MEDIA_LABELS]
+        intro = "Βρήκα τις εξής παραστάσεις στο αρχείο"
+        people = [r["personName"] for r in records if r.get("personName")]
+        if people:
+            intro += f" ({', '.join(dict.fromkeys(people))})"
+        lines = [_play_line(record, media_columns) for record in records]
+    elif "workTitle" in columns:
+        intro = "Βρήκα τα εξής έργα στο αρχείο"
+        lines = [_work_line(record) for record in records]
+    elif "personName" in columns:
+        intro = "Βρήκα τα εξής πρόσωπα στο αρχείο"
+        lines = [_person_line(record) for record in records]
+    else:
+        return None
+    # the same play or work may appear once per joined row
+    return "\n".join([intro + ":"] + list(dict.fromkeys(lines)))
+
+
+class AnswerRenderer:
+    """Renders the answer locally for the selected intents.
+
+    timeout is the time (in seconds) to wait for the first token of the LLM
+    answer before the local answer is sent instead; None or 0 to always wait.
+    """
+
+    def __init__(self, intents=(), timeout=None, dialect="sqlite"):
+        self.intents = set(intents)
+        self.timeout = timeout
+        self.dialect = dialect
+
+    def renders(self, intent):
+        """Whether the answers of the intent are always rendered locally"""
+        return intent in self.intents
+
+    def render(self, sql_cmd, rows):
+        """The answer for the rows of the query, or None if it can't be rendered"""
+        columns = result_columns(sql_cmd, dialect=self.dialect)
+        if columns is None:
+            return None
+        return render_answer(columns, rows)
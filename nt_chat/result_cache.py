@@ -0,0 +1,177 @@
+"""In-memory cache of SQL results, keyed on a canonical form of the query.
+
+Different questions often lead to the same query, up to whitespace, table
+aliases, identifier case and LIMIT. The query is parsed with sqlglot and
+re-serialized, so these differences do not lead to a cache miss.
+"""
+
+import sys
+import threading
+import time
+
+import cachetools
+import sqlglot
+from langchain_community.utilities.sql_database import truncate_word
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+
+def _limit_value(tree):
+    """Returns the value of a top-level numeric LIMIT, or None"""
+    limit = tree.args.get("limit")
+    if limit is None or tree.args.get("offset") is not None:
+        return None
+    expression = limit.args.get("expression")
+    if isinstance(expression, exp.Literal) and expression.is_int:
+        return int(expression.this)
+    return None
+
+
+def canonicalize_sql(sql_cmd, dialect="sqlite"):
+    """Returns (canonical SQL without LIMIT, limit) for a single SELECT statement,
+    or (None, None) if the query cannot be cached.
+
+    SELECT p.personName FROM people p WHERE p.personName LIKE '%Σαίξπηρ%' LIMIT 10
+    becomes
+    SELECT people.personname FROM people WHERE people.personname LIKE '%Σαίξπηρ%'
+    """
+    try:
+        statements = sqlglot.parse(sql_cmd, read=dialect)
+    except SqlglotError:
+        return None, None
+    statements = [statement for statement in statements if statement is not None]
+    if len(statements) != 1 or not isinstance(statements[0], exp.Query):
+        return None, None
+    tree = normalize_identifiers(statements[0], dialect=dialect)
+
+    # Replace table aliases with the table names, or with t0, t1, ...
+    # if a table appears more than once (self joins)
+    tables = list(tree.find_all(exp.Table))
+    table_names = [table.name for table in tables]
+    aliases = {}
+    for i, table in enumerate(tables):
+        if not table.alias:
+            continue
+        if table_names.count(table.name) == 1:
+            aliases[table.alias] = table.name
+            table.set("alias", None)
+        else:
+            aliases[table.alias] = f"t{i}"
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(f"t{i}")))
+    for column in tree.find_all(exp.Column):
+        if column.table in aliases:
+            column.set("table", exp.to_identifier(aliases[column.table]))
+
+    limit = _limit_value(tree)
+    if limit is not None:
+        tree.set("limit", None)
+    return tree.sql(dialect=dialect), limit
+
+
+def _sizeof(entry):
+    """Rough estimate of the memory used by a cache entry (in bytes)"""
+    return sys.getsizeof(entry["rows"]) + sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+        for row in entry["rows"]
+    )
+
+
+def format_rows(rows, max_string_length=300):
+    """Formats the rows exactly like SQLDatabase.run does"""
+    res = [
+        tuple(truncate_word(value, length=max_string_length) for value in row)
+        for row in rows
+    ]
+    if not res:
+        return ""
+    return str(res)
+
+
+class SQLResultCache:
+    """LRU cache of SQL rows with a memory cap (maxbytes).
+
+    An entry for "... LIMIT 20" also serves "... LIMIT 10", and an entry that
+    returned fewer rows than its LIMIT serves any LIMIT. All entries are dropped
+    when the version (e.g., the content hash of the database) changes.
+    """
+
+    def __init__(self, maxbytes=64 * 1024 * 1024, version=None):
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.saved_seconds = 0.0
+        self._cache = cachetools.LRUCache(maxsize=maxbytes, getsizeof=_sizeof)
+        self._cache_version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        version = self.version() if callable(self.version) else self.version
+        if version != self._cache_version:
+            self._cache.clear()
+            self._cache_version = version
+
+    def get(self, key, limit):
+        """Returns the cached rows for the canonical query and limit, or None"""
+        with self._lock:
+            self._check_version()
+            entry = self._cache.get(key)
+            if entry is not None and (
+                entry["complete"]
+                or (
+                    limit is not None
+                    and entry["limit"] is not None
+                    and limit <= entry["limit"]
+                )
+            ):
+                self.hits += 1
+                self.saved_seconds += entry["elapsed"]
+                return entry["rows"][:limit] if limit is not None else entry["rows"]
+            self.misses += 1
+            return None
+
+    def set(self, key, limit, rows, elapsed):
+        """Adds the rows of a query; entries that exceed maxbytes are ignored"""
+        entry = {
+            "rows": rows,
+            "limit": limit,
+            "complete": limit is None or len(rows) < limit,
+            "elapsed": elapsed,
+        }
+        with self._lock:
+            self._check_version()
+            previous = self._cache.get(key)
+            if previous is not None and (
+                previous["complete"] or (limit or 0) <= (previous["limit"] or 0)
+            ):
+                # keep the entry that serves more queries
+                return
+            try:
+                self._cache[key] = entry
+            except ValueError:
+                # value too large
+                pass
+
+    def lookup(self, sql_cmd, dialect="sqlite"):
+        """Returns (key, limit, rows); rows is None on a cache miss and key is
+        None if the query cannot be cached"""
+        key, limit = canonicalize_sql(sql_cmd, dialect=dialect)
+        if key is None:
+            with self._lock:
+                self.uncacheable += 1
+            return None, None, None
+        return key, limit, self.get(key, limit)
+
+    def stats(self):
+        """Hit/miss counters and saved SQL execution time"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "bytes": self._cache.currsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncacheable": self.uncacheable,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+        }
@@ -2,8 +2,10 @@
 
 from __future__ import annotations
 
+import asyncio
+import time
 import warnings
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from langchain.chains.base import Chain
 from langchain.chains.llm import LLMChain
@@ -11,15 +13,39 @@ from langchain.chains.sql_database.prompt import (DECIDER_PROMPT, PROMPT,
                                                   SQL_PROMPTS)
 from langchain_community.tools.sql_database.prompt import QUERY_CHECKER
 from langchain_community.utilities import SQLDatabase
-from langchain_core.callbacks import (AsyncCallbackManagerForChainRun,
+from langchain_core.callbacks import (AsyncCallbackHandler,
+                                      AsyncCallbackManagerForChainRun,
                                       CallbackManagerForChainRun)
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.prompts import BasePromptTemplate, PromptTemplate
 from langchain_experimental.pydantic_v1 import Extra, Field, root_validator
 
+from nt_chat.cache import PersistentCache, normalize_query
+from nt_chat.intents import IntentMatcher
+from nt_chat.metrics import (ANSWERS, DECIDER_TAG, FINAL_RESULT_TAG, INTENTS,
+                             LOCAL_ANSWER_EVENT, QUERY_CHECKER_TAG,
+                             QUERY_CHECKS, SQL_EXECUTION_EVENT,
+                             SQL_GENERATION_TAG, TABLE_ROUTES)
+from nt_chat.renderer import AnswerRenderer
+from nt_chat.result_cache import SQLResultCache, format_rows
+from nt_chat.sql_executor import SQLExecutor
+from nt_chat.sql_validator import SQLValidator
+from nt_chat.table_router import TableRouter
+
 INTERMEDIATE_STEPS_KEY = "intermediate_steps"
 
 
+class _FirstTokenHandler(AsyncCallbackHandler):
+    """Sets the event when the LLM streams its first token"""
+
+    def __init__(self):
+        super().__init__()
+        self.event = asyncio.Event()
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.event.set()
+
+
 class SQLDatabaseChain(Chain):
     """Chain for interacting with SQL Database.
 
@@ -64,6 +90,22 @@ class SQLDatabaseChain(Chain):
     to fix the initial SQL from the LLM."""
     query_checker_prompt: Optional[BasePromptTemplate] = None
     """The prompt template that should be used by the query checker"""
+    sql_cache: Optional[PersistentCache] = Field(default=None, exclude=True)
+    """Cache from the normalized question to the (checked) SQL query and
+    the table names that were used."""
+    result_cache: Optional[SQLResultCache] = Field(default=None, exclude=True)
+    """Cache of the SQL results, keyed on the canonical SQL query."""
+    sql_executor: Optional[SQLExecutor] = Field(default=None, exclude=True)
+    """Thread pool of read-only connections; if None, the queries run
+    on the database engine directly."""
+    sql_validator: Optional[SQLValidator] = Field(default=None, exclude=True)
+    """Local validation of the generated SQL; the query checker is only
+    called for the queries that fail it."""
+    checked_sql_cache: Optional[PersistentCache] = Field(default=None, exclude=True)
+    """Cache from a generated SQL query to the output of the query checker."""
+    answer_renderer: Optional[AnswerRenderer] = Field(default=None, exclude=True)
+    """Renders the answer locally for the selected intents, and when the LLM
+    answer is slow."""
 
     class Config:
         """Configuration for this pydantic object."""
@@ -106,6 +148,151 @@ class SQLDatabaseChain(Chain):
         else:
             return [self.output_key, INTERMEDIATE_STEPS_KEY]
 
+    def _query_checker_chain(self) -> LLMChain:
+        query_checker_prompt = self.query_checker_prompt or PromptTemplate(
+            template=QUERY_CHECKER, input_variables=["query", "dialect"]
+        )
+        return LLMChain(llm=self.query_chain.llm, prompt=query_checker_prompt)
+
+    def _fetch_rows(self, sql_cmd: str) -> List[tuple]:
+        if self.sql_executor is not None:
+            return self.sql_executor.fetch_rows(sql_cmd)
+        cursor = self.database.run(sql_cmd, fetch="cursor")
+        return [tuple(row) for row in cursor.fetchall()]
+
+    async def _afetch_rows(self, sql_cmd: str) -> List[tuple]:
+        if self.sql_executor is not None:
+            return await self.sql_executor.afetch_rows(sql_cmd)
+        return self._fetch_rows(sql_cmd)
+
+    def _lookup_rows(self, sql_cmd: str) -> Tuple[Any, Any, Optional[List[tuple]]]:
+        if self.result_cache is None:
+            return None, None, None
+        return self.result_cache.lookup(sql_cmd, dialect=self.database.dialect)
+
+    def _store_rows(self, key: Any, limit: Any, rows: List[tuple], start_time: float):
+        if key is not None:
+            self.result_cache.set(key, limit, rows, time.perf_counter() - start_time)
+
+    def _format_rows(self, rows: List[tuple]) -> str:
+        # Same output as self.database.run(sql_cmd)
+        return format_rows(rows, self.database._max_string_length)
+
+    def _run_sql(
+        self, sql_cmd: str, run_manager: CallbackManagerForChainRun
+    ) -> List[tuple]:
+        start_time = time.perf_counter()
+        key, limit, rows = self._lookup_rows(sql_cmd)
+        cached = rows is not None
+        if not cached:
+            rows = self._fetch_rows(sql_cmd)
+            self._store_rows(key, limit, rows, start_time)
+        run_manager.get_child().on_custom_event(
+            SQL_EXECUTION_EVENT,
+            {"seconds": time.perf_counter() - start_time, "cached": cached},
+        )
+        return rows
+
+    async def _arun_sql(
+        self, sql_cmd: str, run_manager: AsyncCallbackManagerForChainRun
+    ) -> List[tuple]:
+        start_time = time.perf_counter()
+        key, limit, rows = self._lookup_rows(sql_cmd)
+        cached = rows is not None
+        if not cached:
+            rows = await self._afetch_rows(sql_cmd)
+            self._store_rows(key, limit, rows, start_time)
+        await run_manager.get_child().on_custom_event(
+            SQL_EXECUTION_EVENT,
+            {"seconds": time.perf_counter() - start_time, "cached": cached},
+        )
+        return rows
+
+    def _checked_sql(self, sql_cmd: str) -> Tuple[Optional[str], List[str]]:
+        """Returns (the query to run without calling the checker or None, the
+        problems found by the local validation)"""
+        problems: List[str] = []
+        if self.sql_validator is not None:
+            problems = self.sql_validator.validate(sql_cmd)
+            if not problems:
+                QUERY_CHECKS.labels("avoided").inc()
+                return sql_cmd, problems
+        if self.checked_sql_cache is not None:
+            checked_sql = self.checked_sql_cache.get(sql_cmd)
+            if checked_sql is not None:
+                QUERY_CHECKS.labels("cached").inc()
+                return checked_sql, problems
+        QUERY_CHECKS.labels("called").inc()
+        return None, problems
+
+    def _cache_checked_sql(self, sql_cmd: str, checked_sql: str) -> None:
+        if self.checked_sql_cache is not None:
+            self.checked_sql_cache.set(sql_cmd, checked_sql)
+
+    def _cache_sql(
+        self, inputs: Dict[str, Any], sql_cmd: str, table_names_to_use: Any
+    ) -> None:
+        """Store the SQL query that ran successfully for this question, so that
+        next time we can skip the decider, generation and checker calls."""
+        if self.sql_cache is None or inputs.get("sql_cmd") is not None:
+            return
+        self.sql_cache.set(
+            normalize_query(inputs[self.input_key]),
+            {"sql_cmd": sql_cmd, "table_names": table_names_to_use},
+        )
+
+    def _local_answer(
+        self, inputs: Dict[str, Any], sql_cmd: str, rows: List[tuple]
+    ) -> Optional[str]:
+        """The answer rendered locally if it is selected for the intent of the
+        SQL template (see SQLDatabaseSequentialChain), otherwise None"""
+        if self.answer_renderer is None or not self.answer_renderer.renders(
+            inputs.get("intent")
+        ):
+            return None
+        return self.answer_renderer.render(sql_cmd, rows)
+
+    async def _allm_answer(
+        self,
+        llm_inputs: Dict[str, Any],
+        sql_cmd: str,
+        rows: List[tuple],
+        run_manager: AsyncCallbackManagerForChainRun,
+    ) -> Tuple[str, str]:
+        """Returns (answer, source) of the final LLM call. If the LLM doesn't
+        stream its first token within the timeout of the renderer, the call is
+        cancelled and the answer is rendered locally (degraded mode).
+
+        Degraded mode is async-only (_call always waits for the LLM) and needs
+        a streaming LLM: without the tokens, the first one is the whole answer."""
+        callbacks = run_manager.get_child()
+        answer_call = self.llm_chain.acall(
+            llm_inputs, callbacks=callbacks, tags=[FINAL_RESULT_TAG]
+        )
+        timeout = None
+        if self.answer_renderer and getattr(self.llm_chain.llm, "streaming", False):
+            timeout = self.answer_renderer.timeout
+        local_answer = self.answer_renderer.render(sql_cmd, rows) if timeout else None
+        if local_answer is None:
+            return (await answer_call)[self.llm_chain.output_key], "llm"
+
+        first_token = _FirstTokenHandler()
+        callbacks.add_handler(first_token, inherit=True)
+        answer_task = asyncio.ensure_future(answer_call)
+        first_token_task = asyncio.ensure_future(first_token.event.wait())
+        try:
+            await asyncio.wait(
+                {answer_task, first_token_task},
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not answer_task.done() and not first_token.event.is_set():
+                return local_answer, "degraded"
+            return (await answer_task)[self.llm_chain.output_key], "llm"
+        finally:
+            first_token_task.cancel()
+            answer_task.cancel()
+
     async def _acall(
         self,
         inputs: Dict[str, Any],
@@ -130,48 +317,43 @@ class SQLDatabaseChain(Chain):
         intermediate_steps: List = []
         try:
             intermediate_steps.append(llm_inputs)  # input: sql generation
-            sql_cmd = await self.query_chain.apredict(
-                callbacks=_run_manager.get_child(),
-                **llm_inputs,
-            )
-            sql_cmd = sql_cmd.strip()
-            if self.return_sql:
-                return {self.output_key: sql_cmd}
-            if not self.use_query_checker:
-                await _run_manager.on_text(sql_cmd, color="green", verbose=self.verbose)
-                intermediate_steps.append(
-                    sql_cmd
-                )  # output: sql generation (no checker)
-                intermediate_steps.append({"sql_cmd": sql_cmd})  # input: sql exec
-                result = self.database.run(sql_cmd)
-                intermediate_steps.append(str(result))  # output: sql exec
-            else:
-                query_checker_prompt = self.query_checker_prompt or PromptTemplate(
-                    template=QUERY_CHECKER, input_variables=["query", "dialect"]
-                )
-                query_checker_chain = LLMChain(
-                    llm=self.query_chain.llm, prompt=query_checker_prompt
-                )
-                query_checker_inputs = {
-                    "query": sql_cmd,
-                    "dialect": self.database.dialect,
-                }
-                checked_sql_command: str = await query_checker_chain.apredict(
-                    callbacks=_run_manager.get_child(), **query_checker_inputs
-                )
-                checked_sql_command = checked_sql_command.strip()
-                intermediate_steps.append(
-                    checked_sql_command
-                )  # output: sql generation (checker)
-                await _run_manager.on_text(
-                    checked_sql_command, color="green", verbose=self.verbose
+            # The SQL query may already be known (e.g., from the SQL cache)
+            sql_cmd = inputs.get("sql_cmd")
+            if sql_cmd is None:
+                sql_cmd = await self.query_chain.apredict(
+                    callbacks=_run_manager.get_child(SQL_GENERATION_TAG),
+                    **llm_inputs,
                 )
-                intermediate_steps.append(
-                    {"sql_cmd": checked_sql_command}
-                )  # input: sql exec
-                result = self.database.run(checked_sql_command)
-                intermediate_steps.append(str(result))  # output: sql exec
-                sql_cmd = checked_sql_command
+                sql_cmd = sql_cmd.strip()
+                if self.return_sql:
+                    return {self.output_key: sql_cmd}
+                if self.use_query_checker:
+                    checked_sql_command, problems = self._checked_sql(sql_cmd)
+                    if problems:
+                        await _run_manager.on_text(
+                            f"\nInvalid SQL: {problems}\n", verbose=self.verbose
+                        )
+                    if checked_sql_command is None:
+                        query_checker_inputs = {
+                            "query": sql_cmd,
+                            "dialect": self.database.dialect,
+                        }
+                        checked_sql_command = (
+                            await self._query_checker_chain().apredict(
+                                callbacks=_run_manager.get_child(QUERY_CHECKER_TAG),
+                                **query_checker_inputs,
+                            )
+                        ).strip()
+                        self._cache_checked_sql(sql_cmd, checked_sql_command)
+                    sql_cmd = checked_sql_command
+            # output: sql generation (no checker, checker or cache)
+            intermediate_steps.append(sql_cmd)
+            await _run_manager.on_text(sql_cmd, color="green", verbose=self.verbose)
+            intermediate_steps.append({"sql_cmd": sql_cmd})  # input: sql exec
+            rows = await self._arun_sql(sql_cmd, _run_manager)
+            result = self._format_rows(rows)
+            intermediate_steps.append(str(result))  # output: sql exec
+            self._cache_sql(inputs, sql_cmd, table_names_to_use)
 
             await _run_manager.on_text("\nSQLResult: ", verbose=self.verbose)
             await _run_manager.on_text(result, color="yellow", verbose=self.verbose)
@@ -185,17 +367,17 @@ class SQLDatabaseChain(Chain):
                 input_text += f"{sql_cmd}\nSQLResult: {result}\nAnswer:"
                 llm_inputs["input"] = input_text
                 intermediate_steps.append(llm_inputs)  # input: final answer
-                final_result = await self.llm_chain.acall(
-                    llm_inputs,
-                    callbacks=_run_manager.get_child(),
-                    tags=["FINAL_RESULT"],
-                )
-                final_result = final_result[self.llm_chain.output_key]
-                # final_result = await self.llm_chain.apredict(
-                #     callbacks=_run_manager.get_child(),
-                #     tags=["FINAL_RESULT"],
-                #     **llm_inputs,
-                # )
+                final_result = self._local_answer(inputs, sql_cmd, rows)
+                source = "local"
+                if final_result is None:
+                    final_result, source = await self._allm_answer(
+                        llm_inputs, sql_cmd, rows, _run_manager
+                    )
+                if source != "llm":
+                    await _run_manager.get_child().on_custom_event(
+                        LOCAL_ANSWER_EVENT, {"text": final_result, "source": source}
+                    )
+                ANSWERS.labels(source).inc()
                 final_result = final_result.strip()
                 intermediate_steps.append(final_result)  # output: final answer
                 await _run_manager.on_text(
@@ -235,46 +417,44 @@ class SQLDatabaseChain(Chain):
         intermediate_steps: List = []
         try:
             intermediate_steps.append(llm_inputs)  # input: sql generation
-            sql_cmd = self.query_chain.predict(
-                callbacks=_run_manager.get_child(),
-                **llm_inputs,
-            ).strip()
-            if self.return_sql:
-                return {self.output_key: sql_cmd}
-            if not self.use_query_checker:
-                _run_manager.on_text(sql_cmd, color="green", verbose=self.verbose)
-                intermediate_steps.append(
-                    sql_cmd
-                )  # output: sql generation (no checker)
-                intermediate_steps.append({"sql_cmd": sql_cmd})  # input: sql exec
-                result = self.database.run(sql_cmd)
-                intermediate_steps.append(str(result))  # output: sql exec
-            else:
-                query_checker_prompt = self.query_checker_prompt or PromptTemplate(
-                    template=QUERY_CHECKER, input_variables=["query", "dialect"]
-                )
-                query_checker_chain = LLMChain(
-                    llm=self.query_chain.llm, prompt=query_checker_prompt
-                )
-                query_checker_inputs = {
-                    "query": sql_cmd,
-                    "dialect": self.database.dialect,
-                }
-                checked_sql_command: str = query_checker_chain.predict(
-                    callbacks=_run_manager.get_child(), **query_checker_inputs
+            # The SQL query may already be known (e.g., from the SQL cache)
+            sql_cmd = inputs.get("sql_cmd")
+            if sql_cmd is None:
+                sql_cmd = self.query_chain.predict(
+                    callbacks=_run_manager.get_child(SQL_GENERATION_TAG),
+                    **llm_inputs,
                 ).strip()
-                intermediate_steps.append(
-                    checked_sql_command
-                )  # output: sql generation (checker)
-                _run_manager.on_text(
-                    checked_sql_command, color="green", verbose=self.verbose
-                )
-                intermediate_steps.append(
-                    {"sql_cmd": checked_sql_command}
-                )  # input: sql exec
-                result = self.database.run(checked_sql_command)
-                intermediate_steps.append(str(result))  # output: sql exec
-                sql_cmd = checked_sql_command
+                if self.return_sql:
+                    return {self.output_key: sql_cmd}
+                if self.use_query_checker:
+                    checked_sql_command, problems = self._checked_sql(sql_cmd)
+                    if problems:
+                        _run_manager.on_text(
+                            f"\nInvalid SQL: {problems}\n", verbose=self.verbose
+                        )
+                    if checked_sql_command is None:
+                        query_checker_inputs = {
+                            "query": sql_cmd,
+                            "dialect": self.database.dialect,
+                        }
+                        checked_sql_command = (
+                            self._query_checker_chain()
+                            .predict(
+                                callbacks=_run_manager.get_child(QUERY_CHECKER_TAG),
+                                **query_checker_inputs,
+                            )
+                            .strip()
+                        )
+                        self._cache_checked_sql(sql_cmd, checked_sql_command)
+                    sql_cmd = checked_sql_command
+            # output: sql generation (no checker, checker or cache)
+            intermediate_steps.append(sql_cmd)
+            _run_manager.on_text(sql_cmd, color="green", verbose=self.verbose)
+            intermediate_steps.append({"sql_cmd": sql_cmd})  # input: sql exec
+            rows = self._run_sql(sql_cmd, _run_manager)
+            result = self._format_rows(rows)
+            intermediate_steps.append(str(result))  # output: sql exec
+            self._cache_sql(inputs, sql_cmd, table_names_to_use)
 
             _run_manager.on_text("\nSQLResult: ", verbose=self.verbose)
             _run_manager.on_text(result, color="yellow", verbose=self.verbose)
@@ -288,10 +468,18 @@ class SQLDatabaseChain(Chain):
                 input_text += f"{sql_cmd}\nSQLResult: {result}\nAnswer:"
                 llm_inputs["input"] = input_text
                 intermediate_steps.append(llm_inputs)  # input: final answer
-                final_result = self.llm_chain.predict(
-                    callbacks=_run_manager.get_child(),
-                    **llm_inputs,
-                ).strip()
+                final_result = self._local_answer(inputs, sql_cmd, rows)
+                if final_result is None:
+                    ANSWERS.labels("llm").inc()
+                    final_result = self.llm_chain.predict(
+                        callbacks=_run_manager.get_child(FINAL_RESULT_TAG),
+                        **llm_inputs,
+                    ).strip()
+                else:
+                    ANSWERS.labels("local").inc()
+                    _run_manager.get_child().on_custom_event(
+                        LOCAL_ANSWER_EVENT, {"text": final_result, "source": "local"}
+                    )
                 intermediate_steps.append(final_result)  # output: final answer
                 _run_manager.on_text(final_result, color="green", verbose=self.verbose)
             chain_result: Dict[str, Any] = {self.output_key: final_result}
@@ -349,6 +537,12 @@ class SQLDatabaseSequentialChain(Chain):
     input_key: str = "query"  #: :meta private:
     output_key: str = "result"  #: :meta private:
     return_intermediate_steps: bool = False
+    table_router: Optional[TableRouter] = Field(default=None, exclude=True)
+    """Chooses the tables locally; the decider is only called when the router
+    is not confident."""
+    intent_matcher: Optional[IntentMatcher] = Field(default=None, exclude=True)
+    """Fills a SQL template for the common questions, which skips the decider,
+    the SQL generation and the query checker."""
 
     @classmethod
     def from_llm(
@@ -357,6 +551,8 @@ class SQLDatabaseSequentialChain(Chain):
         db: SQLDatabase,
         query_prompt: BasePromptTemplate = PROMPT,
         decider_prompt: BasePromptTemplate = DECIDER_PROMPT,
+        table_router: Optional[TableRouter] = None,
+        intent_matcher: Optional[IntentMatcher] = None,
         **kwargs: Any,
     ) -> SQLDatabaseSequentialChain:
         """Load the necessary chains."""
@@ -364,7 +560,13 @@ class SQLDatabaseSequentialChain(Chain):
         decider_chain = LLMChain(
             llm=llm, prompt=decider_prompt, output_key="table_names"
         )
-        return cls(sql_chain=sql_chain, decider_chain=decider_chain, **kwargs)
+        return cls(
+            sql_chain=sql_chain,
+            decider_chain=decider_chain,
+            table_router=table_router,
+            intent_matcher=intent_matcher,
+            **kwargs,
+        )
 
     @property
     def input_keys(self) -> List[str]:
@@ -385,23 +587,113 @@ class SQLDatabaseSequentialChain(Chain):
         else:
             return [self.output_key, INTERMEDIATE_STEPS_KEY]
 
-    async def _acall(self, inputs, run_manager=None):
-        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+    def _cached_sql(self, inputs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Look up the SQL query of a question that was answered before"""
+        if self.sql_chain.sql_cache is None:
+            return None
+        return self.sql_chain.sql_cache.get(normalize_query(inputs[self.input_key]))
+
+    def _match_intent(self, inputs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Inputs of the sql chain with the SQL template of the question, or None
+        if the LLM should write the query"""
+        if self.intent_matcher is None:
+            return None
+        match = self.intent_matcher.match(
+            inputs[self.input_key], top_k=self.sql_chain.top_k
+        )
+        INTENTS.labels(match.intent if match else "llm").inc()
+        if match is None:
+            return None
+        return {
+            self.sql_chain.input_key: inputs[self.input_key],
+            "table_names_to_use": match.table_names,
+            "sql_cmd": match.sql_cmd,
+            "intent": match.intent,
+        }
+
+    def _route_tables(self, inputs: Dict[str, Any]) -> Optional[List[str]]:
+        """Choose the tables locally; None if the decider should be called"""
+        if self.table_router is None:
+            return None
+        tables, _, source = self.table_router.route(inputs[self.input_key])
+        if tables is None:
+            return None
+        TABLE_ROUTES.labels(source).inc()
+        usable_table_names = self.sql_chain.database.get_usable_table_names()
+        return [name for name in tables if name in usable_table_names]
+
+    def _record_decider(self, inputs: Dict[str, Any], table_names: List[str]) -> None:
+        TABLE_ROUTES.labels("llm").inc()
+        if self.table_router is not None:
+            self.table_router.record(inputs[self.input_key], table_names)
+
+    def _decider_inputs(self, inputs: Dict[str, Any]) -> Tuple[Dict[str, Any], List]:
         _table_names = self.sql_chain.database.get_usable_table_names()
-        table_names = ", ".join(_table_names)
         llm_inputs = {
             "query": inputs[self.input_key],
-            "table_names": table_names,
+            "table_names": ", ".join(_table_names),
         }
-        _lowercased_table_names = [name.lower() for name in _table_names]
+        return llm_inputs, [name.lower() for name in _table_names]
+
+    async def _adecide_tables(
+        self, inputs: Dict[str, Any], run_manager: AsyncCallbackManagerForChainRun
+    ) -> List[str]:
+        """Ask the LLM decider for the tables to use"""
+        llm_inputs, _lowercased_table_names = self._decider_inputs(inputs)
         table_names_from_chain = await self.decider_chain.apredict_and_parse(
-            **llm_inputs
+            callbacks=run_manager.get_child(DECIDER_TAG), **llm_inputs
+        )
+        table_names_to_use = [
+            name
+            for name in table_names_from_chain
+            if name.lower() in _lowercased_table_names
+        ]
+        self._record_decider(inputs, table_names_to_use)
+        return table_names_to_use
+
+    def _decide_tables(
+        self, inputs: Dict[str, Any], run_manager: CallbackManagerForChainRun
+    ) -> List[str]:
+        """Ask the LLM decider for the tables to use"""
+        llm_inputs, _lowercased_table_names = self._decider_inputs(inputs)
+        table_names_from_chain = self.decider_chain.predict_and_parse(
+            callbacks=run_manager.get_child(DECIDER_TAG), **llm_inputs
         )
         table_names_to_use = [
             name
             for name in table_names_from_chain
             if name.lower() in _lowercased_table_names
         ]
+        self._record_decider(inputs, table_names_to_use)
+        return table_names_to_use
+
+    async def _acall(self, inputs, run_manager=None):
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        cached = self._cached_sql(inputs)
+        if cached is not None:
+            # Skip the decider; the sql chain will skip generation and checker
+            await _run_manager.on_text(
+                "Cached SQL query", end="\n", verbose=self.verbose
+            )
+            new_inputs = {
+                self.sql_chain.input_key: inputs[self.input_key],
+                "table_names_to_use": cached["table_names"],
+                "sql_cmd": cached["sql_cmd"],
+            }
+            return await self.sql_chain.acall(
+                new_inputs, callbacks=_run_manager.get_child(), return_only_outputs=True
+            )
+        new_inputs = self._match_intent(inputs)
+        if new_inputs is not None:
+            await _run_manager.on_text(
+                "SQL template", end="\n", verbose=self.verbose
+            )
+            return await self.sql_chain.acall(
+                new_inputs, callbacks=_run_manager.get_child(), return_only_outputs=True
+            )
+        table_names_to_use = self._route_tables(inputs)
+        if table_names_to_use is None:
+            table_names_to_use = await self._adecide_tables(inputs, _run_manager)
         await _run_manager.on_text(
             "Table names to use:", end="\n", verbose=self.verbose
         )
@@ -423,19 +715,27 @@ class SQLDatabaseSequentialChain(Chain):
         run_manager: Optional[CallbackManagerForChainRun] = None,
     ) -> Dict[str, Any]:
         _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
-        _table_names = self.sql_chain.database.get_usable_table_names()
-        table_names = ", ".join(_table_names)
-        llm_inputs = {
-            "query": inputs[self.input_key],
-            "table_names": table_names,
-        }
-        _lowercased_table_names = [name.lower() for name in _table_names]
-        table_names_from_chain = self.decider_chain.predict_and_parse(**llm_inputs)
-        table_names_to_use = [
-            name
-            for name in table_names_from_chain
-            if name.lower() in _lowercased_table_names
-        ]
+        cached = self._cached_sql(inputs)
+        if cached is not None:
+            # Skip the decider; the sql chain will skip generation and checker
+            _run_manager.on_text("Cached SQL query", end="\n", verbose=self.verbose)
+            new_inputs = {
+                self.sql_chain.input_key: inputs[self.input_key],
+                "table_names_to_use": cached["table_names"],
+                "sql_cmd": cached["sql_cmd"],
+            }
+            return self.sql_chain(
+                new_inputs, callbacks=_run_manager.get_child(), return_only_outputs=True
+            )
+        new_inputs = self._match_intent(inputs)
+        if new_inputs is not None:
+            _run_manager.on_text("SQL template", end="\n", verbose=self.verbose)
+            return self.sql_chain(
+                new_inputs, callbacks=_run_manager.get_child(), return_only_outputs=True
+            )
+        table_names_to_use = self._route_tables(inputs)
+        if table_names_to_use is None:
+            table_names_to_use = self._decide_tables(inputs, _run_manager)
         _run_manager.on_text("Table names to use:", end="\n", verbose=self.verbose)
         _run_manager.on_text(
             str(table_names_to_use), color="yellow", verbose=self.verbose
@@ -0,0 +1,144 @@
+"""SQLDatabase with the table info of every table subset served from memory.
+
+get_table_info reflects the schema and selects sample rows from every table,
+on every question. The data only changes when the database file is rebuilt,
+so the table info of each table is computed once and the info of every subset
+of tables (at most 2^6 for our six tables) is composed from it. Everything
+is recomputed when the version (the content hash of the database) changes.
+
+The full-text indexes (FTS5 tables, see create_mini_db.py) and their shadow
+tables are not usable tables: the prompt describes how to query them. The
+normalized shadow columns of the titles and names (<column>Normalized) are
+regular columns.
+"""
+
+import re
+import threading
+from itertools import combinations
+from typing import Iterable, List, Optional
+
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import inspect, text
+
+# Above this number of tables, the subsets are composed on demand
+_MAX_PRECOMPUTED_TABLES = 8
+FTS5_TABLE_RE = re.compile(r"CREATE\s+VIRTUAL\s+TABLE\s.*\sUSING\s+fts5", re.I | re.S)
+
+
+def full_text_tables(engine):
+    """(FTS5 tables, FTS5 tables and their shadow tables) of an SQLite database"""
+    if engine.dialect.name != "sqlite":
+        return set(), set()
+    with engine.connect() as connection:
+        tables = connection.execute(
+            text("SELECT name, sql FROM sqlite_master WHERE type = 'table'")
+        ).fetchall()
+    fts_tables = {name for name, sql in tables if sql and FTS5_TABLE_RE.match(sql)}
+    shadow_tables = {
+        name
+        for name, _ in tables
+        if any(name.startswith(f"{fts_table}_") for fts_table in fts_tables)
+    }
+    return fts_tables, fts_tables | shadow_tables
+
+
+def normalized_columns(engine):
+    """{"table.column"} of the normalized shadow columns (see create_mini_db.py)"""
+    inspector = inspect(engine)
+    return {
+        f"{table}.{column['name']}"
+        for table in inspector.get_table_names()
+        for column in inspector.get_columns(table)
+        if column["name"].endswith("Normalized")
+    }
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """SQLDatabase that caches get_table_info and get_usable_table_names"""
+
+    def __init__(self, engine, version=None, **kwargs):
+        self.version = version
+        self._lock = threading.Lock()
+        # None until the table infos are precomputed (SQLDatabase.__init__
+        # calls get_usable_table_names)
+        self._usable_table_names = None
+        self._kwargs = kwargs
+        self._init_database(engine)
+        self._cached_version = self._current_version()
+        self._precompute()
+
+    def _init_database(self, engine):
+        """SQLDatabase.__init__ without the full-text tables"""
+        self.full_text_tables, hidden_tables = full_text_tables(engine)
+        self.normalized_columns = normalized_columns(engine)
+        kwargs = dict(self._kwargs)
+        if not kwargs.get("include_tables"):
+            kwargs["ignore_tables"] = sorted(
+                set(kwargs.get("ignore_tables") or []) | hidden_tables
+            )
+        super().__init__(engine, **kwargs)
+
+    def _current_version(self):
+        return self.version() if callable(self.version) else self.version
+
+    def _precompute(self):
+        self._usable_table_names = None
+        usable_table_names = list(super().get_usable_table_names())
+        self._single_table_infos = {
+            name: super(CachedSQLDatabase, self).get_table_info([name])
+            for name in usable_table_names
+        }
+        self._table_infos = {}
+        if len(usable_table_names) <= _MAX_PRECOMPUTED_TABLES:
+            for size in range(len(usable_table_names) + 1):
+                for subset in combinations(usable_table_names, size):
+                    self._table_info(frozenset(subset))
+        self._usable_table_names = usable_table_names
+
+    def _table_info(self, table_names):
+        """Same output as SQLDatabase.get_table_info: the table infos are sorted"""
+        if table_names not in self._table_infos:
+            self._table_infos[table_names] = "\n\n".join(
+                sorted(self._single_table_infos[name] for name in table_names)
+            )
+        return self._table_infos[table_names]
+
+    def _reflect(self):
+        """Reads the table names and the schema from the (rebuilt) database"""
+        # the pooled connections may point to the replaced file
+        self._engine.dispose()
+        # the reflection calls get_usable_table_names, which must not wait
+        # for the lock of _check_version
+        self._usable_table_names = None
+        self._init_database(self._engine)
+
+    def _check_version(self):
+        if self._usable_table_names is None:
+            return
+        version = self._current_version()
+        if version == self._cached_version:
+            return
+        with self._lock:
+            if version != self._cached_version:
+                self._reflect()
+                self._precompute()
+                self._cached_version = version
+
+    def get_usable_table_names(self) -> Iterable[str]:
+        """Get names of tables available."""
+        self._check_version()
+        if self._usable_table_names is None:
+            return super().get_usable_table_names()
+        return self._usable_table_names
+
+    def get_table_info(self, table_names: Optional[List[str]] = None) -> str:
+        """Get information about specified tables (from memory)."""
+        self._check_version()
+        if self._usable_table_names is None:
+            return super().get_table_info(table_names)
+        if table_names is None:
+            return self._table_info(frozenset(self._usable_table_names))
+        missing_tables = set(table_names).difference(self._usable_table_names)
+        if missing_tables:
+            raise ValueError(f"table_names {missing_tables} not found in database")
+        return self._table_info(frozenset(table_names))
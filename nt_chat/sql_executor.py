@@ -0,0 +1,149 @@
+"""Runs the SQL queries off the event loop.
+
+The LLM-generated queries may be slow (e.g., a join over actors x people), so
+they are executed in a bounded thread pool, each thread using a connection
+from a pool of read-only SQLite connections.
+"""
+
+import asyncio
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from nt_chat.cache import normalize_query
+
+
+class SQLExecutorBusy(Exception):
+    """Raised when the queue of SQL queries waiting for a connection is full"""
+
+
+def _normalize(text):
+    return None if text is None else normalize_query(str(text))
+
+
+def register_functions(connection):
+    """nt_normalize(text) is normalize_query (casefolded, without accents and
+    punctuation, ς -> σ): the normalized columns and the full-text indexes of
+    create_mini_db.py contain the normalized titles and names, so the searched
+    text is normalized too; no unicode extension is needed"""
+    connection.create_function("nt_normalize", 1, _normalize, deterministic=True)
+
+
+def connect_read_only(db_path, mmap_size=0):
+    """Opens a read-only connection that can be shared between threads"""
+    connection = sqlite3.connect(
+        f"file:{db_path}?mode=ro", uri=True, check_same_thread=False
+    )
+    connection.execute("PRAGMA query_only = 1")
+    connection.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    register_functions(connection)
+    return connection
+
+
+class SQLExecutor:
+    """A thread pool with one read-only connection per thread.
+
+    At most pool_size queries run at the same time and at most queue_depth
+    wait for a free connection; further queries raise SQLExecutorBusy
+    instead of piling up. swap() opens new connections when the database
+    file is replaced, while the running queries finish on the old ones.
+    """
+
+    def __init__(self, db_path, pool_size=4, queue_depth=32, mmap_size=0):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.mmap_size = mmap_size
+        self._connections = self._connect()
+        # swap() and the return of a connection to its pool
+        self._swap_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="sql-executor"
+        )
+        self.max_pending = pool_size + queue_depth
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _connect(self):
+        connections = queue.Queue()
+        for _ in range(self.pool_size):
+            connections.put(connect_read_only(self.db_path, self.mmap_size))
+        return connections
+
+    def _get_connection(self):
+        """A free connection and its pool; after a swap, the queries that wait
+        for a connection of the old pool move to the new one"""
+        while True:
+            connections = self._connections
+            connection = connections.get()
+            if connection is not None:
+                return connections, connection
+            # the old pool is closed: wake up its next waiter too
+            connections.put(None)
+
+    def swap(self):
+        """Opens new connections to db_path (e.g., the rebuilt database); the
+        connections of the running queries are closed when they finish"""
+        new_connections = self._connect()
+        with self._swap_lock:
+            old_connections, self._connections = self._connections, new_connections
+            while True:
+                try:
+                    connection = old_connections.get_nowait()
+                except queue.Empty:
+                    break
+                if connection is not None:
+                    connection.close()
+            old_connections.put(None)
+
+    def _fetch_rows(self, sql_cmd, state=None):
+        connections, connection = self._get_connection()
+        try:
+            if state is not None:
+                state["connection"] = connection
+                if state.get("cancelled"):
+                    raise sqlite3.OperationalError("interrupted")
+            return [tuple(row) for row in connection.execute(sql_cmd).fetchall()]
+        finally:
+            if state is not None:
+                state.pop("connection", None)
+            # under the lock, so that swap() can't retire the pool between the
+            # check and the put (the connection would never be closed)
+            with self._swap_lock:
+                if connections is self._connections:
+                    connections.put(connection)
+                else:
+                    connection.close()
+
+    def fetch_rows(self, sql_cmd):
+        """Runs the query in the calling thread (for the synchronous chains)"""
+        return self._fetch_rows(sql_cmd)
+
+    async def afetch_rows(self, sql_cmd):
+        """Runs the query in the thread pool without blocking the event loop"""
+        if not self._slots.acquire(blocking=False):
+            raise SQLExecutorBusy(f"More than {self.max_pending} pending queries")
+        state = {}
+        try:
+            future = self._pool.submit(self._fetch_rows, sql_cmd, state)
+        except BaseException:
+            self._slots.release()
+            raise
+        # the slot is freed when the thread is, not when the caller gives up
+        # (a cancelled query may still be running until it is interrupted)
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # e.g., the response timed out: stop the query instead of
+            # keeping the connection busy
+            state["cancelled"] = True
+            connection = state.get("connection")
+            if connection is not None:
+                connection.interrupt()
+            raise
+
+    def close(self):
+        """Waits for the running queries and closes the connections"""
+        self._pool.shutdown(wait=True)
+        while not self._connections.empty():
+            self._connections.get().close()
@@ -0,0 +1,123 @@
+"""Local validation of the generated SQL, to skip the query checker LLM call.
+
+A query is valid if it is a single SELECT statement (no DML/DDL), every table
+and column exists in the database (sqlglot qualifies the columns against the
+schema) and SQLite can compile it (EXPLAIN on a read-only connection). The
+query checker is only called for the queries that fail these checks.
+"""
+
+import sqlite3
+import threading
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.optimizer.qualify import qualify
+
+from nt_chat.sql_database import FTS5_TABLE_RE
+from nt_chat.sql_executor import connect_read_only
+
+_FORBIDDEN_EXPRESSIONS = (
+    exp.Insert,
+    exp.Update,
+    exp.Delete,
+    exp.Merge,
+    exp.Create,
+    exp.Drop,
+    exp.AlterTable,
+    exp.Command,
+    exp.Pragma,
+)
+
+
+def read_schema(connection):
+    """{table: {column: type}} of an SQLite database"""
+    tables = {
+        name: sql or ""
+        for name, sql in connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view')"
+        )
+        if not name.startswith("sqlite_")
+    }
+    schema = {
+        table: {
+            column: column_type or "TEXT"
+            for _, column, column_type, *_ in connection.execute(
+                f'PRAGMA table_info("{table}")'
+            )
+        }
+        for table in tables
+    }
+    for table, sql in tables.items():
+        if FTS5_TABLE_RE.match(sql):
+            # hidden columns: "WHERE people_fts = 'σαιξπηρ*'", rowid and rank
+            schema[table].update({table: "TEXT", "rowid": "INTEGER", "rank": "REAL"})
+    return schema
+
+
+class SQLValidator:
+    """Validates SQL queries against the schema of the database.
+
+    It uses its own read-only connection, so that the validation never waits
+    for the connections of the SQL executor. The schema is read again when
+    the version (e.g., the content hash of the database) changes.
+    """
+
+    def __init__(self, db_path, version=None, dialect="sqlite"):
+        self.db_path = db_path
+        self.version = version
+        self.dialect = dialect
+        self._connection = None
+        self._schema = None
+        self._table_names = set()
+        self._cached_version = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        version = self.version() if callable(self.version) else self.version
+        if self._connection is not None and version == self._cached_version:
+            return
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = connect_read_only(self.db_path)
+        self._schema = read_schema(self._connection)
+        self._table_names = {table.lower() for table in self._schema}
+        self._cached_version = version
+
+    def validate(self, sql_cmd):
+        """Returns the problems of the query; an empty list means it is valid"""
+        try:
+            statements = sqlglot.parse(sql_cmd, read=self.dialect)
+        except SqlglotError as e:
+            return [f"Parse error: {e}"]
+        statements = [statement for statement in statements if statement is not None]
+        if len(statements) != 1:
+            return ["Expected a single SQL statement"]
+        tree = statements[0]
+        if not isinstance(tree, exp.Query) or tree.find(*_FORBIDDEN_EXPRESSIONS):
+            return ["Only SELECT queries are allowed"]
+
+        with self._lock:
+            self._refresh()
+            cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+            unknown_tables = {
+                table.name
+                for table in tree.find_all(exp.Table)
+                if table.name.lower() not in self._table_names | cte_names
+            }
+            if unknown_tables:
+                return [f"Unknown tables: {', '.join(sorted(unknown_tables))}"]
+            try:
+                qualify(
+                    tree.copy(),
+                    schema=self._schema,
+                    dialect=self.dialect,
+                    validate_qualify_columns=True,
+                )
+            except SqlglotError as e:
+                return [str(e)]
+            try:
+                self._connection.execute(f"EXPLAIN {sql_cmd}").fetchall()
+            except sqlite3.Error as e:
+                return [str(e)]
+        return []
@@ -0,0 +1,334 @@
+"""Local table selection, to skip the LLM decider of SQLDatabaseSequentialChain.
+
+The decider only chooses among six tables, which is easy to do locally:
+1. Greek keyword rules on the normalized question (e.g., "ηθοποιος", "εργα
+   του", "φωτογραφιες" or venue words), applied to word stems.
+2. A naive Bayes classifier (one per table) trained on the logged outputs of
+   the LLM decider (DECIDER_LOG_PATH, one JSON line per question).
+The rules are applied first. The classifier is only consulted for the
+questions that the rules can't route, which are the questions that the decider
+is called for and that it is trained on: the questions that no rule matches,
+and those that only match the play, media or venue rules but name a person
+without a role (e.g., "Παραστάσεις του Μινωτή": as an actor or the director?).
+It is used if its confidence is at least min_confidence. Otherwise the LLM decider is called and its output is logged,
+so that the classifier improves over time.
+
+Accuracy against the decider on the prompt lists:
+    python -m nt_chat.table_router quality_assessment_prompts.txt test_prompt_list
+(add --record to run the LLM decider for the prompts that were not logged).
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from nt_chat.cache import normalize_query
+
+TABLES = ("plays", "works", "playworks", "actors", "authors", "people")
+
+# rule name -> (word stems, tables); the stems are matched at the start of a
+# word of the normalized question (no accents, lowercase)
+RULES = {
+    "actor": (
+        "ηθοποι επαιξ παιζ παιξ πρωταγωνιστ ερμηνευ ρολ συμμετ μερος".split(),
+        {"actors", "people", "plays"},
+    ),
+    "author": (
+        "εγραψ γραψ συγγραφ ποιητ δραματουργ θεατρικογραφ".split(),
+        {"authors", "people", "works"},
+    ),
+    "director": (["σκηνοθε"], {"people", "plays"}),
+    "work": (
+        (
+            "εργ κειμεν βιβλι τραγωδ κωμωδ ελληνικ ισπανικ αγγλικ γαλλικ "
+            "γερμανικ ιταλικ ρωσικ αρχαι"
+        ).split(),
+        {"works", "playworks", "plays"},
+    ),
+    "play": ("παραστασ ανεβ παρουσια παιχτ τελευται προσφατ".split(), {"plays"}),
+    "media": (
+        (
+            "φωτογραφ φωτο βιντεο ηχ αφισ ποστερ προγραμμ κοστουμ παρτιτουρ μουσικ "
+            "μαγνητοσκοπ υλικ εκδοσ δημοσιευ μακετ σκηνογραφ σκηνικ"
+        ).split(),
+        {"plays"},
+    ),
+    "venue": ("θεατρ σκην περιοδει εξωτερικ επιδαυρ ρεβω τσιλλερ".split(), {"plays"}),
+}
+# "έργα του Σαίξπηρ": the genitive after a work belongs to its author
+_WORKS_OF_RE = re.compile(r"\bεργ\w* (?:του|της|των) ")
+# "ξανά-": ξαναπαρουσιάστηκε, ξαναανέβηκε
+_RULE_RES = {
+    name: re.compile(r"\b(?:ξανα)?(?:%s)" % "|".join(stems))
+    for name, (stems, _) in RULES.items()
+}
+# The rules that tell the role of the people of a question
+_PERSON_RULES = {"actor", "author", "director"}
+_WORD_RE = re.compile(r"\w+")
+_MIN_TOKEN_LENGTH = 2
+_STEM_LENGTH = 5
+
+
+def add_join_tables(tables):
+    """Adds the tables that are needed to join the selected ones"""
+    tables = set(tables)
+    if "actors" in tables:
+        tables |= {"people", "plays"}
+    if "authors" in tables:
+        tables |= {"people", "works"}
+    if "works" in tables and "plays" in tables:
+        tables.add("playworks")
+    if "plays" in tables:
+        # the denormalized plays of create_mini_db.py (if the database has it)
+        tables.add("play_summary")
+    return tables
+
+
+def rule_matches(question):
+    """Names of the rules that match the (normalized) question"""
+    matches = [name for name, rule_re in _RULE_RES.items() if rule_re.search(question)]
+    if _WORKS_OF_RE.search(question):
+        matches.append("author")
+    return matches
+
+
+def rule_tables(question):
+    """Tables selected by the keyword rules (empty if no rule matches)"""
+    tables = set()
+    for name in rule_matches(question):
+        tables |= RULES[name][1]
+    return add_join_tables(tables) if tables else set()
+
+
+def proper_names(question):
+    """The capitalized words of the (raw) question that no rule matches, except
+    the first one, e.g., Κατίνα and Παξινού in "Παραστάσεις με την Κατίνα
+    Παξινού"; acronyms such as ΕΘ are not names"""
+    return [
+        word
+        for word in _WORD_RE.findall(question)[1:]
+        if len(word) > 1
+        and word[0].isupper()
+        and not word.isupper()
+        and not rule_matches(normalize_query(word))
+    ]
+
+
+def features(question):
+    """Word stems and rule matches of the normalized question"""
+    tokens = [t for t in question.split() if len(t) >= _MIN_TOKEN_LENGTH]
+    return {t[:_STEM_LENGTH] for t in tokens} | {
+        f"rule:{name}" for name in rule_matches(question)
+    }
+
+
+class NaiveBayesTableClassifier:
+    """One multinomial naive Bayes classifier per table (in/out)"""
+
+    def __init__(self, tables=TABLES, alpha=1.0):
+        self.tables = tables
+        self.alpha = alpha
+        self.num_examples = 0
+        self.vocabulary = set()
+        # table -> [Counter of features when out, Counter of features when in]
+        self._counts = {table: [Counter(), Counter()] for table in tables}
+        self._class_counts = {table: [0, 0] for table in tables}
+
+    def fit(self, questions, table_sets):
+        for question, tables in zip(questions, table_sets):
+            question_features = features(normalize_query(question))
+            self.vocabulary |= question_features
+            for table in self.tables:
+                label = int(table in tables)
+                self._class_counts[table][label] += 1
+                self._counts[table][label].update(question_features)
+            self.num_examples += 1
+        return self
+
+    def predict_proba(self, question):
+        """table -> probability that the table is needed"""
+        question_features = features(normalize_query(question)) & self.vocabulary
+        probabilities = {}
+        for table in self.tables:
+            log_probs = []
+            for label in (0, 1):
+                counts = self._counts[table][label]
+                total = sum(counts.values()) + self.alpha * len(self.vocabulary)
+                log_prob = math.log(
+                    (self._class_counts[table][label] + self.alpha)
+                    / (self.num_examples + 2 * self.alpha)
+                )
+                for feature in question_features:
+                    log_prob += math.log((counts[feature] + self.alpha) / total)
+                log_probs.append(log_prob)
+            diff = max(min(log_probs[0] - log_probs[1], 700), -700)
+            probabilities[table] = 1 / (1 + math.exp(diff))
+        return probabilities
+
+
+class TableRouter:
+    """Chooses the tables of a question locally, or returns None if unsure.
+
+    The outputs of the LLM decider are appended to log_path by record() and
+    the classifier is trained on them (once there are min_examples).
+    """
+
+    def __init__(self, log_path=None, min_confidence=0.9, min_examples=20):
+        self.log_path = log_path
+        self.min_confidence = min_confidence
+        self.min_examples = min_examples
+        self.classifier = None
+        self._lock = threading.Lock()
+        if log_path and os.path.dirname(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        if log_path and os.path.exists(log_path):
+            logged = read_decider_log(log_path)
+            self.fit(list(logged), list(logged.values()))
+
+    def fit(self, questions, table_sets):
+        if len(questions) >= self.min_examples:
+            self.classifier = NaiveBayesTableClassifier().fit(questions, table_sets)
+        return self
+
+    def route(self, question):
+        """Returns (tables, confidence, source); tables is None if the LLM
+        decider should be used"""
+        normalized_question = normalize_query(question)
+        tables = rule_tables(normalized_question)
+        if tables and (
+            _PERSON_RULES.intersection(rule_matches(normalized_question))
+            or not proper_names(question)
+        ):
+            return sorted(tables), 1.0, "rules"
+        # only the questions that the rules can't route reach the decider, so
+        # the classifier has never seen the others
+        if self.classifier is not None:
+            probabilities = self.classifier.predict_proba(question)
+            confidence = min(max(p, 1 - p) for p in probabilities.values())
+            predicted = {table for table, p in probabilities.items() if p >= 0.5}
+            if predicted and confidence >= self.min_confidence:
+                # the tables of the rules that matched are needed too
+                return sorted(add_join_tables(predicted | tables)), confidence, (
+                    "classifier"
+                )
+        return None, 0.0, "llm"
+
+    def record(self, question, tables):
+        """Logs an output of the LLM decider"""
+        if not self.log_path:
+            return
+        line = json.dumps({"question": question, "tables": tables}, ensure_ascii=False)
+        with self._lock:
+            with open(self.log_path, "a", encoding="utf-8") as log_file:
+                log_file.write(line + "\n")
+
+
+def read_decider_log(path):
+    """question -> tables of the LLM decider (the last output wins)"""
+    logged = {}
+    with open(path, "r", encoding="utf-8") as log_file:
+        for line in log_file:
+            if line.strip():
+                entry = json.loads(line)
+                logged[entry["question"]] = set(entry["tables"])
+    return logged
+
+
+def evaluate(router, labeled, folds=5):
+    """Compares the router with the decider; the classifier is evaluated with
+    k-fold cross-validation on the labeled questions"""
+    questions = list(labeled)
+    report = Counter()
+    for fold in range(folds):
+        test = questions[fold::folds]
+        train = [q for i, q in enumerate(questions) if i % folds != fold]
+        fold_router = TableRouter(
+            min_confidence=router.min_confidence, min_examples=router.min_examples
+        )
+        if train:
+            fold_router.fit(train, [labeled[q] for q in train])
+        for question in test:
+            tables, _, source = fold_router.route(question)
+            report["total"] += 1
+            report[source] += 1
+            if tables is None:
+                continue
+            expected = add_join_tables(labeled[question])
+            report["exact"] += set(tables) == expected
+            report["superset"] += set(tables) >= expected
+    return report
+
+
+def print_report(report):
+    total = report["total"]
+    local = total - report["llm"]
+    print(f"{total} labeled prompts")
+    print(
+        f"routed locally: {local} ({local / max(total, 1):.1%}; "
+        f"rules {report['rules']}, classifier {report['classifier']}), "
+        f"LLM fallback: {report['llm']}"
+    )
+    print(f"exact match with the decider: {report['exact'] / max(local, 1):.1%}")
+    print(
+        "includes the decider tables: "
+        f"{report['superset'] / max(local, 1):.1%} of the locally routed prompts"
+    )
+
+
+def record_decider_outputs(router, prompts):
+    """Runs the LLM decider of the chain for the prompts and logs its outputs"""
+    from nt_chat.chain import db, make_chain
+
+    decider_chain = make_chain().decider_chain
+    table_names = db.get_usable_table_names()
+    for prompt in prompts:
+        tables = decider_chain.predict_and_parse(
+            query=prompt, table_names=", ".join(table_names)
+        )
+        router.record(prompt, [t for t in tables if t in table_names])
+
+
+def parse_args():
+    """Parse CLI arguments"""
+    parser = argparse.ArgumentParser(
+        description="Accuracy of the local table router against the LLM decider"
+    )
+    parser.add_argument("prompt_files", nargs="+", help="One prompt per line")
+    parser.add_argument("--log", default=None, help="Decider log (DECIDER_LOG_PATH)")
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="Run the LLM decider for the prompts that are not in the log",
+    )
+    parser.add_argument("--folds", type=int, default=5)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from nt_chat.config import (DECIDER_LOG_PATH, TABLE_ROUTER_MIN_CONFIDENCE,
+                                TABLE_ROUTER_MIN_EXAMPLES)
+
+    args = parse_args()
+    log_path = args.log or DECIDER_LOG_PATH
+    prompts = []
+    for prompt_file in args.prompt_files:
+        with open(prompt_file, "r", encoding="utf-8") as f:
+            prompts.extend(line.strip() for line in f if line.strip())
+    prompts = list(dict.fromkeys(prompts))
+    router = TableRouter(
+        log_path,
+        min_confidence=TABLE_ROUTER_MIN_CONFIDENCE,
+        min_examples=TABLE_ROUTER_MIN_EXAMPLES,
+    )
+    logged = read_decider_log(log_path) if os.path.exists(log_path) else {}
+    if args.record:
+        record_decider_outputs(router, [p for p in prompts if p not in logged])
+        logged = read_decider_log(log_path)
+    labeled = {prompt: logged[prompt] for prompt in prompts if prompt in logged}
+    if len(labeled) < len(prompts):
+        print(f"{len(prompts) - len(labeled)} prompts without a decider output")
+    print_report(evaluate(router, labeled, folds=args.folds))
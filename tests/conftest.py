@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from nt_chat.sql_executor import connect_read_only
+
+MINIMAL_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "minimal_nt.db")
+
+
+@pytest.fixture(scope="session")
+def minimal_db_path():
+    return MINIMAL_DB_PATH
+
+
+@pytest.fixture(scope="session")
+def minimal_db(minimal_db_path):
+    """Read-only connection to the shipped minimal_nt.db (with nt_normalize)"""
+    connection = connect_read_only(minimal_db_path)
+    yield connection
+    connection.close()
@@ -0,0 +1,22 @@
+USE [NT]
+GO
+SET IDENTITY_INSERT [dbo].[people] ON 
+GO
+INSERT [dbo].[people] ([personID], [personName], [personCountry], [personDateBirth], [personNotes], [created], [published]) VALUES (1, N'Κατίνα Παξινού', N'GR', N'1900', NULL, CAST(N'2023-03-15T12:48:59.843' AS DateTime), 1)
+INSERT [dbo].[people] ([personID], [personName], [personCountry], [personDateBirth], [personNotes], [created], [published]) VALUES (2, N'Ευγένιος O''Neill', N'US', NULL, N'Σημειώσεις
+
+γραμμή 2 (;) με ''εισαγωγικά'', κόμματα) και παρενθέσεις', CAST(N'2021-01-02T03:04:05.000' AS DateTime), 0)
+INSERT [dbo].[people] ([personID], [personName], [personCountry], [personDateBirth], [personNotes], [created], [published])
+VALUES (3, N'Σαίξπηρ, Ουίλιαμ', N'GB', N'1564', N'', CAST(N'2023-03-15T12:48:59.843' AS DateTime), NULL)
+GO
+SET IDENTITY_INSERT [dbo].[people] OFF
+GO
+INSERT [dbo].[plays] ([playID], [playTitle], [playGenreID], [playNotes], [created], [published]) VALUES (10, N'Αμφιτρύων', -1, N'Περιοδεία: Αθήνα
+Ρόδος', CAST(N'2023-03-15T12:48:59.843' AS DateTime), 1)
+INSERT [dbo].[plays] ([playID], [playTitle], [playGenreID], [playNotes], [created], [published]) VALUES (11, N'Ο βασιλιάς Ληρ', 0, NULL, CAST(N'2022-12-31T23:59:59.997' AS DateTime), -2)
+INSERT [dbo].[works] ([workID], [workTitle], [workLanguage], [workYear], [isTheoritical], [created]) VALUES (20, N'Αμφιτρύων', N'el', N'-190', 0, CAST(N'2023-03-15T12:48:59.843' AS DateTime))
+INSERT [dbo].[cmslogs] ([id], [message]) VALUES (1, N'ignored')
+INSERT [dbo].[actors] ([actorID], [playID], [personID], [actorRank], [actorRole], [created]) VALUES (100, 10, 1, 1, N'Αλκμήνη', CAST(N'2023-03-15T12:48:59.843' AS DateTime))
+INSERT [dbo].[actors] ([actorID], [playID], [personID], [actorRank], [actorRole], [created]) VALUES (101, 11, 2, -3, NULL, CAST(N'2023-03-15T12:48:59.843' AS DateTime))
+INSERT [dbo].[personToPerson] ([relID], [personID], [relPersonID]) VALUES (1, 3, 2)
+GO
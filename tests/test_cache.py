@@ -0,0 +1,113 @@
+import pytest
+
+from nt_chat.cache import PersistentCache, normalize_query
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "ψαχνω υλικο απο την ηλεκτρα",
+        # accents and dialytika
+        "ψάχνω υλικό από την ηλέκτρα",
+        # case and the final sigma
+        "ΨΑΧΝΩ ΥΛΙΚΟ ΑΠΟ ΤΗΝ ΗΛΕΚΤΡΑ",
+        "Ψάχνω υλικό από την Ηλέκτρα",
+        # punctuation (the Greek question mark too) and whitespace
+        "Ψάχνω   υλικό από την «Ηλέκτρα»;",
+        "  ψάχνω\tυλικό, από την Ηλέκτρα!\n",
+    ],
+)
+def test_normalize_query(question):
+    assert normalize_query(question) == "ψαχνω υλικο απο την ηλεκτρα"
+
+
+@pytest.mark.parametrize(
+    "text, normalized",
+    [
+        ("Σαίξπηρς", "σαιξπηρσ"),
+        ("Ρωμαΐδης", "ρωμαιδησ"),
+        ("Παραστάσεις 1986-1990", "παραστασεισ 1986 1990"),
+        ("ο/α υλικό", "ο α υλικο"),
+        ("", ""),
+    ],
+)
+def test_normalize_query_words(text, normalized):
+    assert normalize_query(text) == normalized
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.time of nt_chat.cache; advance it with clock[0] += seconds"""
+    now = [1_000_000.0]
+    monkeypatch.setattr("nt_chat.cache.time.time", lambda: now[0])
+    return now
+
+
+def test_get_set(tmp_path):
+    cache = PersistentCache(str(tmp_path / "cache.db"), "answers")
+    assert cache.get("q") is None
+    cache.set("q", {"answer": "Αμφιτρύων", "rows": [1, 2]})
+    assert cache.get("q") == {"answer": "Αμφιτρύων", "rows": [1, 2]}
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_namespaces(tmp_path):
+    answers = PersistentCache(str(tmp_path / "cache.db"), "answers")
+    sql = PersistentCache(str(tmp_path / "cache.db"), "sql")
+    answers.set("q", "answer")
+    sql.set("q", "SELECT 1")
+    assert (answers.get("q"), sql.get("q")) == ("answer", "SELECT 1")
+    answers.clear()
+    assert (answers.get("q"), sql.get("q")) == (None, "SELECT 1")
+
+
+def test_ttl(tmp_path, clock):
+    cache = PersistentCache(str(tmp_path / "cache.db"), "answers", ttl=60)
+    cache.set("q", "answer")
+    clock[0] += 60
+    assert cache.get("q") == "answer"
+    clock[0] += 1
+    assert cache.get("q") is None
+    assert len(cache) == 0
+
+
+def test_ttl_eviction_on_set(tmp_path, clock):
+    cache = PersistentCache(str(tmp_path / "cache.db"), "answers", ttl=60)
+    cache.set("old", "answer")
+    clock[0] += 61
+    cache.set("new", "answer")
+    assert len(cache) == 1
+
+
+def test_lru_size_bound(tmp_path, clock):
+    cache = PersistentCache(str(tmp_path / "cache.db"), "answers", maxsize=2)
+    for key in ("a", "b"):
+        cache.set(key, key)
+        clock[0] += 1
+    # "a" is now more recently used than "b"
+    assert cache.get("a") == "a"
+    clock[0] += 1
+    cache.set("c", "c")
+    assert len(cache) == 2
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("a", None, "c")
+
+
+def test_version(tmp_path):
+    version = ["v1"]
+    cache = PersistentCache(
+        str(tmp_path / "cache.db"), "answers", version=lambda: version[0]
+    )
+    cache.set("q", "answer")
+    assert cache.get("q") == "answer"
+    # e.g., the database has been rebuilt
+    version[0] = "v2"
+    assert cache.get("q") is None
+    cache.set("q", "new answer")
+    assert cache.get("q") == "new answer"
+    # an explicit version overrides the callable
+    assert cache.get("q", version="v1") is None
+
+
+def test_persistence(tmp_path):
+    PersistentCache(str(tmp_path / "cache.db"), "answers").set("q", "answer")
+    assert PersistentCache(str(tmp_path / "cache.db"), "answers").get("q") == "answer"
@@ -0,0 +1,130 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+from convert_mssql_to_sqlite import (LITERAL_RE, create_sqlite_tables,
+                                     insert_db_entries, insert_rows,
+                                     join_statement_lines,
+                                     parse_insert_statement, parse_values)
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.mark.parametrize(
+    "values, parsed",
+    [
+        ("1, N'Παξινού', NULL)", (1, "Παξινού", None)),
+        ("null , 'x' )", (None, "x")),
+        # escaped quotes
+        ("N'O''Neill', N'''', N'')", ("O'Neill", "'", "")),
+        # commas and parentheses in the strings
+        ("N'a), (b', N'(;)')", ("a), (b", "(;)")),
+        # multi-line strings
+        ("N'γραμμή 1\n\nγραμμή 2', 3)", ("γραμμή 1\n\nγραμμή 2", 3)),
+        # CAST
+        (
+            "CAST(N'2023-03-15T12:48:59.843' AS DateTime), 1)",
+            ("2023-03-15T12:48:59.843", 1),
+        ),
+        ("CAST(-1 AS int), CAST(2.50 AS Decimal(10, 2)))", (-1, 2.5)),
+        ("CAST(0x1F AS VarBinary(max)))", (31,)),
+        # numbers
+        ("-1, +2, -2.5, .5, 1e3, 0x0A)", (-1, 2, -2.5, 0.5, 1000.0, 10)),
+    ],
+)
+def test_parse_values(values, parsed):
+    assert parse_values(values) == parsed
+
+
+def test_parse_values_start():
+    statement = "INSERT [dbo].[t] ([a]) VALUES (7)"
+    assert parse_values(statement, statement.index("(7") + 1) == (7,)
+
+
+@pytest.mark.parametrize("values", ["GETDATE())", "N'unterminated)", "1 2)"])
+def test_parse_values_error(values):
+    with pytest.raises(ValueError, match="Unexpected value"):
+        parse_values(values)
+
+
+@pytest.mark.parametrize(
+    "literal, group",
+    [
+        ("N'x',", "string"),
+        ("NULL)", "null"),
+        ("CAST(N'2023-03-15' AS Date))", "cast_string"),
+        ("-12,", "integer"),
+        ("-1.5E-3,", "float"),
+        ("0xFF,", "hex"),
+    ],
+)
+def test_literal_re(literal, group):
+    assert LITERAL_RE.match(literal).lastgroup == group
+
+
+def test_multi_line_statement():
+    lines = [
+        "INSERT [dbo].[plays] ([playID], [playNotes])\n",
+        "VALUES (10, N'Αθήνα\n",
+        "\n",
+        "  Ρόδος (;) ή Κύπρος')\n",
+        "GO\n",
+    ]
+    statements = list(join_statement_lines(lines))
+    assert len(statements) == 2
+    assert parse_insert_statement(statements[0]) == (
+        "plays",
+        "[playID], [playNotes]",
+        (10, "Αθήνα  Ρόδος ή Κύπρος"),
+    )
+    assert parse_insert_statement(statements[0], ignore_tables={"plays"}) is None
+    assert parse_insert_statement(statements[1]) is None
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_synthetic_dump(tmp_path, workers):
+    """mssql_dump.json holds the rows of mssql_dump.sql as converted by the
+    script before the streaming parser (extract_insert_statements)"""
+    sqlite_db_name = str(tmp_path / "nt.db")
+    create_sqlite_tables(sqlite_db_name)
+    insert_db_entries(
+        sqlite_db_name,
+        os.path.join(FIXTURES_PATH, "mssql_dump.sql"),
+        "utf-8",
+        workers=workers,
+    )
+    with open(os.path.join(FIXTURES_PATH, "mssql_dump.json"), encoding="utf-8") as f:
+        expected_rows = json.load(f)
+    conn = sqlite3.connect(sqlite_db_name)
+    table_names = [
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    ]
+    rows = {}
+    for table_name in table_names:
+        table_rows = conn.execute(f'SELECT * FROM "{table_name}"').fetchall()
+        if table_rows:
+            rows[table_name] = [list(row) for row in table_rows]
+    conn.close()
+    assert rows == expected_rows
+    # the types too (json keeps 1 and 1.0 apart)
+    assert repr(rows) == repr(expected_rows)
+
+
+def test_insert_rows_errors():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.execute("CREATE TABLE plays (playID INTEGER PRIMARY KEY, playTitle TEXT)")
+    cursor = conn.cursor()
+    rows = [
+        (1, "Αμφιτρύων"),
+        (1, "duplicate playID"),
+        (2**63, "overflow"),
+        (3, "Ο βασιλιάς Ληρ"),
+    ]
+    assert insert_rows(cursor, "plays", "playID, playTitle", rows) == 2
+    assert conn.execute("SELECT playID FROM plays").fetchall() == [(1,), (3,)]
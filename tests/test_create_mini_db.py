@@ -0,0 +1,35 @@
+import pytest
+
+from create_mini_db import canonical_person_ids
+
+
+@pytest.mark.parametrize(
+    "pairs, canonical_ids",
+    [
+        # chain A -> B -> C, in any order of the pairs
+        ([(3, 2), (2, 1)], {2: 1, 3: 1}),
+        ([(1, 2), (2, 3)], {2: 1, 3: 1}),
+        ([(2, 3), (1, 2)], {2: 1, 3: 1}),
+        # two chains joined by a later pair
+        ([(5, 4), (3, 2), (4, 2)], {3: 2, 4: 2, 5: 2}),
+        # cycles
+        ([(1, 2), (2, 3), (3, 1)], {2: 1, 3: 1}),
+        ([(7, 9), (9, 7)], {9: 7}),
+        # the root is the lowest personID, not the first seen
+        ([(9, 8), (8, 5), (9, 6)], {6: 5, 8: 5, 9: 5}),
+        # separate clusters
+        ([(1, 2), (10, 11)], {2: 1, 11: 10}),
+        # self pairs and missing IDs are not duplicates
+        ([(7, 7), (None, 3), (4, None)], {}),
+        ([], {}),
+    ],
+)
+def test_canonical_person_ids(pairs, canonical_ids):
+    assert canonical_person_ids(pairs) == canonical_ids
+
+
+def test_canonical_person_ids_long_chain():
+    pairs = [(person_id + 1, person_id) for person_id in range(1, 10000)]
+    assert canonical_person_ids(reversed(pairs)) == {
+        person_id: 1 for person_id in range(2, 10001)
+    }
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from db_delta import apply_delta, data_tables
+
+SCHEMA = """
+CREATE TABLE people (personID INTEGER PRIMARY KEY, personName TEXT);
+CREATE TABLE playworks (playID INTEGER, workID INTEGER, PRIMARY KEY (playID, workID));
+CREATE TABLE actors (playID INTEGER, personID INTEGER, role TEXT);
+"""
+
+OLD_ROWS = {
+    "people": [(1, "Κατίνα Παξινού"), (2, "Αλέξης Μινωτής"), (3, "Σαίξπηρ")],
+    "playworks": [(1, 1), (1, 2), (2, 3)],
+    # no primary key, with duplicate rows
+    "actors": [(1, 1, "Ηλέκτρα"), (1, 2, None), (1, 2, None), (2, 1, "Μήδεια")],
+}
+
+NEW_ROWS = {
+    # updated, deleted and inserted rows
+    "people": [(1, "Κατίνα Παξινού"), (2, "Αλέξης Μινωτής (σκηνοθέτης)"), (4, "1")],
+    "playworks": [(1, 1), (2, 3), (2, 4)],
+    "actors": [(1, 1, "Ηλέκτρα"), (1, 2, None), (2, 1, "Μήδεια"), (2, 1, "Μήδεια")],
+}
+
+
+def create_db(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    for table_name, table_rows in rows.items():
+        placeholders = ", ".join("?" * len(table_rows[0]))
+        conn.executemany(
+            f"INSERT INTO {table_name} VALUES ({placeholders})", table_rows
+        )
+    conn.commit()
+    conn.close()
+
+
+def table_rows(db_path):
+    """{table: sorted rows}, with the type of every value"""
+    conn = sqlite3.connect(db_path)
+    rows = {
+        table_name: sorted(
+            conn.execute(f'SELECT * FROM "{table_name}"').fetchall(), key=repr
+        )
+        for table_name in data_tables(conn)
+    }
+    conn.close()
+    return {
+        table_name: [[(type(value), value) for value in row] for row in table_rows]
+        for table_name, table_rows in rows.items()
+    }
+
+
+@pytest.fixture
+def db_paths(tmp_path):
+    old_db_path, new_db_path = tmp_path / "old.db", tmp_path / "new.db"
+    create_db(old_db_path, OLD_ROWS)
+    create_db(new_db_path, NEW_ROWS)
+    return str(old_db_path), str(new_db_path)
+
+
+def test_delta_matches_rebuild(db_paths):
+    old_db_path, new_db_path = db_paths
+    delta = apply_delta(old_db_path, new_db_path)
+    assert table_rows(old_db_path) == table_rows(new_db_path)
+    assert delta["people"] == {"inserted": [(4,)], "updated": [(2,)], "deleted": [(3,)]}
+    assert delta["playworks"] == {
+        "inserted": [(2, 4)],
+        "updated": [],
+        "deleted": [(1, 2)],
+    }
+    assert delta["actors"] == {
+        "inserted": [(2, 1, "Μήδεια")],
+        "updated": [],
+        "deleted": [(1, 2, None)],
+    }
+
+
+def test_delta_of_the_same_db_is_empty(db_paths):
+    old_db_path, _ = db_paths
+    assert apply_delta(old_db_path, old_db_path) == {}
+
+
+def test_schema_change(db_paths):
+    old_db_path, new_db_path = db_paths
+    conn = sqlite3.connect(new_db_path)
+    conn.execute("ALTER TABLE people ADD COLUMN personURL TEXT")
+    conn.commit()
+    conn.close()
+    with pytest.raises(ValueError, match="schema of people has changed"):
+        apply_delta(old_db_path, new_db_path)
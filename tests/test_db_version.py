@@ -0,0 +1,18 @@
+import shutil
+
+from nt_chat.db_version import DatabaseVersion
+
+
+def test_missing_database(tmp_path, minimal_db_path):
+    db_path = tmp_path / "nt.db"
+    db_version = DatabaseVersion(str(db_path))
+    assert db_version() is None
+    assert not db_version.check()
+
+    swaps = []
+    db_version.on_swap(lambda: swaps.append(db_version()))
+    shutil.copyfile(minimal_db_path, db_path)
+    assert db_version.check()
+    assert swaps == [None]
+    assert db_version() is not None
+    assert not db_version.check()
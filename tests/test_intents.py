@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+from nt_chat.intents import IntentMatcher
+
+PROMPT_LIST_PATH = os.path.join(os.path.dirname(__file__), "..", "test_prompt_list")
+
+
+@pytest.fixture(scope="module")
+def matcher(minimal_db_path):
+    return IntentMatcher(minimal_db_path)
+
+
+def rows(minimal_db, match):
+    """All the rows of the SQL template, without its LIMIT"""
+    sql_cmd = match.sql_cmd.rsplit("LIMIT", 1)[0]
+    return minimal_db.execute(sql_cmd).fetchall()
+
+
+# Without a role cue, a person may be an actor or the director of the plays
+@pytest.mark.parametrize(
+    "question, num_rows",
+    [
+        ("Παραστάσεις με την Κατίνα Παξινού", 76),
+        ("Υπάρχουν βίντεο με την Παξινού;", 0),
+        ("Φωτογραφίες της Παξινού", 63),
+        ("Παραστάσεις του Μπινιάρη", 141),
+    ],
+)
+def test_person_without_role_cue(matcher, minimal_db, question, num_rows):
+    match = matcher.match(question)
+    assert match.intent == "plays_of_person"
+    assert len(rows(minimal_db, match)) == num_rows
+
+
+@pytest.mark.parametrize(
+    "question, intent, num_rows",
+    [
+        ("Σε ποιες παραστάσεις έπαιξε η Παξινού;", "plays_with_actor", 76),
+        ("Σε ποιες παραστάσεις πρωταγωνίστησε η Παξινού;", "plays_with_actor", 21),
+        ("Παραστάσεις σε σκηνοθεσία Μπινιάρη", "plays_by_director", 2),
+    ],
+)
+def test_person_with_role_cue(matcher, minimal_db, question, intent, num_rows):
+    match = matcher.match(question)
+    assert match.intent == intent
+    assert len(rows(minimal_db, match)) == num_rows
+
+
+# The questions of test_prompt_list: (question, intent, non-empty slots, rows);
+# None is a question for the LLM chain
+PROMPT_LIST_CASES = [
+    (
+        "Άκουσα τη φωνή του Ντίνου Ηλιόπουλου στο αρχείο ήχου της παράστασης. "
+        "Υπάρχει ο ίδιος ηθοποιός σε μαγνητοσκοπημένη παράσταση;",
+        None,
+        None,
+        None,
+    ),
+    (
+        "Έχει ξαναπαρουσιαστεί ο Ιππόλυτος από το ΕΘ;",
+        "plays_by_title",
+        {"plays": [204, 629, 631, 728, 750, 781, 825, 866, 2114, 2357]},
+        10,
+    ),
+    ("Έχουν ανέβει ισπανικά έργα στο ΕΘ;", None, None, None),
+    (
+        "Θέλω να δω ελληνικά έργα που ανέβηκαν στο ΕΘ τα τελευταία χρόνια.",
+        None,
+        None,
+        None,
+    ),
+    (
+        "Μπορείς να μου πεις αν σε κάποιο από αυτά τα έργα έπαιξε η Μαρία Ναυπλιώτου;",
+        None,
+        None,
+        None,
+    ),
+    (
+        "Ψάχνω ο/α υλικό από παραστάσεις του Αμφιτρύωνα που ανέβηκαν στο Εθνικό "
+        "Θέατρο.",
+        "play_media",
+        {"plays": [15, 2086]},
+        2,
+    ),
+    (
+        "Ψάχνω υλικό από παραστάσεις της Ηλέκτρας.",
+        "play_media",
+        {
+            "plays": [
+                185, 581, 617, 672, 684, 687, 738, 812, 830,
+                831, 854, 865, 874, 881, 895, 902, 2215, 2309,
+            ]
+        },
+        18,
+    ),
+    ("βρες μου ο/α υλικό από παραστάσεις που έχει γράψει ο Μολιέρος", None, None, None),
+    (
+        "βρες μου παραστάσεις που έχει γράψει ο Σαίξπηρ",
+        "plays_by_author",
+        {"people": [3661]},
+        72,
+    ),
+    (
+        "βρες μου παραστάσεις που πρωταγωνιστεί η Παξινού",
+        "plays_with_actor",
+        {"people": [2419]},
+        # only the leading roles (actors.protagonist = 1)
+        21,
+    ),
+    ("βρες μου τελευταίες παραστάσεις", "latest_plays", {}, 1168),
+    (
+        "βρες μου φωτογραφίες από παραστάσεις του Αμφιτρύων",
+        "play_media",
+        {"plays": [15, 2086]},
+        2,
+    ),
+]
+
+
+@pytest.mark.parametrize("question, intent, slots, num_rows", PROMPT_LIST_CASES)
+def test_prompt_list(matcher, minimal_db, question, intent, slots, num_rows):
+    match = matcher.match(question)
+    if intent is None:
+        assert match is None
+        return
+    assert match.intent == intent
+    assert match.confidence == 1.0
+    assert {name: value for name, value in match.slots.items() if value} == slots
+    assert len(rows(minimal_db, match)) == num_rows
+
+
+def test_prompt_list_is_covered():
+    with open(PROMPT_LIST_PATH, encoding="utf-8") as f:
+        questions = {line.strip() for line in f if line.strip()}
+    assert questions == {case[0] for case in PROMPT_LIST_CASES}
@@ -0,0 +1,84 @@
+import pytest
+
+from nt_chat.result_cache import canonicalize_sql
+
+CANONICAL_SQL = (
+    "SELECT people.personname FROM people "
+    "WHERE people.personname LIKE '%Σαίξπηρ%'"
+)
+
+
+@pytest.mark.parametrize(
+    "sql_cmd",
+    [
+        "SELECT people.personName FROM people "
+        "WHERE people.personName LIKE '%Σαίξπηρ%'",
+        # whitespace, keyword and identifier case
+        "select  People.PERSONNAME\nfrom PEOPLE\nwhere people.personname "
+        "like '%Σαίξπηρ%';",
+        # table aliases
+        "SELECT p.personName FROM people p WHERE p.personName LIKE '%Σαίξπηρ%'",
+        "SELECT x.personName FROM people AS x WHERE x.personName LIKE '%Σαίξπηρ%'",
+    ],
+)
+def test_same_canonical_sql(sql_cmd):
+    assert canonicalize_sql(sql_cmd) == (CANONICAL_SQL, None)
+
+
+def test_string_literals_are_kept():
+    canonical_sql, _ = canonicalize_sql(
+        "SELECT people.personName FROM people WHERE people.personName LIKE '%σαίξπηρ%'"
+    )
+    assert canonical_sql != CANONICAL_SQL
+
+
+def test_self_join_aliases():
+    canonical_sql, _ = canonicalize_sql(
+        "SELECT a.personName, b.personName FROM people a "
+        "JOIN people b ON a.personID < b.personID"
+    )
+    assert canonical_sql == (
+        "SELECT t0.personname, t1.personname FROM people AS t0 "
+        "JOIN people AS t1 ON t0.personid < t1.personid"
+    )
+
+
+@pytest.mark.parametrize(
+    "sql_cmd, limit",
+    [
+        (CANONICAL_SQL + " LIMIT 10", 10),
+        (CANONICAL_SQL + " LIMIT 20;", 20),
+        (CANONICAL_SQL, None),
+    ],
+)
+def test_top_level_limit_is_stripped(sql_cmd, limit):
+    assert canonicalize_sql(sql_cmd) == (CANONICAL_SQL, limit)
+
+
+@pytest.mark.parametrize(
+    "sql_cmd",
+    [
+        # an OFFSET or a non-numeric LIMIT changes the rows
+        "SELECT plays.playtitle FROM plays LIMIT 10 OFFSET 5",
+        "SELECT plays.playtitle FROM plays LIMIT 5 + 5",
+        # the LIMIT of a subquery is part of the query
+        "SELECT plays.playtitle FROM plays WHERE plays.playid IN "
+        "(SELECT actors.playid FROM actors LIMIT 10)",
+    ],
+)
+def test_other_limits_are_kept(sql_cmd):
+    canonical_sql, limit = canonicalize_sql(sql_cmd)
+    assert limit is None
+    assert "LIMIT" in canonical_sql
+
+
+@pytest.mark.parametrize(
+    "sql_cmd",
+    [
+        "DELETE FROM plays",
+        "SELECT 1; SELECT 2",
+        "SELECT FROM WHERE",
+    ],
+)
+def test_uncacheable(sql_cmd):
+    assert canonicalize_sql(sql_cmd) == (None, None)
@@ -0,0 +1,43 @@
+import sqlite3
+
+from sqlalchemy import create_engine
+
+from nt_chat.sql_database import CachedSQLDatabase
+
+
+def create_db(db_path, *statements):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE plays (playID INTEGER PRIMARY KEY, playTitle TEXT)")
+    conn.execute("INSERT INTO plays VALUES (1, 'Αμφιτρύων')")
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def test_reflect_rebuilt_database(tmp_path):
+    db_path = tmp_path / "nt.db"
+    create_db(db_path, "CREATE TABLE logs (id INTEGER)")
+    version = ["v1"]
+    db = CachedSQLDatabase(
+        create_engine(f"sqlite:///{db_path}"),
+        version=lambda: version[0],
+        ignore_tables=["logs"],
+        sample_rows_in_table_info=1,
+    )
+    assert list(db.get_usable_table_names()) == ["plays"]
+    assert not db.full_text_tables
+
+    # a rebuilt database with a new table and full-text indexes
+    db_path.unlink()
+    create_db(
+        db_path,
+        "CREATE TABLE logs (id INTEGER)",
+        "CREATE TABLE people (personID INTEGER PRIMARY KEY, personName TEXT)",
+        "CREATE VIRTUAL TABLE people_fts USING fts5(personName)",
+    )
+    version[0] = "v2"
+    assert list(db.get_usable_table_names()) == ["people", "plays"]
+    assert db.full_text_tables == {"people_fts"}
+    assert "CREATE TABLE people" in db.get_table_info(["people"])
+    assert "Αμφιτρύων" in db.get_table_info()
@@ -0,0 +1,65 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from nt_chat.sql_executor import (SQLExecutor, SQLExecutorBusy,
+                                  connect_read_only)
+
+
+def test_cancelled_query_keeps_its_slot(minimal_db_path):
+    executor = SQLExecutor(minimal_db_path, pool_size=1, queue_depth=0)
+    release = threading.Event()
+    # a query that can't be interrupted until release is set
+    executor._connections.queue[0].create_function(
+        "wait_for_release", 0, lambda: release.wait(5)
+    )
+
+    async def main():
+        task = asyncio.ensure_future(executor.afetch_rows("SELECT wait_for_release()"))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the thread is still running the cancelled query
+        with pytest.raises(SQLExecutorBusy):
+            await executor.afetch_rows("SELECT 1")
+        release.set()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                return await executor.afetch_rows("SELECT 1")
+            except SQLExecutorBusy:
+                await asyncio.sleep(0.01)
+
+    try:
+        assert asyncio.run(main()) == [(1,)]
+    finally:
+        release.set()
+        executor.close()
+
+
+def test_swap_closes_every_old_connection(minimal_db_path, monkeypatch):
+    connections = []
+
+    def connect(db_path, mmap_size=0):
+        connections.append(connect_read_only(db_path, mmap_size))
+        return connections[-1]
+
+    monkeypatch.setattr("nt_chat.sql_executor.connect_read_only", connect)
+    executor = SQLExecutor(minimal_db_path, pool_size=2)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        queries = [
+            pool.submit(executor.fetch_rows, "SELECT count(*) FROM actors")
+            for _ in range(200)
+        ]
+        for _ in range(20):
+            executor.swap()
+        assert all(query.result() for query in queries)
+    executor.close()
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
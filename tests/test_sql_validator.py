@@ -0,0 +1,58 @@
+import pytest
+
+from nt_chat.sql_validator import SQLValidator
+
+
+@pytest.fixture(scope="module")
+def validator(minimal_db_path):
+    return SQLValidator(minimal_db_path)
+
+
+@pytest.mark.parametrize(
+    "sql_cmd",
+    [
+        # aliases
+        "SELECT p.personName, pl.playTitle FROM people p "
+        "JOIN plays pl ON pl.directorID = p.personID LIMIT 10;",
+        "SELECT plays.playTitle AS title FROM plays ORDER BY title LIMIT 10",
+        # CTE
+        "WITH directors AS (SELECT DISTINCT plays.directorID FROM plays) "
+        "SELECT people.personName FROM people "
+        "JOIN directors ON directors.directorID = people.personID LIMIT 10",
+        # GROUP_CONCAT
+        "SELECT plays.playTitle, GROUP_CONCAT(people.personName, ', ') "
+        "FROM plays JOIN actors ON actors.playID = plays.playID "
+        "JOIN people ON people.personID = actors.personID "
+        "GROUP BY plays.playID LIMIT 10",
+        # nt_normalize
+        "SELECT people.personURL FROM people WHERE people.personNameNormalized "
+        "LIKE '%' || nt_normalize('Σαίξπηρ') || '%' LIMIT 10",
+    ],
+)
+def test_accepted(validator, sql_cmd):
+    assert validator.validate(sql_cmd) == []
+
+
+@pytest.mark.parametrize(
+    "sql_cmd, problem",
+    [
+        ("SELECT plays.playName FROM plays", "Unknown column: playname"),
+        ("SELECT p.name FROM people p", "Unknown column: name"),
+        ("SELECT playTitle FROM shows", "Unknown tables: shows"),
+        ("DELETE FROM plays", "Only SELECT queries are allowed"),
+        ("UPDATE people SET personName = 'x'", "Only SELECT queries are allowed"),
+        ("DROP TABLE plays", "Only SELECT queries are allowed"),
+        (
+            "SELECT plays.playTitle FROM plays; DELETE FROM plays",
+            "Expected a single SQL statement",
+        ),
+        (
+            "SELECT plays.playTitle FROM plays; SELECT people.personName FROM people",
+            "Expected a single SQL statement",
+        ),
+    ],
+)
+def test_rejected(validator, sql_cmd, problem):
+    problems = validator.validate(sql_cmd)
+    assert len(problems) == 1
+    assert problem in problems[0]
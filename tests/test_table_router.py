@@ -0,0 +1,62 @@
+import pytest
+
+from nt_chat.table_router import TableRouter
+
+# decider outputs of questions that no rule matches
+LOGGED = {
+    "Ποιος είναι ο Σαίξπηρ;": {"people"},
+    "Ποια είναι η Κατίνα Παξινού;": {"people"},
+    "Ποιος ήταν ο Αλέξης Μινωτής;": {"people"},
+}
+
+
+def test_rules_before_classifier():
+    router = TableRouter(min_confidence=0.5, min_examples=1)
+    router.fit(list(LOGGED), list(LOGGED.values()))
+    # a question of the kind the classifier was trained on
+    tables, _, source = router.route("Ποιος είναι ο Μπινιάρης;")
+    assert (tables, source) == (["people"], "classifier")
+    # "Ποιος είναι ο σκηνοθέτης...": the director rule, not the classifier
+    assert router.route("Ποιος είναι ο σκηνοθέτης του Ληρ;") == (
+        ["people", "play_summary", "plays"],
+        1.0,
+        "rules",
+    )
+
+
+def test_llm_fallback():
+    router = TableRouter()
+    assert router.route("Ποιος είναι ο Σαίξπηρ;") == (None, 0.0, "llm")
+
+
+# a play or media rule, and a person without a role: actor or director?
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Βρες μου παραστάσεις με την Κατίνα Παξινού",
+        "Παραστάσεις του Μινωτή",
+        "Βρες μου υλικό για τον Μινωτή",
+    ],
+)
+def test_person_without_role(question):
+    assert TableRouter().route(question) == (None, 0.0, "llm")
+    router = TableRouter(min_confidence=0.5, min_examples=1)
+    router.fit([question], [{"actors", "people", "plays"}])
+    tables, _, source = router.route(question)
+    assert source == "classifier"
+    assert {"actors", "people", "plays"} <= set(tables)
+
+
+@pytest.mark.parametrize(
+    "question, tables",
+    [
+        (
+            "Σε ποιες παραστάσεις έπαιξε η Παξινού;",
+            ["actors", "people", "play_summary", "plays"],
+        ),
+        ("ψάχνω τις περιοδείες του ΕΘ στο εξωτερικό.", ["play_summary", "plays"]),
+        ("Παραστάσεις στην Επίδαυρο", ["play_summary", "plays"]),
+    ],
+)
+def test_rules_without_unresolved_person(question, tables):
+    assert TableRouter().route(question) == (tables, 1.0, "rules")